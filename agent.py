@@ -1,4 +1,6 @@
 from dotenv import load_dotenv
+#Load the .env first so the tool modules see their settings when they are imported
+load_dotenv()
 from livekit import agents
 from livekit.agents import AgentSession, Agent, RoomInputOptions, ChatContext, ChatMessage
 from livekit.plugins import (
@@ -6,75 +8,205 @@ from livekit.plugins import (
 )
 from livekit.plugins import google
 from prompts import AGENT_INSTRUCTION, SESSION_INSTRUCTION
-from tools import (
-    get_weather, 
-    search_web, 
-    send_email,
-    read_messages,
-    search_gmail,
-    create_google_calendar_event,
-    view_google_calendar,
-    delete_google_calendar_event,
-    search_google_calendar_events,
-    list_google_calendars
-)
-load_dotenv()
-from mem0 import MemoryClient
+from session_data import SessionData
+from outbox import get_outbox
+from memory import get_backend, get_user_memory, UserMemory
+from tool_specs import compact_instructions, compile_tools
+from tool_registry import PREWARM_TOOLS, get_registry
+from worker_load import clear_report, report_tool_calls, worker_options
+from video_input import VIDEO_INPUT, encode_options, make_video_sampler
+from typing import Optional
+import asyncio
 import json
-import sounddevice as sd
+import logging
+import os
+import sys
+import http_client
+import instrumentation
+
+#Get the audio device it will use, only needed when running in the console
+def get_audio_device():
+    try:
+        import sounddevice as sd
+        default_input = sd.default.device[0]
+        print(f"Using audio input device: {default_input}")
+    except:
+        default_input = 0
+        print(f"Using fallback audio device: {default_input}")
+    return default_input
+
+#Keep references to background tasks so they are not garbage collected mid-run
+_background_tasks = set()
+
+def run_in_background(coro):
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
 
-#Get the audio device it will use
-try:
-    default_input = sd.default.device[0]
-    print(f"Using audio input device: {default_input}")
-except:
-    default_input = 0
-    print(f"Using fallback audio device: {default_input}")
+#City get_weather uses when none is named, the job metadata can give each user their own
+HOME_CITY = os.getenv("HOME_CITY")
+
+#Tool groups a session gets when its job metadata does not list them, all of them if not set
+DEFAULT_TOOL_GROUPS = [group.strip() for group in os.getenv("TOOL_GROUPS", "").split(",") if group.strip()] or None
+
+#The outbox only needs Gmail when it sends, so the Gmail tools are imported then
+def get_gmail_service(user_id: Optional[str] = None):
+    from tools import get_gmail_service
+    return get_gmail_service(user_id)
+
+#Longest the user's memories are waited for, they load while the session starts
+MEMORY_LOAD_TIMEOUT = float(os.getenv("MEMORY_LOAD_TIMEOUT", "3"))
+#How long the greeting waits for them, if they come later the agent gets them then
+MEMORY_GREETING_WAIT = float(os.getenv("MEMORY_GREETING_WAIT", "0.3"))
+#How many memories are given to the agent when the session starts
+SESSION_MEMORIES = 10
 
 #Defining the AI agent
 class Assistant(Agent):
-    def __init__(self, user_id: str) -> None:
+    def __init__(self, user_id: str, tools: list, memory: Optional[UserMemory] = None, chat_ctx: Optional[ChatContext] = None) -> None:
         super().__init__(
             #The AI instructions and voice setting
-            instructions=AGENT_INSTRUCTION,
+            instructions=compact_instructions(AGENT_INSTRUCTION),
+            chat_ctx=chat_ctx,
             llm=google.beta.realtime.RealtimeModel(
                 voice="Aoede",
                 temperature=0.8,
+                #Camera frames are scaled down before they are sent, a smaller frame costs fewer tokens
+                image_encode_options=encode_options(),
             ),
-            #Tools list
-            tools=[
-                get_weather,
-                search_web,
-                send_email,
-                read_messages,
-                search_gmail,
-                create_google_calendar_event,
-                view_google_calendar,
-                delete_google_calendar_event,
-                search_google_calendar_events,
-                list_google_calendars
-            ],
+            #Only the tools this session needs, with their declarations shortened
+            tools=compile_tools(tools),
         )
         self.user_id = user_id
+        self.memory = memory
+
+    #Remind the agent of what it knows about the user that relates to what they just said, then save what they said
+    async def on_user_turn_completed(self, turn_ctx: ChatContext, new_message: ChatMessage) -> None:
+        text = new_message.text_content
+        if self.memory is None or not text:
+            return
+        #Recall only searches the local index so it does not slow the reply down
+        recalled = self.memory.recall(text)
+        if recalled:
+            turn_ctx.add_message(
+                role="system",
+                content="Things I remember about the user that may be relevant: " + "; ".join(recalled),
+            )
+        run_in_background(self.memory.remember(text))
+
+#Load the user's memories and get the newest, none if that fails or takes too long
+async def load_memories(memory: UserMemory) -> list:
+    try:
+        await asyncio.wait_for(memory.load(), MEMORY_LOAD_TIMEOUT)
+    except Exception as e:
+        logging.warning(f"Could not load memories for {memory.user_id}: {e}")
+        return []
+    return memory.index.latest(SESSION_MEMORIES)
+
+#Give the agent the user's memories once they have loaded, as context rather than something it said
+async def give_memories(agent: Agent, loading: asyncio.Task) -> None:
+    latest = await loading
+    if not latest:
+        return
+    chat_ctx = agent.chat_ctx.copy()
+    chat_ctx.add_message(
+        role="system",
+        content="Things I remember about the user from earlier conversations: " + "; ".join(latest),
+    )
+    await agent.update_chat_ctx(chat_ctx)
+
+#Load what every job shares once per process, before the process is given a job, so a new room does not wait for it
+def prewarm(proc: agents.JobProcess):
+    proc.userdata["noise_cancellation"] = noise_cancellation.BVC()
+    #The user is not known yet, so the modules of the default groups' tools and the heavy libraries they list are imported
+    if PREWARM_TOOLS:
+        get_registry().prewarm_now(DEFAULT_TOOL_GROUPS)
+    #The mem0 client is made once and reused by every job of the process
+    try:
+        backend = get_backend()
+        if backend is not None:
+            backend.connect()
+    except Exception as e:
+        logging.warning(f"Could not prewarm the memory backend: {e}")
 
 #Connect to Live Kit servers to either access in a playground or the console
 async def entrypoint(ctx: agents.JobContext):
     metadata = json.loads(ctx.job.metadata) if ctx.job.metadata else {}
     user_id = metadata.get("user_id", ctx.room.name)
+    #The job can ask for only some groups of tools, such as ["email", "calendar"]
+    tool_groups = metadata.get("tools", DEFAULT_TOOL_GROUPS)
+
+    #Close pooled tool connections when the job ends
+    ctx.add_shutdown_callback(http_client.close)
+
+    #Tell the worker how many tool calls this job has running, it counts them in its load
+    run_in_background(report_tool_calls())
+    async def stop_reporting():
+        clear_report()
+    ctx.add_shutdown_callback(stop_reporting)
+
+    #Expose tool latency metrics on /metrics and/or dump them to a file when the job ends
+    if os.getenv("METRICS_PORT"):
+        instrumentation.start_metrics_server(int(os.getenv("METRICS_PORT")))
+    if os.getenv("METRICS_DIR"):
+        async def dump_metrics():
+            instrumentation.dump_metrics(os.getenv("METRICS_DIR"))
+        ctx.add_shutdown_callback(dump_metrics)
 
-    session = AgentSession()
+    #Camera frames only go to the model after the user mentions something visual, unless VIDEO_INPUT is on
+    video = make_video_sampler()
+    session_options = {"video_sampler": video} if video is not None else {}
+
+    #Tools read the user from here to pick that user's Google credentials
+    session_data = SessionData(user_id=user_id, home_city=metadata.get("home_city", HOME_CITY), video=video)
+    session = AgentSession(userdata=session_data, **session_options)
+    if video is not None:
+        #Interim transcripts turn video on while the user is still speaking, so a frame is there for the reply
+        session.on("user_input_transcribed", lambda event: video.notice(event.transcript))
+        async def log_video():
+            logging.info(f"Video frames: {video.report()}")
+        ctx.add_shutdown_callback(log_video)
+
+    #Tools are offered only for the Google accounts the user has connected, and imported when first called
+    registry = get_registry()
+    session_data.groups = registry.enabled_groups(user_id, tool_groups)
+    memory = get_user_memory(user_id)
+    agent = Assistant(user_id=user_id, tools=registry.session_tools(user_id, tool_groups), memory=memory)
+    #The memories load while the session starts instead of holding it up
+    loading = run_in_background(load_memories(memory)) if memory is not None else None
 
     await session.start(
         room=ctx.room,
-        agent=Assistant(user_id=user_id),
+        agent=agent,
         room_input_options=RoomInputOptions(
             #Turn video on for the live kit playground if it is used
-            video_enabled=True,
-            noise_cancellation=noise_cancellation.BVC(),
+            video_enabled=VIDEO_INPUT != "off",
+            noise_cancellation=ctx.proc.userdata.get("noise_cancellation") or noise_cancellation.BVC(),
         ),
     )
 
     await ctx.connect()
+    remembering = run_in_background(give_memories(agent, loading)) if loading is not None else None
+    #Ask for the camera's lowest layer while the model is not looking at it
+    if video is not None:
+        video.watch(ctx.room)
+
+    #Load the session's tools and their heavy libraries in the background while the greeting plays
+    if PREWARM_TOOLS:
+        run_in_background(registry.prewarm(registry.enabled(user_id, tool_groups)))
+    #At the same time fetch what the first question usually needs, today's events, new email and the weather at home
+    run_in_background(registry.prefetch(session_data, tool_groups))
+
+    #Start sending queued emails, including any an earlier job left behind, and give them a moment to go out when the job ends
+    outbox = get_outbox(get_gmail_service)
+    async def flush_outbox():
+        await outbox.flush(timeout=10)
+    ctx.add_shutdown_callback(flush_outbox)
+
+    #The greeting can use the memories if they are in by now
+    if remembering is not None:
+        await asyncio.wait({remembering}, timeout=MEMORY_GREETING_WAIT)
 
     #Give the instructions from prompts
     await session.generate_reply(
@@ -82,4 +214,7 @@ async def entrypoint(ctx: agents.JobContext):
     )
 #Initialise the room
 if __name__ == "__main__":
-    agents.cli.run_app(agents.WorkerOptions(entrypoint_fnc=entrypoint))
+    if "console" in sys.argv:
+        get_audio_device()
+    #The worker takes jobs until its load, from its jobs, CPU and tool calls in flight, reaches LOAD_THRESHOLD
+    agents.cli.run_app(agents.WorkerOptions(entrypoint_fnc=entrypoint, prewarm_fnc=prewarm, **worker_options()))
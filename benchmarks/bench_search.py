@@ -0,0 +1,131 @@
+"""
+A "what do I have about X?" turn against local fakes, answered step by step and with unified_search.
+
+  step-by-step  search_gmail, then search_google_calendar_events, then search_web,
+                with a model round trip before each call and one after the last
+  unified       one unified_search call between two model round trips
+Every query runs once with all backends at --latency-ms, and once more with the web
+search taking --slow-ms. In that second run unified_search answers at its deadline
+without the web. Caches are cleared before every turn. The model round trips are
+added as --model-ms each, not slept. For each mode it reports the turn time, the
+time spent in tools, the model round trips, the tokens of the tool answers and how
+many answers were partial.
+
+Usage:
+    python benchmarks/bench_search.py [--latency-ms 50] [--slow-ms 5000] [--model-ms 600]
+                                      [--queries 5] [--output bench_search.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_tools import call, install_fakes, percentile, stop_sync_loops  # noqa: E402
+from fakes import WORDS, FakeCalendar, FakeGmail, FakeSearch  # noqa: E402
+from tool_specs import estimate_tokens  # noqa: E402
+
+
+def queries(count: int) -> list:
+    return [f"what do I have about the {WORDS[i % len(WORDS)]} {WORDS[(i * 5 + 1) % len(WORDS)]}" for i in range(count)]
+
+
+def clear_caches() -> None:
+    from result_cache import get_cache
+    for name in ('messages', 'search'):
+        get_cache(name).clear()
+
+
+async def step_by_step(tools, web_tools, search_tools, query: str) -> tuple:
+    """The three searches one after another, as the model calls them. Returns (tool seconds, answers, model steps)."""
+    keywords = ' '.join(word for word in query.split() if word.lower() not in search_tools.STOPWORDS)
+    answers, seconds = [], 0.0
+    for tool, kwargs in [
+        (tools.search_gmail, {'search_query': keywords}),
+        (tools.search_google_calendar_events, {'search_term': keywords}),
+        (web_tools.search_web, {'query': keywords}),
+    ]:
+        seconds += await call(tool, kwargs, answers)
+    return seconds, answers, 4
+
+
+async def unified(tools, web_tools, search_tools, query: str) -> tuple:
+    answers = []
+    seconds = await call(search_tools.unified_search, {'query': query}, answers)
+    return seconds, answers, 2
+
+
+async def run(args) -> dict:
+    work_dir = tempfile.mkdtemp(prefix='bench_search_')
+    os.environ['GMAIL_MIRROR_FILE'] = os.path.join(work_dir, 'gmail_mirror.db')
+    os.environ.setdefault('TOOL_METRICS', 'low')
+    os.chdir(work_dir)
+
+    import search_tools
+    import tools
+    import web_tools
+
+    latency = args.latency_ms / 1000
+    search = FakeSearch(latency)
+    install_fakes(tools, web_tools, FakeGmail(args.mailbox, latency), FakeCalendar(args.events, latency), search)
+
+    results = []
+    for backends, web_latency in [('all fast', latency), ('slow web', args.slow_ms / 1000)]:
+        search.backend.latency = web_latency
+        for mode, turn in [('step-by-step', step_by_step), ('unified', unified)]:
+            tool_seconds, turn_seconds, tokens, partial = [], [], [], 0
+            for query in queries(args.queries):
+                clear_caches()
+                seconds, answers, model_steps = await turn(tools, web_tools, search_tools, query)
+                tool_seconds.append(seconds)
+                turn_seconds.append(seconds + model_steps * args.model_ms / 1000)
+                tokens.append(sum(estimate_tokens(answer) for answer in answers))
+                partial += any('did not answer in time' in answer for answer in answers)
+            results.append({
+                'backends': backends,
+                'mode': mode,
+                'model_round_trips': model_steps,
+                'turn_p50_ms': round(percentile(turn_seconds, 0.50) * 1000, 1),
+                'turn_p95_ms': round(percentile(turn_seconds, 0.95) * 1000, 1),
+                'tools_p50_ms': round(percentile(tool_seconds, 0.50) * 1000, 1),
+                'answer_tokens_p50': percentile(tokens, 0.50),
+                'partial_answers': partial,
+            })
+
+    await stop_sync_loops()
+    return {'config': vars(args), 'deadline_s': search_tools.SEARCH_DEADLINE, 'results': results}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--slow-ms', type=float, default=5000, help='latency of the web search in the slow run')
+    parser.add_argument('--model-ms', type=float, default=600, help='time of one model round trip between tool calls')
+    parser.add_argument('--mailbox', type=int, default=1000)
+    parser.add_argument('--events', type=int, default=500)
+    parser.add_argument('--queries', type=int, default=5)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+
+    print(f"{args.queries} queries, backends at {args.latency_ms:g} ms, model round trip {args.model_ms:g} ms, "
+          f"unified_search deadline {report['deadline_s']:g} s")
+    print(f"{'backends':<9} {'mode':<13} {'model trips':>11} {'turn p50':>10} {'turn p95':>10} {'tools p50':>10} {'tokens':>7} {'partial':>8}")
+    for result in report['results']:
+        print(f"{result['backends']:<9} {result['mode']:<13} {result['model_round_trips']:>11} {result['turn_p50_ms']:>8.0f}ms "
+              f"{result['turn_p95_ms']:>8.0f}ms {result['tools_p50_ms']:>8.0f}ms {result['answer_tokens_p50']:>7} "
+              f"{result['partial_answers']:>8}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Cold and warm latency of a Gmail tool call's Google API part, against a mocked HTTP transport.
+
+Each call gets the Gmail service and sends one messages.list request on the
+thread pool, the way the tools do. The transport is replaced by a stub that
+sleeps --latency-ms and answers with an empty list, so only the client side is
+measured: reading the token, parsing the discovery document and building the
+client and the request.
+
+  cold  the client cache is cleared before every call, as when each call
+        unpickled the token and called discovery.build again
+  warm  the cached client and the thread's connection are reused
+
+Usage:
+    python benchmarks/bench_services.py [--calls 50] [--latency-ms 0] [--output bench_services.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import pickle
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_tools import percentile  # noqa: E402
+
+
+def mock_transport(latency: float) -> None:
+    """Answer every request made through httplib2 with an empty message list after latency seconds."""
+    import httplib2
+
+    def request(self, uri, method='GET', body=None, headers=None, *args, **kwargs):
+        time.sleep(latency)
+        return httplib2.Response({'status': '200', 'content-type': 'application/json'}), b'{"messages": []}'
+
+    httplib2.Http.request = request
+
+
+def write_token(token_file: str, scopes: list) -> None:
+    """Save credentials that stay valid for the whole run, so no refresh is made."""
+    from google.oauth2.credentials import Credentials
+
+    creds = Credentials(
+        token='bench-token', refresh_token='bench-refresh', client_id='bench-client', client_secret='bench-secret',
+        token_uri='https://oauth2.googleapis.com/token', scopes=scopes,
+        expiry=datetime.utcnow() + timedelta(days=1),
+    )
+    with open(token_file, 'wb') as token:
+        pickle.dump(creds, token)
+
+
+async def tool_call(get_gmail_service) -> float:
+    from executor import AUTH_TIMEOUT, run_blocking
+
+    started = time.perf_counter()
+    service, error = await run_blocking('gmail', get_gmail_service, timeout=AUTH_TIMEOUT, upstream=False)
+    if error:
+        raise RuntimeError(error)
+    await run_blocking('gmail', lambda: service.users().messages().list(userId='me', maxResults=10).execute())
+    return time.perf_counter() - started
+
+
+async def run(args) -> dict:
+    work_dir = tempfile.mkdtemp(prefix='bench_services_')
+    os.chdir(work_dir)
+    os.environ.pop('CREDENTIAL_STORE_KEY', None)
+
+    import services
+    import tools
+
+    mock_transport(args.latency_ms / 1000)
+    write_token(tools.GMAIL_CREDENTIALS_FILE, tools.GMAIL_SCOPES)
+
+    results = {}
+    for mode in ('cold', 'warm'):
+        services.clear_cache()
+        if mode == 'warm':
+            await tool_call(tools.get_gmail_service)
+        seconds = []
+        for _ in range(args.calls):
+            if mode == 'cold':
+                services.clear_cache()
+            seconds.append(await tool_call(tools.get_gmail_service))
+        results[mode] = {
+            'p50_ms': round(percentile(seconds, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(seconds, 0.95) * 1000, 2),
+            'mean_ms': round(sum(seconds) / len(seconds) * 1000, 2),
+        }
+    return {'config': vars(args), 'results': results}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=50)
+    parser.add_argument('--latency-ms', type=float, default=0, help='time the mocked transport takes to answer')
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+
+    print(f"{args.calls} Gmail calls, transport latency {args.latency_ms:g} ms")
+    print(f"{'mode':<5} {'p50':>9} {'p95':>9} {'mean':>9}")
+    for mode, result in report['results'].items():
+        print(f"{mode:<5} {result['p50_ms']:>7.1f}ms {result['p95_ms']:>7.1f}ms {result['mean_ms']:>7.1f}ms")
+    cold, warm = report['results']['cold']['p50_ms'], report['results']['warm']['p50_ms']
+    print(f"Warm calls are {cold / warm:.0f}x faster at p50" if warm else "")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,328 @@
+"""
+End-to-end benchmark of every tool against local fake backends.
+
+Gmail and Calendar are replaced by in-process fakes, wttr.in by a local stub
+HTTP server and DuckDuckGo by a fake search tool, all with the same configurable
+latency per round trip. For each tool it measures the first (cold) call, then
+runs N concurrent simulated sessions and reports p50/p95/p99 latency, throughput,
+upstream round trips, the size of the answer the model reads and peak memory. Before that it times the first calls of a
+session after prefetch had its budget. Results are written as JSON so runs can be
+compared between commits. show_more_results and show_details act on a listing, so
+each of their calls runs in a session of its own after that listing. The listing is
+not timed, its round trips count towards the tool's.
+
+Usage:
+    python benchmarks/bench_tools.py [--latency-ms 50] [--mailbox 1000] [--events 500]
+                                     [--sessions 1,8,32] [--calls 10] [--prefetch-budget 5]
+                                     [--output bench_output.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Optional
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fakes import FakeCalendar, FakeGmail, FakeSearch, start_weather_stub  # noqa: E402
+from tool_specs import estimate_tokens  # noqa: E402
+
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class BenchContext:
+    """Stands in for a tool's RunContext, carrying a session's SessionData."""
+
+    def __init__(self, userdata):
+        self.userdata = userdata
+
+
+# Tools that act on the session's last listing, with the listing each call is made after
+LISTING_FIRST = {
+    'show_more_results': ('read_messages', {'query': '', 'max_results': 10}),
+    'show_details': ('search_gmail', {'search_query': 'acme contract', 'max_results': 10}),
+}
+# Events each call of the batch calendar tools creates or deletes
+BATCH_EVENTS = 5
+
+
+def find_tool(name: str, modules):
+    return next(getattr(module, name) for module in modules if hasattr(module, name))
+
+
+def scenarios():
+    """Each tool with the arguments one call uses. Functions so every call can vary its arguments."""
+    tomorrow = (datetime.utcnow() + timedelta(days=1)).strftime('%Y-%m-%d')
+    counter = iter(range(10 ** 9))
+
+    def new_events() -> list:
+        from tools import NewEvent
+        first = next(counter)
+        return [NewEvent(title=f"Bench batch {first} {i}", date=tomorrow, time=f"{9 + i:02d}:00", duration_minutes=30)
+                for i in range(BATCH_EVENTS)]
+
+    return {
+        'get_weather': lambda: {'city': 'London'},
+        'search_web': lambda: {'query': 'acme contract news'},
+        'read_messages': lambda: {'query': '', 'max_results': 10},
+        'search_gmail': lambda: {'search_query': 'acme contract', 'max_results': 10},
+        'send_email': lambda: {'to_email': 'bob@example.com', 'subject': 'Hello', 'message': 'Hi Bob'},
+        'view_google_calendar': lambda: {'date': None, 'days_ahead': 7, 'max_results': 10},
+        'search_google_calendar_events': lambda: {'search_term': 'standup', 'max_results': 10},
+        'list_google_calendars': lambda: {},
+        'find_free_slots': lambda: {'date': tomorrow, 'duration_minutes': 30, 'days': 3, 'attendees': 'bob@example.com'},
+        'create_google_calendar_event': lambda: {
+            'title': f"Bench {next(counter)}", 'date': tomorrow, 'time': '15:00', 'duration_minutes': 30},
+        'delete_google_calendar_event': None,   # filled in from the events the create scenario makes
+        'create_google_calendar_events': lambda: {'events': new_events()},
+        'delete_google_calendar_events': None,  # filled in the same way
+        'check_email_status': lambda: {},
+        'show_more_results': lambda: {'max_results': 10},
+        'show_details': lambda: {'number': 1},
+        'unified_search': lambda: {'query': 'what do I have about the acme contract'},
+    }
+
+
+def install_fakes(tools, web_tools, gmail: FakeGmail, calendar: FakeCalendar, search: FakeSearch) -> None:
+    tools.get_gmail_service = lambda user_id=None: (gmail, None)
+    tools.get_google_calendar_service = lambda user_id=None: (calendar, None)
+    web_tools._search_tool = search
+
+
+def session_start_scenarios(home_city: str) -> dict:
+    """
+    The calls a session usually starts with, which prefetch is meant to answer from
+    memory, and the backend each one calls.
+    """
+    return {
+        'view_google_calendar': ('calendar', {'date': datetime.now().strftime('%Y-%m-%d'), 'days_ahead': 1, 'max_results': 10}),
+        'read_messages': ('gmail', {'query': 'is:unread', 'max_results': 10}),
+        'get_weather': ('weather', {'city': home_city}),
+    }
+
+
+async def measure_session_start(args, tool_modules, backends) -> dict:
+    """
+    Let prefetch run for its budget, as a session does while the greeting plays, then time the first calls.
+
+    A first call that made no round trips to its backend was answered from memory.
+    Round trips of the sync loops a first call starts are counted with the backend, not the next call.
+    """
+    from session_data import SessionData
+    from tool_registry import ToolRegistry
+
+    # The fakes stand in for Google, the token files only need to exist for the Google tools to be offered
+    for token_file in ('gmail_token.pickle', 'calender_token.pickle'):
+        open(token_file, 'a').close()
+
+    report = {'prefetch_budget_s': args.prefetch_budget, 'first_calls': {}}
+    if args.prefetch_budget > 0:
+        session = SessionData(user_id='bench', home_city=args.home_city)
+        before = sum(backend.round_trips for backend in backends.values())
+        started = time.perf_counter()
+        report['prefetch'] = await ToolRegistry([ROOT], entry_point_group=None).prefetch(session, budget=args.prefetch_budget)
+        report['prefetch_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        report['prefetch_round_trips'] = sum(backend.round_trips for backend in backends.values()) - before
+
+    for name, (backend, kwargs) in session_start_scenarios(args.home_city).items():
+        tool = next(getattr(module, name) for module in tool_modules if hasattr(module, name))
+        before = backends[backend].round_trips
+        elapsed = await call(tool, kwargs)
+        report['first_calls'][name] = {
+            'ms': round(elapsed * 1000, 2),
+            'round_trips': backends[backend].round_trips - before,
+        }
+    return report
+
+
+async def call(tool, kwargs: dict, answers: Optional[list] = None, context: Optional[BenchContext] = None) -> float:
+    started = time.perf_counter()
+    result = await tool(context, **kwargs)
+    elapsed = time.perf_counter() - started
+    if not isinstance(result, str):
+        raise RuntimeError(f"{tool.__name__} returned {type(result).__name__}")
+    if answers is not None:
+        answers.append(result)
+    return elapsed
+
+
+async def stop_sync_loops() -> None:
+    """Cancel the mirror and calendar sync loops while the loop still runs, so none is left mid sync at exit."""
+    import calendar_store
+    import gmail_mirror
+
+    tasks = list(gmail_mirror._sync_tasks.values()) + list(calendar_store._sync_tasks.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def run(args) -> dict:
+    latency = args.latency_ms / 1000
+    weather_url, server, weather_backend = start_weather_stub(latency)
+
+    # Settings are read when the tool modules are imported
+    work_dir = tempfile.mkdtemp(prefix='bench_tools_')
+    os.environ['WEATHER_URL'] = weather_url
+    os.environ['GMAIL_MIRROR_FILE'] = os.path.join(work_dir, 'gmail_mirror.db')
+    os.environ.setdefault('TOOL_METRICS', 'low')
+    os.chdir(work_dir)
+
+    import search_tools
+    import tools
+    import web_tools
+    from session_data import SessionData
+
+    gmail = FakeGmail(args.mailbox, latency)
+    calendar = FakeCalendar(args.events, latency)
+    search = FakeSearch(latency)
+    install_fakes(tools, web_tools, gmail, calendar, search)
+    backends = {'gmail': gmail.backend, 'calendar': calendar.backend, 'search': search.backend, 'weather': weather_backend}
+
+    session_start = await measure_session_start(args, (tools, web_tools), backends)
+    prefetched = f"after {args.prefetch_budget:g}s prefetch" if args.prefetch_budget > 0 else "without prefetch"
+    print(f"First calls of a session, {prefetched}:")
+    for name, first in session_start['first_calls'].items():
+        print(f"  {name:30} {first['ms']:8.1f} ms   {first['round_trips']} round trips")
+    print()
+
+    plans = scenarios()
+    created = []
+    handed_out = set()   # ids already given to a delete call, so concurrent sessions never delete one twice
+
+    def event_to_delete() -> str:
+        event_id = created.pop() if created else next(e for e in calendar.event_ids() if e not in handed_out)
+        handed_out.add(event_id)
+        return event_id
+
+    def arguments(name: str) -> dict:
+        if name == 'delete_google_calendar_event':
+            return {'event_id': event_to_delete()}
+        if name == 'delete_google_calendar_events':
+            return {'event_ids': [event_to_delete() for _ in range(BATCH_EVENTS)]}
+        return plans[name]()
+
+    modules = (tools, web_tools, search_tools)
+
+    async def timed(name: str, answers: Optional[list] = None) -> float:
+        """One call of a tool, in a session of its own that made the listing first when the tool needs one."""
+        context = None
+        if name in LISTING_FIRST:
+            context = BenchContext(SessionData(user_id='bench'))
+            listing, kwargs = LISTING_FIRST[name]
+            await call(find_tool(listing, modules), kwargs, context=context)
+        return await call(find_tool(name, modules), arguments(name), answers, context=context)
+
+    def remember_created() -> None:
+        created.extend(event_id for event_id in calendar.event_ids()
+                       if event_id.startswith('n') and event_id not in created and event_id not in handed_out)
+
+    results = {}
+    tracemalloc.start()
+    for name in args.tools or plans:
+        before = {key: backend.round_trips for key, backend in backends.items()}
+
+        answers = []
+        cold = await timed(name, answers)
+        remember_created()
+        # The answer is input to the realtime model, its size adds to the time before it speaks
+        entry = {'cold_ms': round(cold * 1000, 2), 'answer_chars': len(answers[0]),
+                 'answer_tokens': estimate_tokens(answers[0]), 'sessions': {}}
+
+        for sessions in args.sessions:
+            latencies = []
+
+            async def session():
+                for _ in range(args.calls):
+                    latencies.append(await timed(name))
+                    remember_created()
+
+            started = time.perf_counter()
+            await asyncio.gather(*(session() for _ in range(sessions)))
+            wall = time.perf_counter() - started
+            entry['sessions'][str(sessions)] = {
+                'calls': len(latencies),
+                'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+                'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+                'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+                'throughput_per_s': round(len(latencies) / wall, 2),
+            }
+
+        total_calls = 1 + args.calls * sum(args.sessions)
+        entry['round_trips_per_call'] = round(sum(
+            backend.round_trips - before[key] for key, backend in backends.items()) / total_calls, 3)
+        results[name] = entry
+        print(f"{name:32} cold {entry['cold_ms']:8.1f} ms   answer {entry['answer_tokens']:4} tokens   " + '   '.join(
+            f"x{s}: p50 {r['p50_ms']:.1f} / p95 {r['p95_ms']:.1f} ms" for s, r in entry['sessions'].items()))
+
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    await stop_sync_loops()
+    server.shutdown()
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+
+    return {
+        'commit': commit,
+        'timestamp': datetime.utcnow().isoformat() + 'Z',
+        'config': {
+            'latency_ms': args.latency_ms,
+            'mailbox': args.mailbox,
+            'events': args.events,
+            'sessions': args.sessions,
+            'calls_per_session': args.calls,
+            'prefetch_budget_s': args.prefetch_budget,
+        },
+        'memory': {
+            'python_peak_mb': round(peak / 2 ** 20, 2),
+            'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2) if resource else None,
+        },
+        'backends': {key: backend.stats() for key, backend in backends.items()},
+        'session_start': session_start,
+        'tools': results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--mailbox', type=int, default=1000)
+    parser.add_argument('--events', type=int, default=500)
+    parser.add_argument('--sessions', type=lambda s: [int(n) for n in s.split(',')], default=[1, 8, 32])
+    parser.add_argument('--calls', type=int, default=10, help='calls per session')
+    parser.add_argument('--tools', type=lambda s: s.split(','), default=None, help='comma separated, default all')
+    parser.add_argument('--prefetch-budget', type=float, default=float(os.getenv('PREFETCH_BUDGET', '5')),
+                        help='seconds of prefetch before the first calls, 0 to measure them without')
+    parser.add_argument('--home-city', default='Paris')
+    parser.add_argument('--output', default=os.path.join(ROOT, 'bench_output.json'))
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
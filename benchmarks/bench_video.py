@@ -0,0 +1,224 @@
+"""
+Frames sent to the realtime model and the CPU they cost per session-minute, before and after adaptive video.
+
+A scripted session is replayed on a simulated clock: a camera sends frames of a
+mostly still picture, the user speaks a turn every few seconds, and a few turns
+ask about something the user holds up, which changes the picture. Each sampler
+sees every frame:
+  before      LiveKit's default, 1 frame a second while the user speaks, 0.3 otherwise, scaled to 1024
+  adaptive    video_input.AdaptiveVideo with the settings from the environment
+  no-dedupe   the same, but sending frames that look like the last one too
+For each it reports frames sent and the CPU of choosing them per minute, the
+tokens those frames add at 258 per 768x768 tile, and how long after a visual
+question the first frame was sent. With Pillow installed it also times scaling
+and JPEG encoding the sent frames, as the realtime plugin does.
+
+Usage:
+    python benchmarks/bench_video.py [--minutes 10] [--fps 15] [--width 1280] [--height 720]
+                                     [--visual-turns 3] [--output bench_video.json]
+"""
+import argparse
+import io
+import json
+import math
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import video_input  # noqa: E402
+
+I420 = 0
+# WebRTC decodes to I420, map it here so comparing frames does not need LiveKit
+video_input._layouts[I420] = video_input._SAMPLE_LAYOUT['I420']
+
+TOKENS_PER_TILE = 258
+TURN_SECONDS = 10     # a user turn starts every TURN_SECONDS
+SPEAKING_SECONDS = 4  # and lasts this long
+
+VOICE_TURNS = [
+    "what's on my calendar tomorrow",
+    "read me my unread emails",
+    "send an email to bob saying I'll be late",
+    "what's the weather like in Paris",
+    "find a free slot on Thursday afternoon",
+    "search the web for the acme contract news",
+]
+VISUAL_TURNS = [
+    "what am I holding right now",
+    "can you read what's on this label",
+    "look at this, what colour would you call it",
+]
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class DefaultSampler:
+    """LiveKit's VoiceActivityVideoSampler, on the simulated clock."""
+
+    def __init__(self, clock: Clock, speaking_fps: float = 1.0, silent_fps: float = 0.3):
+        self.clock = clock
+        self.speaking_fps = speaking_fps
+        self.silent_fps = silent_fps
+        self.speaking = False
+        self._last = None
+
+    def notice(self, text: str) -> bool:
+        return False
+
+    def __call__(self, frame, session=None) -> bool:
+        fps = self.speaking_fps if self.speaking else self.silent_fps
+        now = self.clock()
+        if self._last is None or now - self._last >= 1 / fps:
+            self._last = now
+            return True
+        return False
+
+
+def script(minutes: float, visual_turns: int) -> list:
+    """(start, transcript, visual) for every user turn, with the visual ones spread over the session."""
+    turns = int(minutes * 60 // TURN_SECONDS)
+    visual_at = {round((i + 1) * turns / (visual_turns + 1)) for i in range(visual_turns)}
+    return [
+        (turn * TURN_SECONDS,
+         VISUAL_TURNS[turn % len(VISUAL_TURNS)] if turn in visual_at else VOICE_TURNS[turn % len(VOICE_TURNS)],
+         turn in visual_at)
+        for turn in range(turns)
+    ]
+
+
+def scenes(count: int, width: int, height: int, variants: int = 8) -> list:
+    """Brightness planes of count different pictures, each in variants with camera noise."""
+    rng = np.random.default_rng(1)
+    pictures = []
+    for _ in range(count):
+        base = rng.integers(40, 200, size=(height // 40 + 1, width // 40 + 1)).astype(np.int16)
+        base = np.kron(base, np.ones((40, 40), dtype=np.int16))[:height, :width]
+        noisy = []
+        for _ in range(variants):
+            plane = np.clip(base + rng.integers(-3, 4, size=base.shape), 0, 255).astype(np.uint8)
+            chroma = np.full(((width + 1) // 2) * ((height + 1) // 2) * 2, 128, dtype=np.uint8)
+            noisy.append(plane.tobytes() + chroma.tobytes())
+        pictures.append(noisy)
+    return pictures
+
+
+def tokens(width: int, height: int, max_size: int) -> int:
+    """Tokens of one frame scaled to fit max_size, at 258 per 768x768 tile, or 258 when both sides are 384 or less."""
+    scale = min(1.0, max_size / max(width, height))
+    w, h = width * scale, height * scale
+    if w <= 384 and h <= 384:
+        return TOKENS_PER_TILE
+    return TOKENS_PER_TILE * math.ceil(w / 768) * math.ceil(h / 768)
+
+
+def encode(frame, max_size: int) -> None:
+    """Scale and JPEG encode a frame, as the realtime plugin does with each frame it sends."""
+    picture = Image.frombytes('L', (frame.width, frame.height), bytes(frame.data[:frame.width * frame.height]))
+    picture.thumbnail((max_size, max_size))
+    picture.convert('RGB').save(io.BytesIO(), format='JPEG', quality=video_input.JPEG_QUALITY)
+
+
+def replay(name: str, sampler, clock: Clock, args, pictures: list, turns: list, max_size: int) -> dict:
+    frame_count = int(args.minutes * 60 * args.fps)
+    picture, turn_index = 0, -1
+    sent, sample_cpu, encode_cpu = 0, 0.0, 0.0
+    waits = []
+    waiting_since = None
+    for n in range(frame_count):
+        clock.now = n / args.fps
+        # The user's turn, and the picture they hold up when they ask about it
+        if turn_index + 1 < len(turns) and clock.now >= turns[turn_index + 1][0]:
+            turn_index += 1
+            _, transcript, visual = turns[turn_index]
+            sampler.notice(transcript)
+            if visual:
+                picture = (picture + 1) % len(pictures)
+                waiting_since = clock.now
+        if hasattr(sampler, 'speaking'):
+            sampler.speaking = turn_index >= 0 and clock.now - turns[turn_index][0] < SPEAKING_SECONDS
+
+        frame = SimpleNamespace(type=I420, width=args.width, height=args.height, data=pictures[picture][n % len(pictures[picture])])
+        started = time.process_time()
+        send = sampler(frame)
+        sample_cpu += time.process_time() - started
+        if not send:
+            continue
+        sent += 1
+        if waiting_since is not None:
+            waits.append(clock.now - waiting_since)
+            waiting_since = None
+        if Image is not None:
+            started = time.process_time()
+            encode(frame, max_size)
+            encode_cpu += time.process_time() - started
+
+    minutes = args.minutes
+    return {
+        'sampler': name,
+        'max_size': max_size,
+        'frames_received_per_minute': round(frame_count / minutes, 1),
+        'frames_sent_per_minute': round(sent / minutes, 2),
+        'sampler_cpu_ms_per_minute': round(sample_cpu * 1000 / minutes, 2),
+        'encode_cpu_ms_per_minute': round(encode_cpu * 1000 / minutes, 2) if Image is not None else None,
+        'tokens_per_minute': round(sent * tokens(args.width, args.height, max_size) / minutes),
+        'seconds_to_first_frame_after_visual_question': [round(wait, 2) for wait in waits],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--minutes', type=float, default=10)
+    parser.add_argument('--fps', type=float, default=15, help='frames a second the camera sends')
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--visual-turns', type=int, default=3)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    turns = script(args.minutes, args.visual_turns)
+    pictures = scenes(len(VISUAL_TURNS) + 1, args.width, args.height)
+
+    results = []
+    clock = Clock()
+    results.append(replay('before', DefaultSampler(clock), clock, args, pictures, turns, max_size=1024))
+    clock = Clock()
+    results.append(replay('adaptive', video_input.AdaptiveVideo(clock=clock), clock, args, pictures, turns, video_input.MAX_SIZE))
+    clock = Clock()
+    results.append(replay('no-dedupe', video_input.AdaptiveVideo(threshold=0, clock=clock), clock, args, pictures, turns, video_input.MAX_SIZE))
+
+    print(f"{args.minutes:g} minute session, camera at {args.fps:g} fps {args.width}x{args.height}, "
+          f"{args.visual_turns} visual questions in {len(turns)} turns, per session-minute:")
+    print(f"{'sampler':<10} {'sent':>6} {'choose cpu':>11} {'encode cpu':>11} {'tokens':>7}   first frame after a visual question")
+    for result in results:
+        encode_cpu = f"{result['encode_cpu_ms_per_minute']:>9.1f}ms" if result['encode_cpu_ms_per_minute'] is not None else f"{'n/a':>11}"
+        waits = ', '.join(f"{wait:.2f}s" for wait in result['seconds_to_first_frame_after_visual_question']) or 'none'
+        print(f"{result['sampler']:<10} {result['frames_sent_per_minute']:>6.1f} {result['sampler_cpu_ms_per_minute']:>9.1f}ms "
+              f"{encode_cpu} {result['tokens_per_minute']:>7}   {waits}")
+    if Image is None:
+        print("\nInstall Pillow to also time scaling and encoding the frames that are sent")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'config': vars(args), 'results': results}, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,446 @@
+"""
+In-process fakes of the Gmail and Calendar API clients, and a local stub HTTP server for wttr.in.
+
+The fakes copy the parts of the googleapiclient resource interface the tools use.
+Every execute() sleeps for the configured latency to stand in for a network round
+trip, and counts the round trip and the JSON size of the response.
+"""
+import base64
+import copy
+import email
+import itertools
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+
+WORDS = ['acme', 'contract', 'invoice', 'meeting', 'lunch', 'report', 'budget', 'review', 'launch',
+         'travel', 'offer', 'design', 'standup', 'roadmap', 'hiring', 'quarterly', 'update', 'client']
+
+
+class Backend:
+    """Counts round trips and bytes for one fake API, and sleeps latency seconds per round trip."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.round_trips = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def respond(self, result):
+        time.sleep(self.latency)
+        with self._lock:
+            self.round_trips += 1
+            self.bytes += len(json.dumps(result))
+        return copy.deepcopy(result)
+
+    def stats(self) -> dict:
+        return {'round_trips': self.round_trips, 'bytes': self.bytes}
+
+
+class FakeRequest:
+    def __init__(self, backend: Backend, handler, **params):
+        self.backend = backend
+        self.handler = handler
+        self.params = params
+
+    def execute(self, *args, **kwargs):
+        return self.backend.respond(self.handler(**self.params))
+
+
+class FakeBatch:
+    """A batch request: every added request is answered in one round trip."""
+
+    def __init__(self, backend: Backend, callback):
+        self.backend = backend
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request: FakeRequest, request_id: str = None, callback=None):
+        self.requests.append((request_id or str(len(self.requests)), request, callback))
+
+    def execute(self, *args, **kwargs):
+        outcomes = []
+        for _, request, _ in self.requests:
+            try:
+                outcomes.append((request.handler(**request.params), None))
+            except Exception as e:
+                outcomes.append((None, e))
+        self.backend.respond([response for response, _ in outcomes])
+        for (request_id, _, callback), (response, exception) in zip(self.requests, outcomes):
+            (callback or self.callback)(request_id, copy.deepcopy(response), exception)
+
+
+class FakeGmail:
+    """
+    A mailbox of size generated messages, newest first.
+
+    receive(), delete() and add_label() change it the way mail arriving and the user
+    acting on it would, and record the change for history().list. expire_history()
+    makes every history ID given out so far too old, so history().list answers 404.
+    """
+
+    # Most history records in one history().list page
+    HISTORY_PAGE_SIZE = 2
+
+    def __init__(self, size: int = 1000, latency: float = 0.05, seed: int = 1):
+        rng = random.Random(seed)
+        self.backend = Backend(latency)
+        self.history_id = 1000
+        self.oldest_history_id = self.history_id
+        self.changes = []
+        now = datetime.utcnow()
+        self.mailbox = []
+        for i in range(size):
+            sent = now - timedelta(minutes=37 * i)
+            words = rng.sample(WORDS, 3)
+            self.mailbox.append({
+                'id': f"m{i:06d}",
+                'threadId': f"t{i:06d}",
+                'labelIds': ['INBOX'] + (['UNREAD'] if i % 4 == 0 else []),
+                'snippet': f"About the {words[1]} and the {words[2]} we discussed",
+                'internalDate': str(int(sent.timestamp() * 1000)),
+                'payload': {'headers': [
+                    {'name': 'Subject', 'value': f"{words[0].title()} {words[1]}"},
+                    {'name': 'From', 'value': f"{rng.choice(WORDS)}@example.com"},
+                    {'name': 'Date', 'value': sent.strftime('%a, %d %b %Y %H:%M:%S +0000')},
+                    {'name': 'To', 'value': 'me@example.com'},
+                ]},
+                'sizeEstimate': 20000,
+            })
+        self._by_id = {m['id']: m for m in self.mailbox}
+        self.sent = []
+
+    # googleapiclient-style accessors
+    def users(self):
+        return self
+
+    def messages(self):
+        return _Messages(self)
+
+    def history(self):
+        return _History(self)
+
+    def getProfile(self, userId='me'):
+        return FakeRequest(self.backend, lambda: {'emailAddress': 'me@example.com', 'historyId': str(self.history_id)})
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self.backend, callback)
+
+    # Mailbox changes
+    def _record(self, **change) -> None:
+        self.history_id += 1
+        self.changes.append({'id': str(self.history_id), **change})
+
+    def receive(self, subject: str, sender: str = 'someone@example.com', snippet: str = '') -> str:
+        """Add a new message to the top of the mailbox. Returns its ID."""
+        message_id = f"r{len(self.changes):06d}"
+        sent = datetime.utcnow()
+        message = {
+            'id': message_id,
+            'threadId': message_id,
+            'labelIds': ['INBOX', 'UNREAD'],
+            'snippet': snippet,
+            'internalDate': str(int(sent.timestamp() * 1000)),
+            'payload': {'headers': [
+                {'name': 'Subject', 'value': subject},
+                {'name': 'From', 'value': sender},
+                {'name': 'Date', 'value': sent.strftime('%a, %d %b %Y %H:%M:%S +0000')},
+                {'name': 'To', 'value': 'me@example.com'},
+            ]},
+            'sizeEstimate': 20000,
+        }
+        self.mailbox.insert(0, message)
+        self._by_id[message_id] = message
+        self._record(messagesAdded=[{'message': {'id': message_id, 'labelIds': message['labelIds']}}])
+        return message_id
+
+    def delete(self, message_id: str) -> None:
+        message = self._by_id.pop(message_id)
+        self.mailbox.remove(message)
+        self._record(messagesDeleted=[{'message': {'id': message_id}}])
+
+    def add_label(self, message_id: str, label: str) -> None:
+        self._by_id[message_id]['labelIds'].append(label)
+        self._record(labelsAdded=[{'message': {'id': message_id}, 'labelIds': [label]}])
+
+    def expire_history(self) -> None:
+        self.oldest_history_id = self.history_id + 1
+
+    # Handlers
+    def _matches(self, message: dict, q: str) -> bool:
+        if not q:
+            return True
+        text = ' '.join([self.body(message)] + [h['value'] for h in message['payload']['headers']]).lower()
+        words = [w for w in q.lower().split() if ':' not in w]
+        return all(w in text for w in words)
+
+    def _list(self, userId='me', q='', maxResults=100, pageToken=None, labelIds=None, **kwargs):
+        if q and q.startswith('rfc822msgid:'):
+            wanted = q.split(':', 1)[1]
+            return {'messages': [{'id': message_id} for message_id, header in self.sent if header == wanted]}
+        found = [m for m in self.mailbox if self._matches(m, q or '')]
+        start = int(pageToken or 0)
+        page = found[start:start + (maxResults or 100)]
+        result = {'messages': [{'id': m['id'], 'threadId': m['threadId']} for m in page],
+                  'resultSizeEstimate': len(found)}
+        if start + len(page) < len(found):
+            result['nextPageToken'] = str(start + len(page))
+        return result
+
+    def _get(self, userId='me', id=None, format='full', metadataHeaders=None, **kwargs):
+        message = self._by_id[id]
+        if format == 'metadata':
+            headers = [h for h in message['payload']['headers'] if not metadataHeaders or h['name'] in metadataHeaders]
+            return {**{k: v for k, v in message.items() if k != 'payload'}, 'payload': {'headers': headers}}
+        # A full message carries its body, which is what metadata requests avoid downloading
+        text = self.body(message).ljust(message['sizeEstimate'] * 3 // 4)
+        data = base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii')
+        return {**message, 'payload': {**message['payload'], 'mimeType': 'text/plain', 'body': {'data': data}}}
+
+    @staticmethod
+    def body(message: dict) -> str:
+        """The text of a message, with a reference number that is only in the body."""
+        return f"{message['snippet']}. Our reference is {message['id']}."
+
+
+    def _send(self, userId='me', body=None, **kwargs):
+        self.history_id += 1
+        message_id = f"s{len(self.sent):06d}"
+        header = email.message_from_bytes(base64.urlsafe_b64decode(body['raw']))['Message-ID']
+        self.sent.append((message_id, header))
+        return {'id': message_id, 'labelIds': ['SENT']}
+
+    def _history(self, userId='me', startHistoryId=None, pageToken=None, **kwargs):
+        if int(startHistoryId) < self.oldest_history_id:
+            import httplib2
+            from googleapiclient.errors import HttpError
+            raise HttpError(httplib2.Response({'status': 404}), b'{"error": {"code": 404}}')
+        records = [record for record in self.changes if int(record['id']) > int(startHistoryId)]
+        start = int(pageToken or 0)
+        page = records[start:start + self.HISTORY_PAGE_SIZE]
+        result = {'history': page, 'historyId': str(self.history_id)}
+        if start + len(page) < len(records):
+            result['nextPageToken'] = str(start + len(page))
+        return result
+
+
+class _Messages:
+    def __init__(self, gmail: FakeGmail):
+        self.gmail = gmail
+
+    def list(self, **params):
+        return FakeRequest(self.gmail.backend, self.gmail._list, **params)
+
+    def get(self, **params):
+        return FakeRequest(self.gmail.backend, self.gmail._get, **params)
+
+    def send(self, **params):
+        return FakeRequest(self.gmail.backend, self.gmail._send, **params)
+
+
+class _History:
+    def __init__(self, gmail: FakeGmail):
+        self.gmail = gmail
+
+    def list(self, **params):
+        return FakeRequest(self.gmail.backend, self.gmail._history, **params)
+
+
+class FakeCalendar:
+    """A calendar of size generated events spread over the 30 days before and 60 days after now."""
+
+    def __init__(self, size: int = 500, latency: float = 0.05, seed: int = 2):
+        rng = random.Random(seed)
+        self.backend = Backend(latency)
+        self.calendars = [{'id': 'primary', 'summary': 'Me', 'primary': True, 'accessRole': 'owner'}]
+        start = datetime.utcnow().replace(minute=0, second=0, microsecond=0) - timedelta(days=30)
+        self.by_id = {}
+        for i in range(size):
+            begins = start + timedelta(hours=rng.randrange(90 * 24))
+            words = rng.sample(WORDS, 2)
+            self.by_id[f"e{i:06d}"] = self._event(
+                f"e{i:06d}", f"{words[0].title()} {words[1]}", begins, 30 * rng.randint(1, 4),
+                description=f"Notes about the {words[1]}", location=rng.choice(['', 'Room 1', 'Acme HQ']),
+            )
+        self.changes = []
+        # Requests are handled on pool threads while a benchmark reads the events from the loop
+        self._lock = threading.Lock()
+
+    def event_ids(self) -> list:
+        """The IDs of the events now in the calendar, safe to read while requests are being handled."""
+        with self._lock:
+            return list(self.by_id)
+
+    @staticmethod
+    def _event(event_id, summary, begins, minutes, **extra) -> dict:
+        return {
+            'id': event_id,
+            'status': 'confirmed',
+            'summary': summary,
+            'start': {'dateTime': begins.isoformat() + 'Z'},
+            'end': {'dateTime': (begins + timedelta(minutes=minutes)).isoformat() + 'Z'},
+            **extra,
+        }
+
+    # googleapiclient-style accessors
+    def events(self):
+        return _Events(self)
+
+    def calendarList(self):
+        return _CalendarList(self)
+
+    def freebusy(self):
+        return _FreeBusy(self)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self.backend, callback)
+
+    # Handlers
+    def _list(self, calendarId='primary', timeMin=None, timeMax=None, q=None, maxResults=250,
+              pageToken=None, syncToken=None, **kwargs):
+        with self._lock:
+            changes, events = list(self.changes), list(self.by_id.values())
+        if syncToken is not None:
+            items = changes[int(syncToken):]
+        else:
+            items = sorted(events, key=lambda e: e['start']['dateTime'])
+            if timeMin:
+                items = [e for e in items if e['end']['dateTime'] > timeMin]
+            if timeMax:
+                items = [e for e in items if e['start']['dateTime'] < timeMax]
+            if q:
+                items = [e for e in items if q.lower() in ' '.join(
+                    e.get(k, '') for k in ('summary', 'description', 'location')).lower()]
+        start = int(pageToken or 0)
+        page = items[start:start + (maxResults or 250)]
+        result = {'items': page}
+        if start + len(page) < len(items):
+            result['nextPageToken'] = str(start + len(page))
+        else:
+            result['nextSyncToken'] = str(len(changes))
+        return result
+
+    def _insert(self, calendarId='primary', body=None, **kwargs):
+        with self._lock:
+            event_id = f"n{len(self.changes):06d}"
+            event = {'id': event_id, 'status': 'confirmed', **body}
+            self.by_id[event_id] = event
+            self.changes.append(event)
+        return event
+
+    def _get(self, calendarId='primary', eventId=None, **kwargs):
+        return self.by_id[eventId]
+
+    def _delete(self, calendarId='primary', eventId=None, **kwargs):
+        with self._lock:
+            event = self.by_id.pop(eventId)
+            self.changes.append({'id': event['id'], 'status': 'cancelled'})
+        return ''
+
+    def _calendar_list(self, **kwargs):
+        return {'items': self.calendars}
+
+    def _freebusy(self, body=None, **kwargs):
+        # Every calendar and attendee is given the busy times of the one generated calendar
+        time_min, time_max = body['timeMin'], body['timeMax']
+        as_utc = lambda value: datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+        with self._lock:
+            events = list(self.by_id.values())
+        busy = [{'start': e['start']['dateTime'], 'end': e['end']['dateTime']} for e in events
+                if as_utc(e['end']['dateTime']) > as_utc(time_min) and as_utc(e['start']['dateTime']) < as_utc(time_max)]
+        return {'calendars': {item['id']: {'busy': busy} for item in body['items']}}
+
+
+class _Events:
+    def __init__(self, calendar: FakeCalendar):
+        self.calendar = calendar
+
+    def list(self, **params):
+        return FakeRequest(self.calendar.backend, self.calendar._list, **params)
+
+    def insert(self, **params):
+        return FakeRequest(self.calendar.backend, self.calendar._insert, **params)
+
+    def get(self, **params):
+        return FakeRequest(self.calendar.backend, self.calendar._get, **params)
+
+    def delete(self, **params):
+        return FakeRequest(self.calendar.backend, self.calendar._delete, **params)
+
+
+class _CalendarList:
+    def __init__(self, calendar: FakeCalendar):
+        self.calendar = calendar
+
+    def list(self, **params):
+        return FakeRequest(self.calendar.backend, self.calendar._calendar_list, **params)
+
+
+class _FreeBusy:
+    def __init__(self, calendar: FakeCalendar):
+        self.calendar = calendar
+
+    def query(self, **params):
+        return FakeRequest(self.calendar.backend, self.calendar._freebusy, **params)
+
+
+class FakeSearch:
+    """Stands in for DuckDuckGoSearchRun."""
+
+    def __init__(self, latency: float = 0.3):
+        self.backend = Backend(latency)
+
+    def run(self, tool_input: str = '', **kwargs) -> str:
+        return self.backend.respond(f"Results for {tool_input}: " + ' '.join(WORDS * 10))
+
+
+class FakeTokenEndpoint:
+    """
+    Stands in for the google.auth transport request used to refresh tokens.
+
+    Every refresh sleeps latency seconds and hands out a new access token, token-1, token-2 and so on.
+    """
+
+    class Response:
+        def __init__(self, status: int, data: bytes):
+            self.status = status
+            self.headers = {'content-type': 'application/json'}
+            self.data = data
+
+    def __init__(self, latency: float = 0.05):
+        self.backend = Backend(latency)
+        self._numbers = itertools.count(1)
+
+    def __call__(self, url, method='GET', body=None, headers=None, **kwargs):
+        number = next(self._numbers)
+        result = self.backend.respond({'access_token': f"token-{number}", 'expires_in': 3600, 'token_type': 'Bearer'})
+        return self.Response(200, json.dumps(result).encode('utf-8'))
+
+
+def start_weather_stub(latency: float = 0.05):
+    """Serve wttr.in-style one-line weather on a free local port. Returns (base_url, server, backend)."""
+    backend = Backend(latency)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            city = unquote(urlparse(self.path).path.strip('/')) or 'Nowhere'
+            body = backend.respond(f"{city}: ⛅️  +12°C\n").encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}", server, backend
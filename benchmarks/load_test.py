@@ -0,0 +1,208 @@
+"""
+Find how many jobs one host serves before they start to suffer, without a LiveKit server.
+
+Each simulated job is its own process, as LiveKit runs them, that:
+  - handles an audio frame every 20 ms, spending --frame-cpu-ms of CPU on it the way
+    noise cancellation and resampling do, and records how late each frame started
+  - calls a tool against the local fakes every --tool-interval seconds
+  - reports its tool calls in flight to the worker the way a real job does
+The number of jobs is raised step by step. Each step reports the late frames, the
+tool latency, the CPU each job used and the load worker_load gives LiveKit. The
+host is saturated at the first step where more than --max-late of the frames are
+late or the p95 tool latency goes over --max-tool-ms, and the step before is the
+MAX_JOBS to use.
+
+Usage:
+    python benchmarks/load_test.py [--jobs 1,2,4,8,16,32] [--duration 20] [--frame-cpu-ms 2]
+                                   [--tool-interval 5] [--latency-ms 50] [--output load_test.json]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import worker_load  # noqa: E402
+from bench_tools import call, install_fakes, percentile, scenarios, stop_sync_loops  # noqa: E402
+from fakes import FakeCalendar, FakeGmail, FakeSearch, start_weather_stub  # noqa: E402
+
+FRAME_SECONDS = 0.02
+
+
+def busy(seconds: float) -> None:
+    """Use the CPU for seconds, as processing an audio frame does."""
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+async def simulate(args, tools, web_tools) -> dict:
+    """Run one job's audio frames and tool calls for args.duration seconds."""
+    loop = asyncio.get_running_loop()
+    stop_at = loop.time() + args.duration
+    lags, tool_seconds, errors = [], [], []
+    plans = scenarios()
+
+    async def frames():
+        due = loop.time()
+        while due < stop_at:
+            lags.append(max(0.0, loop.time() - due))
+            busy(args.frame_cpu_ms / 1000)
+            due += FRAME_SECONDS
+            await asyncio.sleep(max(0.0, due - loop.time()))
+
+    async def tool_calls():
+        # Jobs start their calls at different moments, like users who do not all speak at once
+        await asyncio.sleep(random.uniform(0, args.tool_interval))
+        for name in itertools.cycle(args.tools):
+            if loop.time() >= stop_at:
+                return
+            tool = getattr(tools, name, None) or getattr(web_tools, name)
+            try:
+                tool_seconds.append(await call(tool, plans[name]()))
+            except Exception as e:
+                errors.append(f"{name}: {e}")
+            await asyncio.sleep(args.tool_interval)
+
+    reporter = asyncio.create_task(worker_load.report_tool_calls())
+    started = time.process_time()
+    try:
+        await asyncio.gather(frames(), tool_calls())
+    finally:
+        reporter.cancel()
+        worker_load.clear_report()
+        await stop_sync_loops()
+    return {
+        'lags': lags,
+        'tool_seconds': tool_seconds,
+        'errors': errors,
+        'cpu_seconds': time.process_time() - started,
+    }
+
+
+def job(args, ready, start, results) -> None:
+    """One simulated job process: set up the tools against fakes, wait for the others, then run."""
+    latency = args.latency_ms / 1000
+    weather_url, server, _ = start_weather_stub(latency)
+    work_dir = tempfile.mkdtemp(prefix='load_test_')
+    os.environ['WEATHER_URL'] = weather_url
+    os.environ['GMAIL_MIRROR_FILE'] = os.path.join(work_dir, 'gmail_mirror.db')
+    os.chdir(work_dir)
+
+    import tools
+    import web_tools
+    install_fakes(tools, web_tools, FakeGmail(args.mailbox, latency), FakeCalendar(args.events, latency), FakeSearch(latency))
+
+    ready.put(os.getpid())
+    start.wait()
+    try:
+        results.put(asyncio.run(simulate(args, tools, web_tools)))
+    finally:
+        server.shutdown()
+
+
+def run_step(args, jobs: int) -> dict:
+    """Run jobs simulated jobs at once and sum up how they did."""
+    context = multiprocessing.get_context('spawn')
+    ready, results, start = context.Queue(), context.Queue(), context.Event()
+    processes = [context.Process(target=job, args=(args, ready, start, results), daemon=True) for _ in range(jobs)]
+    for process in processes:
+        process.start()
+    for _ in processes:
+        ready.get(timeout=120)
+
+    start.set()
+    worker_load.cpu_load()   # the CPU use from here on
+    loads, cpus = [], []
+    outcomes = []
+    deadline = time.monotonic() + args.duration + 60
+    while len(outcomes) < jobs and time.monotonic() < deadline:
+        try:
+            outcomes.append(results.get(timeout=0.5))
+        except queue.Empty:
+            loads.append(worker_load.load(jobs))
+            cpus.append(worker_load.cpu_load())
+    for process in processes:
+        process.join(timeout=10)
+        if process.is_alive():
+            process.terminate()
+
+    lags = [lag for outcome in outcomes for lag in outcome['lags']]
+    tool_seconds = [seconds for outcome in outcomes for seconds in outcome['tool_seconds']]
+    return {
+        'jobs': jobs,
+        'finished': len(outcomes),
+        'frames': len(lags),
+        'late_frames': sum(lag > FRAME_SECONDS for lag in lags) / len(lags) if lags else 1.0,
+        'frame_lag_p95_ms': round(percentile(lags, 0.95) * 1000, 2),
+        'tool_calls': len(tool_seconds),
+        'tool_p50_ms': round(percentile(tool_seconds, 0.50) * 1000, 2),
+        'tool_p95_ms': round(percentile(tool_seconds, 0.95) * 1000, 2),
+        'tool_errors': sum(len(outcome['errors']) for outcome in outcomes),
+        'cpu_per_job': round(sum(outcome['cpu_seconds'] for outcome in outcomes) / max(1, len(outcomes)) / args.duration, 3),
+        'host_cpu': round(max(cpus, default=0.0), 3),
+        'load_mean': round(sum(loads) / len(loads), 3) if loads else 0.0,
+        'load_max': round(max(loads, default=0.0), 3),
+    }
+
+
+def saturated(args, step: dict) -> bool:
+    return (step['finished'] < step['jobs'] or step['late_frames'] > args.max_late
+            or step['tool_p95_ms'] > args.max_tool_ms)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--jobs', type=lambda s: [int(n) for n in s.split(',')], default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument('--duration', type=float, default=20, help='seconds each step runs')
+    parser.add_argument('--frame-cpu-ms', type=float, default=2, help='CPU one 20 ms audio frame takes')
+    parser.add_argument('--tool-interval', type=float, default=5, help='seconds between the tool calls of a job')
+    parser.add_argument('--tools', type=lambda s: s.split(','), default=['get_weather', 'read_messages', 'view_google_calendar', 'search_gmail'])
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--mailbox', type=int, default=200)
+    parser.add_argument('--events', type=int, default=100)
+    parser.add_argument('--max-late', type=float, default=0.05, help='share of frames that may start a frame late')
+    parser.add_argument('--max-tool-ms', type=float, default=1000, help='p95 tool latency the jobs may reach')
+    parser.add_argument('--all', action='store_true', help='run every step, not only up to saturation')
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    print(f"{'jobs':>4} {'late frames':>11} {'lag p95':>9} {'tool p95':>9} {'cpu/job':>8} {'host cpu':>8} {'load':>6}")
+    steps, fits, saturated_at = [], None, None
+    for jobs in args.jobs:
+        step = run_step(args, jobs)
+        steps.append(step)
+        print(f"{jobs:>4} {step['late_frames']:>11.1%} {step['frame_lag_p95_ms']:>7.1f}ms {step['tool_p95_ms']:>7.1f}ms "
+              f"{step['cpu_per_job']:>8.0%} {step['host_cpu']:>8.0%} {step['load_max']:>6.2f}")
+        if saturated(args, step):
+            if saturated_at is None:
+                saturated_at = jobs
+                print(f"Saturated at {jobs} jobs")
+            if not args.all:
+                break
+        elif saturated_at is None:
+            fits = jobs
+
+    print()
+    if fits:
+        print(f"Suggested setting: MAX_JOBS={fits}")
+    else:
+        print("Even one job does not keep up, lower --frame-cpu-ms or use a bigger host")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'config': vars(args), 'steps': steps, 'max_jobs': fits}, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Measure how long importing the agent takes, using python -X importtime.
+
+Fails (exit code 1) when the cumulative import time of the module goes over the
+budget, so a new eager import of a heavy library shows up as a regression.
+
+Usage:
+    python benchmarks/startup.py [--module agent] [--budget-ms 1500] [--runs 3] [--top 10]
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Lines look like: "import time:       123 |       4567 | package.module"
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def measure(module: str) -> dict:
+    """Import module in a fresh interpreter and return the cumulative import time of each module in microseconds."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        sys.exit(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    times = {}
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            times[match.group(4)] = int(match.group(2))
+    return times
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', default='agent')
+    parser.add_argument('--budget-ms', type=float, default=float(os.getenv('STARTUP_BUDGET_MS', '1500')))
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    # Take the best run so disk cache warmup does not count against the budget
+    runs = [measure(args.module) for _ in range(args.runs)]
+    best = min(runs, key=lambda times: times.get(args.module, 0))
+    total_ms = best.get(args.module, 0) / 1000
+
+    print(f"Import of {args.module}: {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    print("\nSlowest packages:")
+    top_level = {name: us for name, us in best.items() if '.' not in name and name != args.module}
+    for name, us in sorted(top_level.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+
+    if total_ms > args.budget_ms:
+        print(f"\nOver budget by {total_ms - args.budget_ms:.1f} ms")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Estimate the input tokens each tool configuration sends the realtime model, offline.
+
+For every tool as written, every tool compacted and each group of tools compacted
+it reports the tokens of the instructions and of the tool declarations, and how
+long compiling the declarations for a session takes the first time and once they
+are cached.
+
+Usage:
+    python benchmarks/tool_tokens.py [--output tool_tokens.json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import tool_specs  # noqa: E402
+from prompts import AGENT_INSTRUCTION  # noqa: E402
+from tool_registry import ToolRegistry  # noqa: E402
+
+
+def all_tools(registry: ToolRegistry) -> list:
+    return [entry.load_now() for entry in registry.discover().values()]
+
+
+def compile_times(tool_list: list, repeats: int = 100) -> dict:
+    """Milliseconds to compile every tool the first time, then on average once cached."""
+    tool_specs._compiled.clear()
+    started = time.perf_counter()
+    tool_specs.compile_tools(tool_list, compact=True)
+    cold = time.perf_counter() - started
+    started = time.perf_counter()
+    for _ in range(repeats):
+        tool_specs.compile_tools(tool_list, compact=True)
+    cached = (time.perf_counter() - started) / repeats
+    return {'cold_ms': cold * 1000, 'cached_ms': cached * 1000}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    registry = ToolRegistry([ROOT])
+    tool_list = all_tools(registry)
+    report = tool_specs.token_report(tool_list, AGENT_INSTRUCTION, registry.groups())
+    full = report['full']['total_tokens']
+
+    print(f"{'configuration':<20} {'tools':>5} {'instructions':>12} {'declarations':>12} {'total':>7} {'saved':>6}")
+    for name, counts in report.items():
+        saved = 1 - counts['total_tokens'] / full if full else 0.0
+        print(f"{name:<20} {counts['tools']:>5} {counts['instruction_tokens']:>12} "
+              f"{counts['tool_tokens']:>12} {counts['total_tokens']:>7} {saved:>6.0%}")
+
+    times = compile_times(tool_list)
+    print(f"\nCompiling declarations: {times['cold_ms']:.2f} ms first session, {times['cached_ms']:.4f} ms after")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'tokens': report, 'compile': times}, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,292 @@
+import asyncio
+import bisect
+import heapq
+import itertools
+import logging
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional
+
+from googleapiclient.errors import HttpError
+
+from executor import run_blocking
+
+# Event store configuration
+SYNC_INTERVAL = int(os.getenv("CALENDAR_SYNC_INTERVAL", "60"))
+PAST_DAYS = 30
+# Events further ahead than this are not kept, a recurring event with no end would otherwise expand forever
+FUTURE_DAYS = int(os.getenv("CALENDAR_FUTURE_DAYS", "365"))
+# An event from Google does not say which calendar it is in, so the calendar it was read from is noted under this key
+CALENDAR_KEY = 'calendarId'
+
+
+def event_time(value: dict) -> float:
+    """Turn an event start or end into a UTC timestamp, treating all-day dates as midnight UTC."""
+    if 'dateTime' in value:
+        return datetime.fromisoformat(value['dateTime'].replace('Z', '+00:00')).timestamp()
+    return datetime.fromisoformat(value['date']).replace(tzinfo=timezone.utc).timestamp()
+
+
+def merge_events(event_lists: List[List[dict]]) -> Iterator[dict]:
+    """
+    Merge lists of events that are each ordered by start time into one ordered stream.
+
+    An event shared between calendars shows up in each of them with the same iCalUID,
+    so only its first copy is kept. Instances of a recurring event share the iCalUID
+    too, which is why the start time is part of the key.
+    """
+    seen = set()
+    for event in heapq.merge(*event_lists, key=lambda e: event_time(e['start'])):
+        key = (event.get('iCalUID', event['id']), event_time(event['start']))
+        if key not in seen:
+            seen.add(key)
+            yield event
+
+
+class CalendarStore:
+    """
+    An in-memory copy of one calendar's events, kept current with syncToken incremental syncs.
+
+    Events are indexed by start time so range queries only look at events that can
+    overlap the range. Syncs run on the tool thread pool while reads run on the event loop.
+    """
+
+    def __init__(self, calendar_id: str, user_id: Optional[str] = None):
+        self.calendar_id = calendar_id
+        self.user_id = user_id
+        self.sync_token = None
+        self.since = self.until = 0.0   # the timestamps the store holds the events between
+        self._lock = threading.Lock()
+        self._events: Dict[str, dict] = {}
+        self._index: List[tuple] = []   # sorted (start, end, id)
+        self._max_duration = 0.0
+
+    @property
+    def ready(self) -> bool:
+        return self.sync_token is not None
+
+    def covers(self, start: datetime, end: datetime) -> bool:
+        """Whether the store holds every event between start and end. Naive datetimes are UTC."""
+        if start.tzinfo is None:
+            start = start.replace(tzinfo=timezone.utc)
+        if end.tzinfo is None:
+            end = end.replace(tzinfo=timezone.utc)
+        return self.ready and self.since <= start.timestamp() and end.timestamp() <= self.until
+
+    # Index maintenance, callers hold the lock
+
+    def _unindex(self, event_id: str) -> None:
+        event = self._events.pop(event_id, None)
+        if event is None:
+            return
+        key = (event_time(event['start']), event_time(event['end']), event_id)
+        i = bisect.bisect_left(self._index, key)
+        if i < len(self._index) and self._index[i] == key:
+            del self._index[i]
+
+    def _put(self, event: dict) -> None:
+        self._unindex(event['id'])
+        if event.get('status') == 'cancelled' or 'start' not in event:
+            return
+        if self.until and event_time(event['start']) >= self.until:
+            # Past the window, such as a later instance of an event that repeats forever
+            return
+        event[CALENDAR_KEY] = self.calendar_id
+        start, end = event_time(event['start']), event_time(event['end'])
+        self._events[event['id']] = event
+        bisect.insort(self._index, (start, end, event['id']))
+        self._max_duration = max(self._max_duration, end - start)
+
+    # Writes
+
+    def put(self, event: dict) -> None:
+        """Add or replace an event, for example right after creating it."""
+        with self._lock:
+            self._put(event)
+
+    def remove(self, event_id: str) -> None:
+        """Drop an event, for example right after deleting it."""
+        with self._lock:
+            self._unindex(event_id)
+
+    def _list_all(self, service, **params) -> tuple:
+        items, page_token = [], None
+        while True:
+            result = service.events().list(
+                calendarId=self.calendar_id,
+                singleEvents=True,
+                maxResults=2500,
+                pageToken=page_token,
+                **params
+            ).execute()
+            items += result.get('items', [])
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                return items, result.get('nextSyncToken')
+
+    def full_sync(self, service) -> int:
+        """Reload every event from PAST_DAYS ago to FUTURE_DAYS ahead. Returns how many events are stored."""
+        now = datetime.now(timezone.utc)
+        since, until = now - timedelta(days=PAST_DAYS), now + timedelta(days=FUTURE_DAYS)
+        items, sync_token = self._list_all(service, timeMin=since.isoformat(), timeMax=until.isoformat())
+        with self._lock:
+            self._events.clear()
+            self._index.clear()
+            self._max_duration = 0.0
+            self.since, self.until = since.timestamp(), until.timestamp()
+            for event in items:
+                self._put(event)
+            self.sync_token = sync_token
+        logging.info(f"Calendar store for {self.calendar_id} fully synced with {len(self._events)} events")
+        return len(self._events)
+
+    def incremental_sync(self, service) -> int:
+        """Apply every change since the last sync. Returns how many events changed."""
+        items, sync_token = self._list_all(service, syncToken=self.sync_token)
+        with self._lock:
+            for event in items:
+                self._put(event)
+            self.sync_token = sync_token
+        return len(items)
+
+    def sync(self, service) -> int:
+        """Bring the store up to date, running a full sync when the sync token has expired."""
+        if not self.ready:
+            return self.full_sync(service)
+        try:
+            return self.incremental_sync(service)
+        except HttpError as e:
+            if e.resp.status != 410:
+                raise
+            logging.info(f"Calendar sync token for {self.calendar_id} expired, running a full sync")
+            return self.full_sync(service)
+
+    # Reads
+
+    def get(self, event_id: str) -> Optional[dict]:
+        return self._events.get(event_id)
+
+    def between(self, start: datetime, end: datetime, max_results: int = 10, offset: int = 0) -> List[dict]:
+        """Get the events that overlap [start, end), ordered by start time, skipping the first offset. Naive datetimes are UTC."""
+        if start.tzinfo is None:
+            start = start.replace(tzinfo=timezone.utc)
+        if end.tzinfo is None:
+            end = end.replace(tzinfo=timezone.utc)
+        start_ts, end_ts = start.timestamp(), end.timestamp()
+
+        found = []
+        with self._lock:
+            # Nothing starting earlier than the longest event can still be running at start
+            i = bisect.bisect_left(self._index, (start_ts - self._max_duration,))
+            stop = bisect.bisect_left(self._index, (end_ts,))
+            for event_start, event_end, event_id in self._index[i:stop]:
+                if event_end > start_ts or event_start >= start_ts:
+                    if offset > 0:
+                        offset -= 1
+                        continue
+                    found.append(self._events[event_id])
+                    if len(found) >= max_results:
+                        break
+        return found
+
+    def search(self, term: str, max_results: int = 10, offset: int = 0) -> List[dict]:
+        """Find events whose title, description or location contain term, ordered by start time, skipping the first offset."""
+        term = term.lower()
+        found = []
+        with self._lock:
+            for _, _, event_id in self._index:
+                event = self._events[event_id]
+                text = ' '.join(event.get(key, '') for key in ('summary', 'description', 'location'))
+                if term in text.lower():
+                    if offset > 0:
+                        offset -= 1
+                        continue
+                    found.append(event)
+                    if len(found) >= max_results:
+                        break
+        return found
+
+    # Background sync
+
+    async def run_sync_loop(self, get_service, interval: int = SYNC_INTERVAL) -> None:
+        """Keep the store fresh forever. get_service(user_id) returns (service, error) like get_google_calendar_service."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                service, error = await run_blocking('calendar', get_service, self.user_id)
+                if error:
+                    logging.warning(f"Calendar sync skipped: {error}")
+                else:
+                    await run_blocking('calendar', self.sync, service, timeout=120)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Calendar sync for {self.calendar_id} failed: {e}")
+
+
+_stores: Dict[tuple, CalendarStore] = {}
+_sync_tasks: Dict[tuple, asyncio.Task] = {}
+_first_syncs: Dict[tuple, asyncio.Task] = {}
+
+
+def find_calendar_store(calendar_id: str, user_id: Optional[str] = None) -> Optional[CalendarStore]:
+    """Get the store for a user's calendar if one has been loaded, without syncing anything."""
+    return _stores.get((user_id, calendar_id))
+
+
+def events_between(stores: List[CalendarStore], start: datetime, end: datetime, max_results: int = 10, offset: int = 0) -> List[dict]:
+    """Like CalendarStore.between, over several calendars merged by start time with shared events listed once."""
+    if len(stores) == 1:
+        return stores[0].between(start, end, max_results, offset)
+    # Each calendar can only supply events from its own first offset + max_results
+    lists = [store.between(start, end, offset + max_results) for store in stores]
+    return list(itertools.islice(merge_events(lists), offset, offset + max_results))
+
+
+def search_events(stores: List[CalendarStore], term: str, max_results: int = 10, offset: int = 0) -> List[dict]:
+    """Like CalendarStore.search, over several calendars merged by start time with shared events listed once."""
+    if len(stores) == 1:
+        return stores[0].search(term, max_results, offset)
+    lists = [store.search(term, offset + max_results) for store in stores]
+    return list(itertools.islice(merge_events(lists), offset, offset + max_results))
+
+
+async def get_calendar_store(calendar_id: str, service, get_service, user_id: Optional[str] = None) -> CalendarStore:
+    """
+    Get the store for a user's calendar, syncing it the first time and then keeping it fresh in the background.
+
+    A user_id of None means the shared account from the token file. Callers that
+    need the store while its first sync runs, such as the prefetch and the first
+    tool call, wait for that one sync.
+    """
+    key = (user_id, calendar_id)
+    store = _stores.get(key)
+    if store is None:
+        store = _stores[key] = CalendarStore(calendar_id, user_id)
+    if not store.ready:
+        task = _first_syncs.get(key)
+        if task is None:
+            task = _first_syncs[key] = asyncio.get_running_loop().create_task(
+                run_blocking('calendar', store.sync, service, timeout=120))
+
+            def on_done(done: asyncio.Task) -> None:
+                _first_syncs.pop(key, None)
+                if not done.cancelled():
+                    done.exception()   # the callers waiting are given it, nobody else needs to
+
+            task.add_done_callback(on_done)
+        # Shielded so one caller being cancelled does not cancel the sync for everyone else
+        await asyncio.shield(task)
+
+    task = _sync_tasks.get(key)
+    if task is None or task.done():
+        _sync_tasks[key] = asyncio.get_running_loop().create_task(store.run_sync_loop(get_service))
+    return store
+
+
+async def get_calendar_stores(calendar_ids: List[str], service, get_service, user_id: Optional[str] = None) -> List[CalendarStore]:
+    """Get the stores for several of a user's calendars, syncing the ones not loaded yet at the same time."""
+    return list(await asyncio.gather(*(
+        get_calendar_store(calendar_id, service, get_service, user_id) for calendar_id in calendar_ids
+    )))
@@ -0,0 +1,177 @@
+"""
+Per-user Google credentials, so one worker can serve many users.
+
+Credentials are kept on disk encrypted with Fernet (from the cryptography package)
+using the key in CREDENTIAL_STORE_KEY, one file per user and API. Decrypted
+credentials are kept in a small in-memory LRU so repeated tool calls do not touch
+the disk, and each user's token is refreshed once however many sessions need it.
+
+When CREDENTIAL_STORE_KEY is not set the store is off and every session uses the
+single gmail_token.pickle / calender_token.pickle files as before. When it is set
+those files are not used, and a user without stored credentials gets no Google tools.
+
+To add a user, run the OAuth login for them:
+    python credential_store.py add <user_id> gmail
+    python credential_store.py add <user_id> calendar
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from executor import get_executor
+from token_refresh import atomic_write, coordinator
+
+# Credential store configuration
+STORE_DIR = os.getenv("CREDENTIAL_STORE_DIR", "credentials")
+STORE_KEY = os.getenv("CREDENTIAL_STORE_KEY")
+MAX_CACHED = int(os.getenv("CREDENTIAL_CACHE_SIZE", "256"))
+
+# Scopes requested for each API when adding a user
+SCOPES = {
+    'gmail': ['https://www.googleapis.com/auth/gmail.send', 'https://www.googleapis.com/auth/gmail.readonly'],
+    'calendar': ['https://www.googleapis.com/auth/calendar'],
+}
+
+
+class CredentialStore:
+    """
+    An encrypted on-disk store of Google credentials keyed by (user_id, api), with an in-memory LRU in front.
+
+    Args:
+        directory: Where the encrypted credential files live
+        key: Fernet key used to encrypt them
+        max_cached: How many decrypted credentials to keep in memory
+    """
+
+    def __init__(self, directory: str, key: str, max_cached: int = MAX_CACHED):
+        from cryptography.fernet import Fernet
+
+        self.directory = directory
+        self.max_cached = max_cached
+        self._fernet = Fernet(key.encode('utf-8') if isinstance(key, str) else key)
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[tuple, object]" = OrderedDict()
+        self._loading: Dict[tuple, threading.Lock] = {}   # (user_id, api) -> lock held while its file is decrypted
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, user_id: str, api: str) -> str:
+        # Hash the user ID so it is safe to use as a file name
+        name = hashlib.sha256(user_id.encode('utf-8')).hexdigest()[:32]
+        return os.path.join(self.directory, f"{name}.{api}.enc")
+
+    def _remember(self, key: tuple, creds) -> None:
+        with self._lock:
+            self._cache[key] = creds
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+
+    def has(self, user_id: str, api: str) -> bool:
+        return (user_id, api) in self._cache or os.path.exists(self._path(user_id, api))
+
+    def peek(self, user_id: str, api: str):
+        """Get the credentials already in memory, or None, without touching the disk."""
+        return self._cache.get((user_id, api))
+
+    def load(self, user_id: str, api: str):
+        """
+        Get a user's credentials from memory, or decrypt them from disk. Returns None if there are none.
+
+        Sessions of one user that start together decrypt the file once and share the result.
+        """
+        key = (user_id, api)
+        with self._lock:
+            creds = self._cache.get(key)
+            if creds is not None:
+                self._cache.move_to_end(key)
+                return creds
+            loading = self._loading.setdefault(key, threading.Lock())
+
+        with loading:
+            creds = self.peek(user_id, api)
+            if creds is None:
+                creds = self._read(self._path(user_id, api))
+                if creds is not None:
+                    self._remember(key, creds)
+        with self._lock:
+            self._loading.pop(key, None)
+        return creds
+
+    def _read(self, path: str):
+        if not os.path.exists(path):
+            return None
+
+        from google.oauth2.credentials import Credentials
+
+        with open(path, 'rb') as f:
+            info = json.loads(self._fernet.decrypt(f.read()))
+        return Credentials.from_authorized_user_info(info)
+
+    def save(self, user_id: str, api: str, creds) -> None:
+        """Encrypt a user's credentials to disk, replacing the old file in one step so readers never see half of it."""
+        atomic_write(self._path(user_id, api), self._fernet.encrypt(creds.to_json().encode('utf-8')))
+        self._remember((user_id, api), creds)
+
+    def get_valid(self, user_id: str, api: str):
+        """
+        Get a user's credentials, refreshing them if they have expired or will soon.
+
+        Refreshes go through the refresh coordinator, so when many sessions for the
+        same user need one at once only the first refreshes and the rest reuse it.
+        Tokens that are still valid but close to expiry are refreshed in the background.
+        """
+        creds = self.load(user_id, api)
+        if creds is None:
+            return None
+
+        path = self._path(user_id, api)
+        read_saved = lambda: self._read(path)
+        save = lambda fresh: self.save(user_id, api, fresh)
+
+        if creds.valid:
+            coordinator.refresh_soon(get_executor(), path, creds, read_saved, save,
+                                     on_done=lambda fresh: self._remember((user_id, api), fresh))
+            return creds
+        if not creds.refresh_token:
+            return None
+
+        fresh = coordinator.refresh(path, creds, read_saved, save)
+        self._remember((user_id, api), fresh)
+        return fresh
+
+
+_store = None
+
+
+def get_credential_store() -> Optional[CredentialStore]:
+    """Get the shared credential store, or None when CREDENTIAL_STORE_KEY is not set."""
+    global _store
+    if _store is None and STORE_KEY:
+        _store = CredentialStore(STORE_DIR, STORE_KEY)
+    return _store
+
+
+def _add_user(user_id: str, api: str) -> None:
+    from google_auth_oauthlib.flow import InstalledAppFlow
+
+    store = get_credential_store()
+    if store is None:
+        sys.exit("Set CREDENTIAL_STORE_KEY first, for example to the output of: "
+                 "python -c \"from cryptography.fernet import Fernet; print(Fernet.generate_key().decode())\"")
+    flow = InstalledAppFlow.from_client_secrets_file('credentials.json', SCOPES[api])
+    store.save(user_id, api, flow.run_local_server(port=0))
+    print(f"Saved {api} credentials for {user_id}")
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    STORE_KEY = os.getenv("CREDENTIAL_STORE_KEY")
+    if len(sys.argv) != 4 or sys.argv[1] != 'add' or sys.argv[3] not in SCOPES:
+        sys.exit("Usage: python credential_store.py add <user_id> gmail|calendar")
+    _add_user(sys.argv[2], sys.argv[3])
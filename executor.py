@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentation import record_upstream
+
+# Thread pool configuration
+MAX_WORKERS = int(os.getenv("TOOL_MAX_WORKERS", "16"))
+DEFAULT_TIMEOUT = float(os.getenv("TOOL_TIMEOUT", "20"))
+# Getting a service can open the one-time OAuth login page, so give it longer
+AUTH_TIMEOUT = 300
+
+# How many blocking calls each upstream service may have in flight at once
+SERVICE_LIMITS = {
+    'gmail': 4,
+    'calendar': 4,
+    'search': 2,
+    'memory': 2,
+}
+
+# Per-service timeouts in seconds, anything not listed uses DEFAULT_TIMEOUT
+SERVICE_TIMEOUTS = {
+    'search': 15,
+}
+
+_executor = None
+_semaphores = {}
+
+
+class ToolTimeoutError(TimeoutError):
+    """Raised when a blocking tool call takes longer than its timeout."""
+
+    def __init__(self, service: str, timeout: float):
+        super().__init__(f"{service} did not respond within {timeout:g} seconds")
+        self.service = service
+        self.timeout = timeout
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Get the shared thread pool that all blocking tool work runs on."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="tool")
+    return _executor
+
+
+def _get_semaphore(service: str) -> asyncio.Semaphore:
+    semaphore = _semaphores.get(service)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(SERVICE_LIMITS.get(service, MAX_WORKERS))
+        _semaphores[service] = semaphore
+    return semaphore
+
+
+def _release(loop: asyncio.AbstractEventLoop, semaphore: asyncio.Semaphore) -> None:
+    try:
+        loop.call_soon_threadsafe(semaphore.release)
+    except RuntimeError:
+        # The loop has closed, nothing waits on the semaphore any more
+        pass
+
+
+async def run_blocking(service: str, func, *args, timeout: float = None, upstream: bool = True, **kwargs):
+    """
+    Run a blocking call on the shared thread pool so the event loop keeps serving audio.
+
+    The call waits for a free slot in the service's concurrency limit first. If the
+    calling task is cancelled (for example when the user barges in) the call is
+    dropped from the queue, or its result discarded if it has already started.
+    A call that has started keeps its slot until its thread returns, also after a
+    timeout, so calls that hang cannot take more of the pool than their limit.
+
+    Args:
+        service: Name of the upstream service, used for the concurrency limit and timeout
+        func: The blocking callable to run
+        timeout: Seconds to wait before giving up (default: the service's timeout)
+        upstream: Whether to count the call as an upstream request in the tool metrics
+    """
+    if timeout is None:
+        timeout = SERVICE_TIMEOUTS.get(service, DEFAULT_TIMEOUT)
+
+    loop = asyncio.get_running_loop()
+    queued = time.perf_counter()
+    started = []
+
+    def timed():
+        started.append(time.perf_counter())
+        return func(*args, **kwargs)
+
+    semaphore = _get_semaphore(service)
+    try:
+        await semaphore.acquire()
+        try:
+            work = get_executor().submit(timed)
+        except BaseException:
+            semaphore.release()
+            raise
+        # Released when the thread is done, or when the work is dropped before it started
+        work.add_done_callback(lambda _: _release(loop, semaphore))
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(work, loop=loop), timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"{service} call timed out after {timeout:g} seconds")
+            raise ToolTimeoutError(service, timeout) from None
+    finally:
+        if upstream:
+            record_upstream((started[0] if started else time.perf_counter()) - queued)
+
+
+def shutdown(wait: bool = False) -> None:
+    """Stop the shared thread pool, cancelling any queued work."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=wait, cancel_futures=True)
+        _executor = None
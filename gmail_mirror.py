@@ -0,0 +1,332 @@
+import asyncio
+import base64
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+from googleapiclient.errors import HttpError
+
+from executor import run_blocking
+
+# Local mailbox mirror configuration
+MIRROR_FILE = os.getenv("GMAIL_MIRROR_FILE", "gmail_mirror.db")
+SYNC_INTERVAL = int(os.getenv("GMAIL_SYNC_INTERVAL", "60"))
+INITIAL_SYNC_MESSAGES = 500
+
+# Headers read from each message, and how many messages go in one batch request
+MESSAGE_HEADERS = ['Subject', 'From', 'Date']
+GMAIL_BATCH_SIZE = 50
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT PRIMARY KEY,
+    thread_id TEXT,
+    subject TEXT,
+    sender TEXT,
+    date TEXT,
+    snippet TEXT,
+    internal_date INTEGER,
+    labels TEXT
+);
+CREATE INDEX IF NOT EXISTS messages_by_date ON messages (internal_date DESC);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5 (
+    id UNINDEXED, subject, sender, date, snippet, body
+);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def fetch_message_metadata(service, message_ids: List[str], with_body: bool = False) -> Dict[str, dict]:
+    """
+    Get the metadata (headers, snippet, labels and date) for many messages using Gmail batch requests.
+
+    with_body fetches the full messages instead, bodies included, for the mirror to index.
+    Returns a dict of message ID to message resource, leaving out any that failed.
+    """
+    messages = {}
+
+    def on_response(request_id, response, exception):
+        if exception is not None:
+            logging.warning(f"Failed to fetch Gmail message {request_id}: {exception}")
+            return
+        messages[request_id] = response
+
+    for start in range(0, len(message_ids), GMAIL_BATCH_SIZE):
+        batch = service.new_batch_http_request(callback=on_response)
+        for message_id in message_ids[start:start + GMAIL_BATCH_SIZE]:
+            if with_body:
+                request = service.users().messages().get(userId='me', id=message_id, format='full')
+            else:
+                request = service.users().messages().get(
+                    userId='me',
+                    id=message_id,
+                    format='metadata',
+                    metadataHeaders=MESSAGE_HEADERS
+                )
+            batch.add(request, request_id=message_id)
+        batch.execute()
+
+    return messages
+
+
+def _header(headers: list, name: str, default: str) -> str:
+    return next((h['value'] for h in headers if h['name'] == name), default)
+
+
+def _body_text(payload: dict) -> str:
+    # The plain text parts of a message, or its HTML parts without the tags when it has no plain text
+    texts = {'text/plain': [], 'text/html': []}
+    parts = [payload]
+    while parts:
+        part = parts.pop(0)
+        parts += part.get('parts', [])
+        data = part.get('body', {}).get('data')
+        if data and part.get('mimeType') in texts:
+            raw = base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+            texts[part['mimeType']].append(raw.decode('utf-8', errors='replace'))
+    if texts['text/plain']:
+        return '\n'.join(texts['text/plain'])
+    return re.sub(r'<[^>]*>', ' ', '\n'.join(texts['text/html']))
+
+
+def _fts_query(text: str) -> Optional[str]:
+    # Every word has to match, and the last one can be a prefix
+    words = re.findall(r'\w+', text)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+class GmailMirror:
+    """
+    An on-disk copy of the mailbox headers with a full-text index over them and the message bodies.
+
+    Writes come from sync(), which runs on the tool thread pool, while reads run
+    directly on the event loop through their own connection.
+    """
+
+    def __init__(self, path: str = MIRROR_FILE, user_id: Optional[str] = None):
+        self.path = path
+        self.user_id = user_id
+        self._write_lock = threading.Lock()
+        self._writer = sqlite3.connect(path, check_same_thread=False)
+        if path != ':memory:':
+            self._writer.execute('PRAGMA journal_mode=WAL')
+        self._writer.executescript(_SCHEMA)
+        if 'body' not in [column[1] for column in self._writer.execute('PRAGMA table_info(messages_fts)')]:
+            # A mirror from before bodies were indexed, the next sync fills it again from scratch
+            self._writer.execute('DROP TABLE messages_fts')
+            self._writer.execute("DELETE FROM state WHERE key = 'history_id'")
+            self._writer.executescript(_SCHEMA)
+        self._writer.commit()
+        self._reader = self._writer if path == ':memory:' else sqlite3.connect(path, check_same_thread=False)
+
+    def close(self) -> None:
+        if self._reader is not self._writer:
+            self._reader.close()
+        self._writer.close()
+
+    # State
+
+    def _get_state(self, key: str) -> Optional[str]:
+        row = self._reader.execute('SELECT value FROM state WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, key: str, value: str) -> None:
+        self._writer.execute('INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)', (key, value))
+
+    @property
+    def history_id(self) -> Optional[str]:
+        return self._get_state('history_id')
+
+    @property
+    def ready(self) -> bool:
+        """Whether a full sync has completed so reads can be answered locally."""
+        return self.history_id is not None
+
+    # Writes
+
+    def _store(self, messages: List[dict]) -> None:
+        for msg in messages:
+            headers = msg.get('payload', {}).get('headers', [])
+            row = (
+                msg['id'],
+                msg.get('threadId'),
+                _header(headers, 'Subject', 'No Subject'),
+                _header(headers, 'From', 'Unknown Sender'),
+                _header(headers, 'Date', 'Unknown Date'),
+                msg.get('snippet', ''),
+                int(msg.get('internalDate', 0)),
+                ','.join(msg.get('labelIds', [])),
+            )
+            self._writer.execute('DELETE FROM messages_fts WHERE id = ?', (msg['id'],))
+            self._writer.execute('INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?, ?, ?, ?)', row)
+            self._writer.execute(
+                'INSERT INTO messages_fts (id, subject, sender, date, snippet, body) VALUES (?, ?, ?, ?, ?, ?)',
+                (row[0], row[2], row[3], row[4], row[5], _body_text(msg.get('payload', {})))
+            )
+
+    def _remove(self, message_ids: List[str]) -> None:
+        for message_id in message_ids:
+            self._writer.execute('DELETE FROM messages WHERE id = ?', (message_id,))
+            self._writer.execute('DELETE FROM messages_fts WHERE id = ?', (message_id,))
+
+    def full_sync(self, service) -> int:
+        """Replace the mirror with the newest messages in the mailbox. Returns how many were stored."""
+        history_id = service.users().getProfile(userId='me').execute()['historyId']
+
+        message_ids = []
+        page_token = None
+        while len(message_ids) < INITIAL_SYNC_MESSAGES:
+            result = service.users().messages().list(
+                userId='me',
+                maxResults=min(500, INITIAL_SYNC_MESSAGES - len(message_ids)),
+                pageToken=page_token
+            ).execute()
+            message_ids += [m['id'] for m in result.get('messages', [])]
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                break
+
+        messages = fetch_message_metadata(service, message_ids, with_body=True)
+        with self._write_lock:
+            self._writer.execute('DELETE FROM messages')
+            self._writer.execute('DELETE FROM messages_fts')
+            self._store(list(messages.values()))
+            self._set_state('history_id', str(history_id))
+            self._writer.commit()
+
+        logging.info(f"Gmail mirror fully synced with {len(messages)} messages")
+        return len(messages)
+
+    def incremental_sync(self, service) -> int:
+        """Apply every mailbox change since the stored historyId. Returns how many messages changed."""
+        added, removed = set(), set()
+        history_id = self.history_id
+        page_token = None
+        while True:
+            result = service.users().history().list(
+                userId='me',
+                startHistoryId=history_id,
+                historyTypes=['messageAdded', 'messageDeleted', 'labelAdded', 'labelRemoved'],
+                pageToken=page_token
+            ).execute()
+            for record in result.get('history', []):
+                for key in ('messagesAdded', 'labelsAdded', 'labelsRemoved'):
+                    for change in record.get(key, []):
+                        added.add(change['message']['id'])
+                        removed.discard(change['message']['id'])
+                for change in record.get('messagesDeleted', []):
+                    removed.add(change['message']['id'])
+                    added.discard(change['message']['id'])
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                break
+
+        messages = fetch_message_metadata(service, sorted(added), with_body=True) if added else {}
+        with self._write_lock:
+            self._remove(sorted(removed))
+            self._store(list(messages.values()))
+            self._set_state('history_id', str(result.get('historyId', history_id)))
+            self._writer.commit()
+
+        return len(added) + len(removed)
+
+    def sync(self, service) -> int:
+        """Bring the mirror up to date, falling back to a full sync when the history is too old."""
+        if not self.ready:
+            return self.full_sync(service)
+        try:
+            return self.incremental_sync(service)
+        except HttpError as e:
+            if e.resp.status != 404:
+                raise
+            logging.info("Gmail history expired, running a full mirror sync")
+            return self.full_sync(service)
+
+    # Reads
+
+    def _rows(self, sql: str, params: tuple) -> List[dict]:
+        cursor = self._reader.execute(sql, params)
+        columns = [c[0] for c in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def recent(self, max_results: int = 10, offset: int = 0) -> List[dict]:
+        """Get the newest messages after the first offset, leaving out spam and trash like the Gmail API does."""
+        return self._rows(
+            "SELECT id, subject, sender, date, snippet FROM messages "
+            "WHERE ',' || labels || ',' NOT LIKE '%,SPAM,%' AND ',' || labels || ',' NOT LIKE '%,TRASH,%' "
+            "ORDER BY internal_date DESC LIMIT ? OFFSET ?",
+            (max_results, offset)
+        )
+
+    def search(self, text: str, max_results: int = 10, offset: int = 0) -> List[dict]:
+        """Find messages whose headers, snippet or body contain every word in text, skipping the first offset."""
+        query = _fts_query(text)
+        if query is None:
+            return []
+        return self._rows(
+            "SELECT m.id, m.subject, m.sender, m.date, m.snippet FROM messages_fts f "
+            "JOIN messages m ON m.id = f.id WHERE messages_fts MATCH ? "
+            "ORDER BY m.internal_date DESC LIMIT ? OFFSET ?",
+            (query, max_results, offset)
+        )
+
+    # Background sync
+
+    async def run_sync_loop(self, get_service, interval: int = SYNC_INTERVAL) -> None:
+        """Keep the mirror fresh forever. get_service(user_id) returns (service, error) like get_gmail_service."""
+        while True:
+            try:
+                service, error = await run_blocking('gmail', get_service, self.user_id)
+                if error:
+                    logging.warning(f"Gmail mirror sync skipped: {error}")
+                else:
+                    await run_blocking('gmail', self.sync, service, timeout=120)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Gmail mirror sync failed: {e}")
+            await asyncio.sleep(interval)
+
+
+# Gmail search operators like from: or is:unread need the real search, so only plain text is answered locally
+def is_plain_text_query(query: str) -> bool:
+    return ':' not in query and not re.search(r'(^|\s)(-|OR\b|AND\b)|[(){}"]', query)
+
+
+def mirror_path(user_id: Optional[str]) -> str:
+    """Get the mirror file for a user, or the shared one for the shared account."""
+    if user_id is None:
+        return MIRROR_FILE
+    name = hashlib.sha256(user_id.encode('utf-8')).hexdigest()[:32]
+    root, ext = os.path.splitext(MIRROR_FILE)
+    return f"{root}_{name}{ext}"
+
+
+_mirrors: Dict[Optional[str], GmailMirror] = {}
+_sync_tasks: Dict[Optional[str], asyncio.Task] = {}
+
+
+async def get_mirror(get_service, user_id: Optional[str] = None) -> GmailMirror:
+    """Get a user's mirror, opening its file on the thread pool and starting its background sync the first time."""
+    mirror = _mirrors.get(user_id)
+    if mirror is None:
+        opened = await run_blocking('mirror', GmailMirror, mirror_path(user_id), user_id, upstream=False)
+        # Another caller may have opened it while this one waited
+        mirror = _mirrors.setdefault(user_id, opened)
+        if mirror is not opened:
+            opened.close()
+    task = _sync_tasks.get(user_id)
+    if task is None or task.done():
+        _sync_tasks[user_id] = asyncio.get_running_loop().create_task(mirror.run_sync_loop(get_service))
+    return mirror
@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import os
+import random
+
+import httpx
+
+from instrumentation import record_upstream
+
+# Outbound HTTP configuration
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3"))
+READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "8"))
+MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "2"))
+BACKOFF_BASE = 0.2
+BACKOFF_MAX = 2.0
+
+# Status codes worth trying again
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_client = None
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Get the shared HTTP client, creating it the first time.
+
+    Connections are kept alive and reused between tool calls, and HTTP/2 is
+    negotiated when the h2 package is installed and the server supports it.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=_http2_available(),
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+            follow_redirects=True,
+        )
+    return _client
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff, so retries from many sessions do not arrive together."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+async def request(method: str, url: str, retries: int = MAX_RETRIES, **kwargs) -> httpx.Response:
+    """
+    Send a request on the shared client, retrying connection errors and retryable statuses.
+
+    Args:
+        method: HTTP method such as "GET"
+        url: Full URL to request
+        retries: How many times to try again after the first attempt
+    """
+    client = get_client()
+    for attempt in range(retries + 1):
+        record_upstream()
+        try:
+            response = await client.request(method, url, **kwargs)
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                return response
+            logging.warning(f"{method} {url} returned {response.status_code}, retrying")
+        except httpx.TransportError as e:
+            if attempt == retries:
+                raise
+            logging.warning(f"{method} {url} failed with {e!r}, retrying")
+        await asyncio.sleep(backoff_delay(attempt))
+
+
+async def get(url: str, **kwargs) -> httpx.Response:
+    return await request("GET", url, **kwargs)
+
+
+async def close() -> None:
+    """Close the shared client and its pooled connections."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,263 @@
+"""
+Latency metrics for tool calls.
+
+Wrap a tool with @instrumented (under @function_tool) to record, per tool:
+    tool_call_seconds        wall time of the whole call
+    tool_queue_wait_seconds  time spent waiting for a concurrency slot or a pool thread
+    tool_upstream_calls      how many upstream requests the call made
+    tool_result_bytes        size of the text returned to the model, in UTF-8 bytes
+    tool_errors_total        calls that raised or returned an error message
+and how many calls are running right now (tool_calls_in_flight).
+
+TOOL_METRICS picks the mode:
+    off   record nothing but the calls in flight, which the worker's load uses
+    low   counters and histograms only (the default, cheap enough for production)
+    full  also an OpenTelemetry span per call when opentelemetry is installed
+
+Metrics are exposed in the Prometheus text format through metrics_text(), an
+HTTP /metrics endpoint (start_metrics_server) or a file dump (dump_metrics).
+"""
+import bisect
+import contextvars
+import functools
+import logging
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+MODE = os.getenv("TOOL_METRICS", "low").lower()
+
+# Histogram bucket upper bounds
+SECONDS_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+COUNT_BUCKETS = [0, 1, 2, 3, 5, 10, 25, 50]
+BYTES_BUCKETS = [64, 256, 1024, 2048, 4096, 8192, 16384, 65536]
+
+# Tools catch their failures and tell the model about them in the text they return, in these words
+ERROR_RESULT = re.compile(r"(An error occurred|Could not retrieve|[A-Za-z ]*(authentication failed|API error):)")
+
+
+class Histogram:
+    """A Prometheus-style cumulative histogram with one series per label value."""
+
+    def __init__(self, name: str, help_text: str, buckets: List[float], label: str = 'tool'):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.label = label
+        self._lock = threading.Lock()
+        self._series: Dict[str, list] = {}   # label value -> [bucket counts..., sum, count]
+
+    def observe(self, label_value: str, value: float) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * (len(self.buckets) + 2)
+            if i < len(self.buckets):
+                series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_value, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{{{self.label}="{label_value}",le="{bound:g}"}} {cumulative}')
+                lines.append(f'{self.name}_bucket{{{self.label}="{label_value}",le="+Inf"}} {series[-1]}')
+                lines.append(f'{self.name}_sum{{{self.label}="{label_value}"}} {series[-2]:g}')
+                lines.append(f'{self.name}_count{{{self.label}="{label_value}"}} {series[-1]}')
+        return lines
+
+
+class Counter:
+    """A Prometheus-style counter with one series per label value."""
+
+    def __init__(self, name: str, help_text: str, label: str = 'tool'):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self._lock = threading.Lock()
+        self._values: Dict[str, float] = {}
+
+    def inc(self, label_value: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_value, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{{{self.label}="{label_value}"}} {value:g}')
+        return lines
+
+
+CALL_SECONDS = Histogram('tool_call_seconds', 'Wall time of each tool call.', SECONDS_BUCKETS)
+QUEUE_WAIT_SECONDS = Histogram('tool_queue_wait_seconds', 'Time a tool call waited for a concurrency slot or pool thread.', SECONDS_BUCKETS)
+UPSTREAM_CALLS = Histogram('tool_upstream_calls', 'Upstream requests made by each tool call.', COUNT_BUCKETS)
+RESULT_BYTES = Histogram('tool_result_bytes', 'UTF-8 size of the text each tool call returned.', BYTES_BUCKETS)
+ERRORS = Counter('tool_errors_total', 'Tool calls that raised or returned an error message.')
+
+METRICS = [CALL_SECONDS, QUEUE_WAIT_SECONDS, UPSTREAM_CALLS, RESULT_BYTES, ERRORS]
+
+
+class CallStats:
+    """What one tool call has done so far, filled in by the executor and HTTP client."""
+    __slots__ = ('upstream_calls', 'queue_wait')
+
+    def __init__(self):
+        self.upstream_calls = 0
+        self.queue_wait = 0.0
+
+
+_current_call: contextvars.ContextVar[Optional[CallStats]] = contextvars.ContextVar('tool_call_stats', default=None)
+
+
+# Tool calls of this process that have started and not returned, counted even when MODE is off
+_in_flight = 0
+
+
+def calls_in_flight() -> int:
+    """How many tool calls this process is running right now."""
+    return _in_flight
+
+
+def record_upstream(queue_wait: float = 0.0) -> None:
+    """Count an upstream request (and how long it queued) against the tool call in progress, if any."""
+    stats = _current_call.get()
+    if stats is not None:
+        stats.upstream_calls += 1
+        stats.queue_wait += queue_wait
+
+
+def _tracer():
+    if MODE != 'full':
+        return None
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        return None
+    return trace.get_tracer('quanta.tools')
+
+
+def _span_attributes(name: str) -> dict:
+    attributes = {'tool.name': name}
+    try:
+        from livekit.agents import get_job_context
+        attributes['livekit.room'] = get_job_context().room.name
+    except Exception:
+        pass
+    return attributes
+
+
+def instrumented(func):
+    """Record latency metrics for an async tool. Put it below @function_tool so the tool's signature is kept."""
+    name = func.__name__
+
+    async def measured(*args, **kwargs):
+        stats = CallStats()
+        token = _current_call.set(stats)
+        tracer = _tracer()
+        span = tracer.start_as_current_span(f"tool.{name}", attributes=_span_attributes(name)) if tracer else None
+        started = time.perf_counter()
+        try:
+            if span is not None:
+                with span as current:
+                    result = await func(*args, **kwargs)
+                    current.set_attribute('tool.upstream_calls', stats.upstream_calls)
+            else:
+                result = await func(*args, **kwargs)
+        except Exception:
+            ERRORS.inc(name)
+            raise
+        finally:
+            _current_call.reset(token)
+            CALL_SECONDS.observe(name, time.perf_counter() - started)
+            QUEUE_WAIT_SECONDS.observe(name, stats.queue_wait)
+            UPSTREAM_CALLS.observe(name, stats.upstream_calls)
+
+        if isinstance(result, str):
+            RESULT_BYTES.observe(name, len(result.encode('utf-8')))
+            if ERROR_RESULT.match(result):
+                ERRORS.inc(name)
+        return result
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        global _in_flight
+        _in_flight += 1
+        try:
+            if MODE == 'off':
+                return await func(*args, **kwargs)
+            return await measured(*args, **kwargs)
+        finally:
+            _in_flight -= 1
+
+    return wrapper
+
+
+def metrics_text() -> str:
+    """Render every tool metric, plus the result cache counters, in the Prometheus text format."""
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+
+    from result_cache import cache_stats
+    lines += ["# HELP tool_cache_events_total Result cache lookups by outcome.", "# TYPE tool_cache_events_total counter"]
+    for cache, stats in sorted(cache_stats().items()):
+        for outcome in ('hits', 'misses', 'shared'):
+            lines.append(f'tool_cache_events_total{{cache="{cache}",outcome="{outcome}"}} {stats[outcome]}')
+    lines += ["# HELP tool_calls_in_flight Tool calls running now.", "# TYPE tool_calls_in_flight gauge",
+              f"tool_calls_in_flight {_in_flight}"]
+    return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = metrics_text().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+
+
+def start_metrics_server(port: int) -> bool:
+    """
+    Serve /metrics on port from a background thread. Returns False if the port is taken,
+    which happens when another job process on the same host already serves it.
+    """
+    global _server
+    if _server is not None:
+        return True
+    try:
+        _server = ThreadingHTTPServer(('0.0.0.0', port), _MetricsHandler)
+    except OSError as e:
+        logging.info(f"Metrics endpoint not started on port {port}: {e}")
+        return False
+    threading.Thread(target=_server.serve_forever, name='metrics', daemon=True).start()
+    logging.info(f"Serving tool metrics on http://0.0.0.0:{port}/metrics")
+    return True
+
+
+def dump_metrics(directory: str) -> str:
+    """Write the current metrics to <directory>/tools-<pid>.prom and return the path."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"tools-{os.getpid()}.prom")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(metrics_text())
+    return path
@@ -0,0 +1,254 @@
+"""
+Long-term memory of each user across sessions.
+
+Memories live in a backend (mem0, or a local JSON file for tests and offline
+development) and are copied into a local vector index when a session starts.
+Recall during the conversation only searches the local index, so it adds no
+remote round trip to a turn. New messages are written back in the background.
+
+MEMORY_BACKEND picks the backend:
+    mem0   the mem0 platform, the default when MEM0_API_KEY is set
+    local  a JSON file at MEMORY_FILE
+    off    no memory, the default otherwise
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from executor import run_blocking
+from token_refresh import atomic_write
+
+# Memory configuration
+MEMORY_BACKEND = os.getenv("MEMORY_BACKEND", "mem0" if os.getenv("MEM0_API_KEY") else "off").lower()
+MEMORY_FILE = os.getenv("MEMORY_FILE", "memories.json")
+RECALL_K = int(os.getenv("MEMORY_RECALL_K", "5"))
+# Matches scoring lower than this are not worth mentioning
+MIN_SCORE = 0.1
+# A user's memories are read from the backend again after this many seconds
+RELOAD_AFTER = 300
+# Users whose memories a process keeps, the least recently seen are dropped first
+MAX_USERS = int(os.getenv("MEMORY_MAX_USERS", "64"))
+EMBEDDING_DIM = 1024
+
+_WORD = re.compile(r"[a-z0-9]+")
+_STOP_WORDS = {
+    'a', 'am', 'an', 'and', 'are', 'as', 'at', 'be', 'but', 'by', 'can', 'do', 'for', 'from', 'has', 'have', 'how',
+    'i', 'in', 'is', 'it', 'm', 'me', 'my', 'of', 'on', 'or', 's', 'should', 'so', 't', 'that', 'the', 'this', 'to',
+    'was', 'what', 'when', 'where', 'who', 'will', 'with', 'you', 'your',
+}
+
+
+def hashing_embedding(text: str, dim: int = EMBEDDING_DIM) -> np.ndarray:
+    """
+    Embed text as a normalised bag of hashed words and word pairs.
+
+    Needs no model and no network, which is enough to find memories that share
+    words with what the user said. Any function from text to a vector can be
+    used in its place.
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    words = [w for w in _WORD.findall(text.lower()) if w not in _STOP_WORDS]
+    for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+        h = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+        vector[h % dim] += 1.0 if h >> 63 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class VectorIndex:
+    """An in-memory cosine similarity index over normalised vectors, searched with one matrix product."""
+
+    def __init__(self, embed: Callable[[str], np.ndarray] = hashing_embedding):
+        self.embed = embed
+        self._lock = threading.Lock()
+        self._ids: List[str] = []
+        self._texts: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._matrix: Optional[np.ndarray] = None   # grown by doubling, rows past len(self) are unused
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, item_id: str, text: str) -> None:
+        """Add a text, or replace the text stored under item_id."""
+        vector = self.embed(text)
+        with self._lock:
+            position = self._positions.get(item_id)
+            if position is None:
+                position = len(self._ids)
+                if self._matrix is None:
+                    self._matrix = np.zeros((16, len(vector)), dtype=np.float32)
+                elif position == len(self._matrix):
+                    self._matrix = np.vstack([self._matrix, np.zeros_like(self._matrix)])
+                self._ids.append(item_id)
+                self._texts.append(text)
+                self._positions[item_id] = position
+            else:
+                self._texts[position] = text
+            self._matrix[position] = vector
+
+    def top_k(self, query: str, k: int = RECALL_K, min_score: float = MIN_SCORE) -> List[tuple]:
+        """Get up to k (score, text) pairs most similar to query, best first."""
+        vector = self.embed(query)
+        with self._lock:
+            count = len(self._ids)
+            if not count or k <= 0:
+                return []
+            scores = self._matrix[:count] @ vector
+            k = min(k, count)
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+            return [(float(scores[i]), self._texts[i]) for i in best if scores[i] >= min_score]
+
+    def latest(self, count: int) -> List[str]:
+        with self._lock:
+            return self._texts[-count:] if count > 0 else []
+
+
+def _items(result) -> List[dict]:
+    """Get the memory records out of a backend answer, which is a list or a dict with 'results'."""
+    items = result.get('results', []) if isinstance(result, dict) else (result or [])
+    return [item for item in items if isinstance(item, dict) and item.get('memory')]
+
+
+class Mem0Backend:
+    """The mem0 platform, which extracts facts from the messages it is given."""
+
+    def __init__(self, api_key: Optional[str] = None):
+        self.api_key = api_key or os.getenv("MEM0_API_KEY")
+        self._client = None
+
+    @property
+    def client(self):
+        # Made on first use, which is in a worker thread since creating it checks the key over the network
+        if self._client is None:
+            from mem0 import MemoryClient
+            self._client = MemoryClient(api_key=self.api_key)
+        return self._client
+
+    def connect(self) -> None:
+        """Make the client now, so the first session does not wait for the key to be checked."""
+        self.client
+
+    def get_all(self, user_id: str) -> List[dict]:
+        return _items(self.client.get_all(user_id=user_id))
+
+    def add(self, messages: List[dict], user_id: str) -> List[dict]:
+        return _items(self.client.add(messages, user_id=user_id))
+
+
+class LocalMemoryBackend:
+    """
+    Memories in a JSON file, a stand-in for mem0 in tests and offline development.
+
+    Every user message is stored as it is, where mem0 would extract facts from it.
+    """
+
+    def __init__(self, path: str = MEMORY_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def connect(self) -> None:
+        """Nothing to connect to, the file is read when it is needed."""
+
+    def _read(self) -> Dict[str, List[dict]]:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def get_all(self, user_id: str) -> List[dict]:
+        with self._lock:
+            return self._read().get(user_id, [])
+
+    def add(self, messages: List[dict], user_id: str) -> List[dict]:
+        with self._lock:
+            data = self._read()
+            memories = data.setdefault(user_id, [])
+            known = {m['memory'] for m in memories}
+            added = []
+            for message in messages:
+                text = message.get('content', '').strip()
+                if message.get('role') == 'user' and text and text not in known:
+                    added.append({'id': uuid.uuid4().hex, 'memory': text, 'created_at': time.time()})
+                    known.add(text)
+            if added:
+                memories += added
+                atomic_write(self.path, json.dumps(data, indent=2).encode('utf-8'))
+            return added
+
+
+class UserMemory:
+    """One user's memories, with the local index answering recall and the backend behind it."""
+
+    def __init__(self, backend, user_id: str, embed: Callable[[str], np.ndarray] = hashing_embedding):
+        self.backend = backend
+        self.user_id = user_id
+        self.index = VectorIndex(embed)
+        self.loaded_at = 0.0
+
+    async def load(self) -> int:
+        """Read the user's memories into the index, unless that was done recently. Returns how many are indexed."""
+        if time.monotonic() - self.loaded_at < RELOAD_AFTER and self.loaded_at:
+            return len(self.index)
+        for item in await run_blocking('memory', self.backend.get_all, self.user_id):
+            self.index.add(item.get('id') or item['memory'], item['memory'])
+        self.loaded_at = time.monotonic()
+        return len(self.index)
+
+    def recall(self, text: str, k: int = RECALL_K) -> List[str]:
+        """Get the memories most related to text from the local index."""
+        return [memory for _, memory in self.index.top_k(text, k)]
+
+    async def remember(self, text: str) -> None:
+        """Write a user message back to the backend and index whatever it keeps from it. Never raises."""
+        try:
+            added = await run_blocking('memory', self.backend.add, [{'role': 'user', 'content': text}], self.user_id)
+        except Exception as e:
+            logging.warning(f"Could not save memory for {self.user_id}: {e}")
+            return
+        for item in added:
+            self.index.add(item.get('id') or item['memory'], item['memory'])
+        if not added:
+            # The backend may still be extracting facts, so read them on the next load
+            self.loaded_at = 0.0
+
+
+_backend = None
+_memories: "OrderedDict[str, UserMemory]" = OrderedDict()
+
+
+def get_backend():
+    """Get the configured memory backend, or None when memory is off."""
+    global _backend
+    if _backend is None and MEMORY_BACKEND != 'off':
+        _backend = Mem0Backend() if MEMORY_BACKEND == 'mem0' else LocalMemoryBackend()
+    return _backend
+
+
+def get_user_memory(user_id: str) -> Optional[UserMemory]:
+    """
+    Get a user's memory, shared by every session of that user in this process, or None when memory is off.
+
+    Only the MAX_USERS most recently seen users are kept. A session keeps its own
+    reference, so dropping a user only means their next session reads the backend again.
+    """
+    backend = get_backend()
+    if backend is None:
+        return None
+    memory = _memories.get(user_id)
+    if memory is None:
+        memory = _memories[user_id] = UserMemory(backend, user_id)
+    _memories.move_to_end(user_id)
+    while len(_memories) > MAX_USERS:
+        _memories.popitem(last=False)
+    return memory
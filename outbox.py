@@ -0,0 +1,336 @@
+import asyncio
+import base64
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from email.utils import make_msgid
+from typing import Dict, List, Optional, Set
+
+from googleapiclient.errors import HttpError
+
+from executor import AUTH_TIMEOUT, run_blocking
+
+# Outbox configuration
+OUTBOX_FILE = os.getenv("OUTBOX_FILE", "outbox.db")
+MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+RETRY_BASE = 5.0
+RETRY_MAX = 600.0
+POLL_INTERVAL = 30.0
+# A send claimed this long ago by a process that never finished it is tried again
+CLAIM_TIMEOUT = 300.0
+# The same email asked for again within this long is treated as a repeat, not a new email
+DUPLICATE_WINDOW = 600.0
+
+# Gmail 403 reasons that mean slow down rather than not allowed
+RATE_LIMIT_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded'}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    idempotency_key TEXT NOT NULL,
+    message_id TEXT NOT NULL,
+    raw TEXT NOT NULL,
+    recipient TEXT,
+    subject TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    claimed_at REAL,
+    last_error TEXT,
+    gmail_id TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt);
+CREATE INDEX IF NOT EXISTS outbox_by_key ON outbox (user_id, idempotency_key);
+"""
+
+
+def retry_delay(error: Exception, attempts: int) -> Optional[float]:
+    """Get how many seconds to wait before trying again after error, or None if retrying cannot help."""
+    backoff = random.uniform(RETRY_BASE, min(RETRY_MAX, RETRY_BASE * (2 ** attempts)))
+    if isinstance(error, HttpError):
+        status = error.resp.status
+        reason = getattr(error, 'error_details', None)
+        reasons = {d.get('reason') for d in reason} if isinstance(reason, list) else set()
+        if status == 429 or (status == 403 and reasons & RATE_LIMIT_REASONS):
+            retry_after = error.resp.get('retry-after', '')
+            return float(retry_after) if retry_after.isdigit() else max(backoff, 60.0)
+        if status >= 500:
+            return backoff
+        return None
+    # Timeouts, dropped connections and failed logins may well work next time
+    return backoff
+
+
+def _is_rate_limit(error: Exception) -> bool:
+    return isinstance(error, HttpError) and error.resp.status in (403, 429)
+
+
+class Outbox:
+    """
+    A persistent queue of emails waiting to be sent through Gmail.
+
+    send_email adds to it and returns at once, and a background worker sends the
+    queued emails with retries. Every email gets its own Message-ID header before it
+    is queued, so a retry after an attempt whose outcome is unknown first checks
+    whether that attempt got through instead of sending the email twice.
+
+    Several job processes can share one outbox file. An email is claimed by the
+    process that sends it, and claims abandoned by a crashed process expire.
+
+    Reading and writing the SQLite file blocks, so the worker and flush do it on
+    the thread pool, and callers should run enqueue, get and recent there too.
+    enqueue wakes the worker from any thread.
+    """
+
+    def __init__(self, path: str = OUTBOX_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        if path != ':memory:':
+            self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._paused_until: Dict[str, float] = {}   # user -> time, after a rate limit answer
+        self._queued_here: Set[str] = set()          # emails this process queued that are not sent or failed yet
+        self._sending: Set[str] = set()              # emails this process has claimed and is sending
+
+    def _rows(self, sql: str, params: tuple) -> List[dict]:
+        with self._lock:
+            cursor = self._db.execute(sql, params)
+            columns = [c[0] for c in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def _update(self, entry_id: str, **fields) -> None:
+        fields['updated'] = time.time()
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._db.execute(f"UPDATE outbox SET {assignments} WHERE id = ?", (*fields.values(), entry_id))
+            self._db.commit()
+
+    # Queueing
+
+    def enqueue(self, user_id: Optional[str], message, idempotency_key: str, recipient: str, subject: str) -> tuple:
+        """
+        Queue a MIME message for sending.
+
+        An email with the same idempotency key queued for the same user within
+        DUPLICATE_WINDOW is not queued again. Returns the outbox ID and whether
+        the email was already queued.
+        """
+        user = user_id or ''
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                'SELECT id FROM outbox WHERE user_id = ? AND idempotency_key = ? AND created > ? AND status != ?',
+                (user, idempotency_key, now - DUPLICATE_WINDOW, 'failed')
+            ).fetchone()
+            if row:
+                return row[0], True
+
+            entry_id = uuid.uuid4().hex[:12]
+            message['Message-ID'] = make_msgid(idstring=entry_id, domain='outbox.local')
+            raw = base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')
+            self._db.execute(
+                'INSERT INTO outbox (id, user_id, idempotency_key, message_id, raw, recipient, subject, status, '
+                'next_attempt, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (entry_id, user, idempotency_key, message['Message-ID'], raw, recipient, subject, 'queued', now, now, now)
+            )
+            self._db.commit()
+            self._queued_here.add(entry_id)
+
+        self._wake()
+        return entry_id, False
+
+    def _wake(self) -> None:
+        if self._wakeup is None:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        except RuntimeError:
+            # The worker's loop has closed
+            pass
+
+    # Reads
+
+    def get(self, entry_id: str) -> Optional[dict]:
+        rows = self._rows('SELECT * FROM outbox WHERE id = ?', (entry_id,))
+        return rows[0] if rows else None
+
+    def recent(self, user_id: Optional[str], limit: int = 5) -> List[dict]:
+        """Get a user's newest emails, newest first."""
+        return self._rows('SELECT * FROM outbox WHERE user_id = ? ORDER BY created DESC LIMIT ?', (user_id or '', limit))
+
+    def pending(self) -> int:
+        """How many emails are waiting to be sent."""
+        return self._rows("SELECT COUNT(*) AS n FROM outbox WHERE status IN ('queued', 'sending')", ())[0]['n']
+
+    def due_here(self) -> int:
+        """
+        How many emails this process queued are being sent by it or due to be tried now.
+
+        Emails other processes queued or are sending, and ones waiting out a retry delay
+        or a rate limit pause, are left for later and not counted.
+        """
+        with self._lock:
+            entry_ids = list(self._queued_here)
+        if not entry_ids:
+            return 0
+        now = time.time()
+        rows = self._rows(
+            f"SELECT id, user_id, status, next_attempt FROM outbox WHERE id IN ({', '.join('?' * len(entry_ids))})",
+            tuple(entry_ids)
+        )
+        due = 0
+        for row in rows:
+            if row['status'] in ('sent', 'failed'):
+                with self._lock:
+                    self._queued_here.discard(row['id'])
+            elif row['id'] in self._sending or (
+                    row['status'] == 'queued' and row['next_attempt'] <= now
+                    and self._paused_until.get(row['user_id'], 0) <= now):
+                due += 1
+        return due
+
+    # Sending
+
+    def _claim_due(self, limit: int = 10) -> List[dict]:
+        """Take the emails that are due, and sends abandoned by another process, for this process to send."""
+        now = time.time()
+        paused = [user for user, until in self._paused_until.items() if until > now]
+        claimed = []
+        # Users Gmail asked to slow down are left alone until their pause is over
+        skip_paused = f" AND user_id NOT IN ({', '.join('?' * len(paused))})" if paused else ''
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id FROM outbox WHERE ((status = 'queued' AND next_attempt <= ?) "
+                f"OR (status = 'sending' AND claimed_at < ?)){skip_paused} ORDER BY next_attempt LIMIT ?",
+                (now, now - CLAIM_TIMEOUT, *paused, limit)
+            ).fetchall()
+            for (entry_id,) in rows:
+                # Only one process wins the claim
+                cursor = self._db.execute(
+                    "UPDATE outbox SET status = 'sending', claimed_at = ?, updated = ? WHERE id = ? "
+                    "AND (status = 'queued' OR (status = 'sending' AND claimed_at < ?))",
+                    (now, now, entry_id, now - CLAIM_TIMEOUT)
+                )
+                if cursor.rowcount:
+                    claimed.append(entry_id)
+            self._db.commit()
+            # Marked as being sent here in the same step, so due_here never sees a claim that is not
+            self._sending.update(claimed)
+        return [self.get(entry_id) for entry_id in claimed]
+
+    @staticmethod
+    def _deliver(service, entry: dict) -> str:
+        """Send one email unless an earlier attempt already got through. Returns the Gmail message ID."""
+        if entry['attempts'] > 0:
+            found = service.users().messages().list(userId='me', q=f"rfc822msgid:{entry['message_id']}").execute()
+            if found.get('messages'):
+                return found['messages'][0]['id']
+        sent = service.users().messages().send(userId='me', body={'raw': entry['raw']}).execute()
+        return sent['id']
+
+    async def _send(self, entry: dict, get_service) -> None:
+        attempts = entry['attempts'] + 1
+        try:
+            service, error = await run_blocking('gmail', get_service, entry['user_id'] or None, timeout=AUTH_TIMEOUT, upstream=False)
+            if error:
+                raise RuntimeError(error)
+            # Counted before sending, so a retry after a crash mid-send checks whether it went through
+            await run_blocking('outbox', self._update, entry['id'], attempts=attempts, upstream=False)
+            gmail_id = await run_blocking('gmail', self._deliver, service, entry)
+        except asyncio.CancelledError:
+            await run_blocking('outbox', self._update, entry['id'], status='queued', upstream=False)
+            raise
+        except Exception as e:
+            delay = retry_delay(e, attempts)
+            if delay is None or attempts >= MAX_ATTEMPTS:
+                logging.error(f"Giving up on outbox email {entry['id']} to {entry['recipient']}: {e}")
+                await run_blocking('outbox', self._update, entry['id'], status='failed', attempts=attempts,
+                                   last_error=str(e), upstream=False)
+                return
+            if _is_rate_limit(e):
+                self._paused_until[entry['user_id']] = time.time() + delay
+            logging.warning(f"Outbox email {entry['id']} failed (attempt {attempts}), retrying in {delay:.0f}s: {e}")
+            await run_blocking('outbox', self._update, entry['id'], status='queued', attempts=attempts,
+                               next_attempt=time.time() + delay, last_error=str(e), upstream=False)
+            return
+
+        await run_blocking('outbox', self._update, entry['id'], status='sent', attempts=attempts, gmail_id=gmail_id,
+                           last_error=None, upstream=False)
+        logging.info(f"Outbox email {entry['id']} sent to {entry['recipient']}")
+
+    async def send_due(self, get_service) -> int:
+        """Send every email that is due. Returns how many were tried."""
+        entries = await run_blocking('outbox', self._claim_due, upstream=False)
+        try:
+            for entry in entries:
+                await self._send(entry, get_service)
+                self._sending.discard(entry['id'])
+        finally:
+            # Claims left unsent when the worker stops expire and another process sends them
+            self._sending.difference_update(entry['id'] for entry in entries)
+        return len(entries)
+
+    def _seconds_until_due(self) -> float:
+        rows = self._rows("SELECT MIN(next_attempt) AS due FROM outbox WHERE status = 'queued'", ())
+        due = rows[0]['due']
+        if due is None:
+            return POLL_INTERVAL
+        return min(POLL_INTERVAL, max(0.0, due - time.time()))
+
+    async def run_worker(self, get_service) -> None:
+        """Send queued emails forever. get_service(user_id) returns (service, error) like get_gmail_service."""
+        self._wakeup = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+            try:
+                if await self.send_due(get_service):
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Outbox worker failed: {e}")
+            try:
+                seconds = await run_blocking('outbox', self._seconds_until_due, upstream=False)
+                await asyncio.wait_for(self._wakeup.wait(), seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def flush(self, timeout: float = 10.0) -> int:
+        """
+        Wait up to timeout seconds for the emails this process queued and can send now to go out.
+
+        Returns how many of them are still waiting, see due_here.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            waiting = await run_blocking('outbox', self.due_here, upstream=False)
+            if not waiting or time.monotonic() >= deadline:
+                return waiting
+            self._wake()
+            await asyncio.sleep(0.2)
+
+
+_outbox: Optional[Outbox] = None
+_worker: Optional[asyncio.Task] = None
+
+
+def get_outbox(get_service) -> Outbox:
+    """Get the outbox, starting its worker on the running loop the first time."""
+    global _outbox, _worker
+    if _outbox is None:
+        _outbox = Outbox()
+    if _worker is None or _worker.done():
+        _worker = asyncio.get_running_loop().create_task(_outbox.run_worker(get_service))
+    return _outbox
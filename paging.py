@@ -0,0 +1,67 @@
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+
+# fetch_page(page_token) returns one page of items and the token of the next page, or None after the last one
+PageFetcher = Callable[[Optional[str]], Awaitable[Tuple[List[Any], Optional[str]]]]
+
+
+@dataclass
+class Cursor:
+    """
+    Where a listing stopped, so asking for more continues from there instead of starting over.
+
+    A position is the page token of the page being read plus how many of its items
+    were already used. Local sources use the offset of the page as its token.
+
+    Args:
+        kind: Which listing this is, such as 'messages' or 'events'
+        params: The arguments the listing was first called with
+    """
+    kind: str
+    params: dict = field(default_factory=dict)
+    source: Optional[str] = None     # where the items come from once known, such as 'mirror' or 'api'
+    page_token: Optional[str] = None
+    skip: int = 0
+    position: int = 0                # items used so far over all pages
+    done: bool = False
+
+
+def offset_page(items: List[Any], offset: int, page_size: int) -> Tuple[List[Any], Optional[str]]:
+    """Turn one page of a local offset query into (items, next_page_token)."""
+    return items, str(offset + len(items)) if len(items) >= page_size else None
+
+
+async def paginate(fetch_page: PageFetcher, cursor: Cursor) -> AsyncIterator[Any]:
+    """
+    Yield items one at a time, fetching the next page only once the last one is used up.
+
+    The cursor is moved past each item before it is yielded, so when the caller stops
+    it points at the first item the caller has not seen.
+    """
+    while not cursor.done:
+        items, next_token = await fetch_page(cursor.page_token)
+        items = items[cursor.skip:]
+        if not items:
+            cursor.page_token, cursor.skip, cursor.done = next_token, 0, next_token is None
+            continue
+        for i, item in enumerate(items):
+            if i == len(items) - 1:
+                cursor.page_token, cursor.skip, cursor.done = next_token, 0, next_token is None
+            else:
+                cursor.skip += 1
+            cursor.position += 1
+            yield item
+
+
+async def take(items: AsyncIterator[Any], count: int) -> List[Any]:
+    """Get up to count items from an async iterator and close it, so no page past them is fetched."""
+    found = []
+    try:
+        if count > 0:
+            async for item in items:
+                found.append(item)
+                if len(found) >= count:
+                    break
+    finally:
+        await items.aclose()
+    return found
@@ -0,0 +1,192 @@
+"""
+Tool results written to be read out: short, numbered and most important first.
+
+What a tool returns is input to the realtime model on that turn and every turn
+after it, and the model reads all of it before it starts to speak. So a listing
+gives each item a number and only what the user wants to hear, such as the title,
+when and who. IDs, descriptions and email addresses go in a table in the session
+instead. Tools that act on an item take its number wherever they took its ID, and
+show_details reads out the rest of an item.
+
+Each tool has a budget of characters. render_listing builds the text in one pass
+and gives each item an even share of what is left. Fields go in most relevant
+first until the share is used up, so a long list shortens the details and never
+drops items.
+"""
+import os
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from email.utils import parseaddr, parsedate_to_datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from session_data import get_session_data
+
+# Characters a tool's answer may take, about four to a token
+DEFAULT_BUDGET = int(os.getenv("RENDER_BUDGET", "900"))
+BUDGETS = {
+    'list_google_calendars': 500,
+    'find_free_slots': 600,
+    'show_details': 1200,
+}
+# Names of people read out before the rest are counted, as in "with Bob, Alice and 3 others"
+NAMED_PEOPLE = 2
+
+
+@dataclass
+class Listed:
+    """An item a tool listed, with what was left out of the text, looked up by its number."""
+    kind: str                 # 'message', 'event' or 'calendar'
+    id: str
+    title: str
+    details: Dict[str, str] = field(default_factory=dict)
+    calendar_id: Optional[str] = None   # the calendar an event is in
+
+
+def budget(tool: str) -> int:
+    return BUDGETS.get(tool, DEFAULT_BUDGET)
+
+
+def clip(text: str, length: int) -> str:
+    """Shorten text to length characters at a word boundary."""
+    text = ' '.join(str(text).split())
+    if len(text) <= length:
+        return text
+    cut = text[:max(0, length - 3)].rsplit(' ', 1)[0]
+    return cut.rstrip(',.;:') + '...'
+
+
+def render_listing(header: str, rows: Iterable[List[str]], budget: int, first: int = 1, footer: str = '') -> str:
+    """
+    Number rows of fields, most relevant field first, keeping the whole text to about budget characters.
+
+    Every row gets at least its first field, clipped to its share when it is long.
+    """
+    rows = list(rows)
+    remaining = budget - len(header) - len(footer)
+    lines = [header]
+    for i, fields in enumerate(rows):
+        share = max(remaining // (len(rows) - i), 24)
+        line = f"{first + i}. "
+        line += clip(fields[0], share - len(line))
+        for value in fields[1:]:
+            if value and len(line) + len(value) + 2 <= share:
+                line += ', ' + value
+        lines.append(line)
+        remaining -= len(line) + 1
+    if footer:
+        lines.append(footer)
+    return '\n'.join(lines)
+
+
+def render_details(item: Listed, budget: int) -> str:
+    """Everything a listing left out of an item, each field on its own line."""
+    lines = [item.title]
+    remaining = budget - len(item.title)
+    for name, value in item.details.items():
+        if not value:
+            continue
+        line = f"{name}: {clip(value, max(remaining - len(name) - 2, 24))}"
+        lines.append(line)
+        remaining -= len(line) + 1
+    return '\n'.join(lines)
+
+
+# Speech
+
+def spoken_day(day: date, today: date) -> str:
+    """today, tomorrow, yesterday or the weekday and date, like Mon 20 Oct."""
+    offset = (day - today).days
+    if offset == 0:
+        return 'today'
+    if offset == 1:
+        return 'tomorrow'
+    if offset == -1:
+        return 'yesterday'
+    return f"{day.strftime('%a')} {day.day} {day.strftime('%b')}"
+
+
+def spoken_time(moment: datetime, now: datetime) -> str:
+    """The day and time of moment, in the time zone of now, like tomorrow 09:30."""
+    if moment.tzinfo is not None and now.tzinfo is not None:
+        moment = moment.astimezone(now.tzinfo)
+    return f"{spoken_day(moment.date(), now.date())} {moment.strftime('%H:%M')}"
+
+
+def spoken_span(start: datetime, end: datetime, now: datetime) -> str:
+    """From start to end, like tomorrow 09:00 to 09:30, naming the end's day only when it is another day."""
+    if end.tzinfo is not None and now.tzinfo is not None:
+        end = end.astimezone(now.tzinfo)
+    if start.tzinfo is not None and now.tzinfo is not None:
+        start = start.astimezone(now.tzinfo)
+    until = end.strftime('%H:%M') if end.date() == start.date() else spoken_time(end, now)
+    return f"{spoken_time(start, now)} to {until}"
+
+
+def spoken_date_header(header: str, now: datetime) -> str:
+    """An email's Date header as a spoken day and time, or as it is when it cannot be read."""
+    try:
+        return spoken_time(parsedate_to_datetime(header), now)
+    except (TypeError, ValueError):
+        return header
+
+
+def person(address: str) -> str:
+    """Someone's name from an address like Bob Smith <bob@example.com>, or the part before the @."""
+    name, email = parseaddr(address)
+    return name.strip('"') or email.split('@')[0] or address
+
+
+def people(names: List[str], named: int = NAMED_PEOPLE) -> str:
+    """with Bob, Alice and 3 others."""
+    if not names:
+        return ''
+    if len(names) <= named:
+        listed = ' and '.join(names)
+    else:
+        others = len(names) - named
+        listed = ', '.join(names[:named]) + f" and {others} other{'s' if others > 1 else ''}"
+    return f"with {listed}"
+
+
+# The session's table of listed items
+
+def remember_listed(context, items: List[Optional[Listed]], first: int = 1) -> None:
+    """
+    Keep the items a tool listed under their numbers. A listing that starts at 1 replaces the last one.
+
+    None stands for a numbered line that is not an item, such as an event that could not be created.
+    """
+    session = get_session_data(context)
+    if session is None:
+        return
+    if first == 1:
+        session.listed = {}
+    for number, item in enumerate(items, first):
+        if item is not None:
+            session.listed[number] = item
+
+
+def look_up(context, number: int) -> Optional[Listed]:
+    """Get the item with this number in the last listing, if there is one."""
+    session = get_session_data(context)
+    return session.listed.get(number) if session is not None else None
+
+
+def resolve_listed(context, reference: str, kind: str) -> Tuple[str, Optional[Listed]]:
+    """
+    Get the ID an item's number in the last listing stands for and the item, or reference itself and None when it is an ID.
+
+    Raises LookupError when reference is a number no item of this kind was listed under.
+    """
+    reference = str(reference).strip().lstrip('#')
+    if not (reference.isdigit() and len(reference) <= 4):
+        return reference, None
+    item = look_up(context, int(reference))
+    if item is None or item.kind != kind:
+        raise LookupError(f"There is no {kind} number {reference} in the last list")
+    return item.id, item
+
+
+def resolve(context, reference: str, kind: str) -> str:
+    """Get the ID an item's number in the last listing stands for, or reference itself when it is an ID. Raises LookupError like resolve_listed."""
+    return resolve_listed(context, reference, kind)[0]
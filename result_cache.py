@@ -0,0 +1,114 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict
+
+
+def normalize_key(text: str) -> str:
+    """Make a cache key that ignores case and extra whitespace, so 'New  York' and 'new york' match."""
+    return ' '.join(text.lower().split())
+
+
+class ResultCache:
+    """
+    An async TTL cache with a size-bounded LRU and single-flight fetching.
+
+    Concurrent calls for the same key share one upstream fetch. Only successful
+    results are cached, so a fetch should raise rather than return an error value.
+    Any object with the same get_or_fetch() method can be registered in its place.
+
+    Args:
+        ttl: Seconds a result stays fresh
+        max_entries: How many results to keep before dropping the least recently used
+        clock: Returns the current time in seconds, swap it for a fake clock in tests
+    """
+
+    def __init__(self, ttl: float, max_entries: int = 256, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Any:
+        """Get a fresh cached result without fetching, or None."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires <= self.clock():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        self._entries[key] = (self.clock() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    async def get_or_fetch(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """Get the cached result for key, or fetch it once no matter how many callers are waiting."""
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.shared += 1
+        else:
+            self.misses += 1
+            task = asyncio.get_running_loop().create_task(fetch())
+            self._inflight[key] = task
+
+            def on_done(done: asyncio.Task) -> None:
+                self._inflight.pop(key, None)
+                if not done.cancelled() and done.exception() is None:
+                    self.put(key, done.result())
+
+            task.add_done_callback(on_done)
+
+        # Shielded so one caller being cancelled does not cancel the fetch for everyone else
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'shared': self.shared,
+            'size': len(self._entries),
+        }
+
+
+# Cache for each tool, with TTLs suited to how quickly the data changes
+_caches: Dict[str, ResultCache] = {
+    'weather': ResultCache(ttl=10 * 60, max_entries=128),
+    'search': ResultCache(ttl=5 * 60, max_entries=256),
+    'calendars': ResultCache(ttl=10 * 60, max_entries=256),
+    'messages': ResultCache(ttl=60, max_entries=256),
+}
+
+
+def get_cache(name: str) -> ResultCache:
+    return _caches[name]
+
+
+def register_cache(name: str, cache: ResultCache) -> None:
+    """Replace the cache a tool uses, for example with a shared or fake-clock cache."""
+    _caches[name] = cache
+
+
+def cache_stats() -> Dict[str, Dict[str, int]]:
+    """Get hit, miss and size counters for every tool cache."""
+    return {name: cache.stats() for name, cache in _caches.items()}
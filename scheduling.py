@@ -0,0 +1,135 @@
+import os
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+# Working hours free slots are looked for in, in the user's time zone
+TIMEZONE = os.getenv("CALENDAR_TIMEZONE", "UTC")
+WORK_DAY_START = os.getenv("WORK_DAY_START", "09:00")
+WORK_DAY_END = os.getenv("WORK_DAY_END", "17:00")
+
+# Slots start on multiples of this many minutes
+SLOT_STEP_MINUTES = 15
+
+Interval = Tuple[datetime, datetime]
+
+
+def parse_time(value: str) -> time:
+    return datetime.strptime(value, "%H:%M").time()
+
+
+def working_windows(first_day: date, days: int, tz: ZoneInfo, day_start: time, day_end: time, skip_weekends: bool = True) -> List[Interval]:
+    """Get the working hours of each day as UTC intervals, leaving out weekends when looking at more than one day."""
+    windows = []
+    for offset in range(days):
+        day = first_day + timedelta(days=offset)
+        if skip_weekends and days > 1 and day.weekday() >= 5:
+            continue
+        start = datetime.combine(day, day_start, tzinfo=tz).astimezone(timezone.utc)
+        end = datetime.combine(day, day_end, tzinfo=tz).astimezone(timezone.utc)
+        if end > start:
+            windows.append((start, end))
+    return windows
+
+
+def merge_intervals(intervals: List[Interval]) -> List[Interval]:
+    """Sort intervals and merge the ones that overlap or touch."""
+    merged: List[list] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def subtract_intervals(windows: List[Interval], busy: List[Interval]) -> List[Interval]:
+    """
+    Get the parts of windows not covered by busy.
+
+    Both lists must be sorted and free of overlaps, like merge_intervals returns, so
+    one sweep over the two lists is enough.
+    """
+    free = []
+    i = 0
+    for start, end in windows:
+        # Busy intervals that ended before this window can never matter again
+        while i < len(busy) and busy[i][1] <= start:
+            i += 1
+        cursor = start
+        j = i
+        while j < len(busy) and busy[j][0] < end:
+            if busy[j][0] > cursor:
+                free.append((cursor, busy[j][0]))
+            cursor = max(cursor, busy[j][1])
+            j += 1
+        if cursor < end:
+            free.append((cursor, end))
+    return free
+
+
+def parse_busy(calendars: Dict[str, dict]) -> Tuple[List[Interval], Dict[str, str]]:
+    """
+    Read a freebusy.query response.
+
+    Returns every busy interval merged into one list, and the reason for each calendar that could not be read.
+    """
+    busy, errors = [], {}
+    for calendar_id, calendar in calendars.items():
+        if calendar.get('errors'):
+            errors[calendar_id] = calendar['errors'][0].get('reason', 'unknown')
+        for period in calendar.get('busy', []):
+            busy.append((
+                datetime.fromisoformat(period['start'].replace('Z', '+00:00')),
+                datetime.fromisoformat(period['end'].replace('Z', '+00:00')),
+            ))
+    return merge_intervals(busy), errors
+
+
+def _align_up(value: datetime, step: timedelta) -> datetime:
+    epoch = datetime(1970, 1, 1, tzinfo=timezone.utc)
+    remainder = (value - epoch) % step
+    return value if not remainder else value + (step - remainder)
+
+
+def rank_slots(free: List[Interval], duration: timedelta, max_results: int = 5,
+               step: timedelta = timedelta(minutes=SLOT_STEP_MINUTES)) -> List[Interval]:
+    """
+    Pick the best non-overlapping slots of duration from the free intervals.
+
+    Slots start on multiples of step. Slots that leave a gap too short for another
+    meeting of the same length before or after them, inside their free interval,
+    come last, then earlier slots come first.
+    """
+    candidates = []
+    for free_start, free_end in free:
+        start = _align_up(free_start, step)
+        while start + duration <= free_end:
+            end = start + duration
+            before, after = start - free_start, free_end - end
+            fragments = (timedelta(0) < before < duration) + (timedelta(0) < after < duration)
+            candidates.append((fragments, start, end))
+            start += step
+
+    chosen: List[Interval] = []
+    for _, start, end in sorted(candidates):
+        if all(end <= other_start or start >= other_end for other_start, other_end in chosen):
+            chosen.append((start, end))
+            if len(chosen) >= max_results:
+                break
+    return sorted(chosen)
+
+
+def free_time(busy: List[Interval], first_day: date, days: int, duration: timedelta,
+              max_results: int = 5, tz_name: str = TIMEZONE, now: Optional[datetime] = None) -> Tuple[List[Interval], List[Interval]]:
+    """
+    Find free time in working hours from first_day for days days.
+
+    Returns the free intervals and the ranked slots of duration, all in UTC.
+    """
+    tz = ZoneInfo(tz_name)
+    windows = working_windows(first_day, days, tz, parse_time(WORK_DAY_START), parse_time(WORK_DAY_END))
+    now = now or datetime.now(timezone.utc)
+    windows = [(max(start, now), end) for start, end in windows if end > now]
+    free = subtract_intervals(windows, merge_intervals(busy))
+    return free, rank_slots(free, duration, max_results)
@@ -0,0 +1,202 @@
+"""
+One search over Gmail, Google Calendar and the web, for questions like "what do I have about the Acme contract?".
+
+Without it the model calls search_gmail, search_google_calendar_events and
+search_web one after another, with a round trip to the model between each.
+unified_search starts all three at once, or those of them whose tool group the
+session has, and waits SEARCH_DEADLINE seconds for them together. A source that
+has not answered by then is left out and named in the answer. Its cached fetch
+carries on, so asking again a moment later finds it. The results are ranked
+together, by how well their title and text match the query and then by how
+close to now they are, and read out as one numbered list whose numbers
+show_details and the calendar tools take.
+"""
+import asyncio
+import logging
+import os
+import re
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import List, Optional
+from zoneinfo import ZoneInfo
+
+from livekit.agents import function_tool, RunContext
+
+import tools
+from instrumentation import instrumented
+from paging import Cursor, paginate, take
+from render import Listed, budget, clip, remember_listed, render_listing
+from scheduling import TIMEZONE
+from session_data import get_session_data
+
+# Offered with either of the sources it searches that a session has, read by tool_registry
+TOOL_GROUPS = {'email': ['unified_search'], 'calendar': ['unified_search']}
+from web_tools import web_search
+
+# Seconds the sources get, all together, before the answer goes out without the slow ones
+SEARCH_DEADLINE = float(os.getenv("SEARCH_DEADLINE", "2.5"))
+# Name of each source as the answer mentions it
+SOURCES = {'email': 'Gmail', 'calendar': 'Google Calendar', 'web': 'The web'}
+# Words left out when matching results to a query
+STOPWORDS = {
+    'a', 'about', 'an', 'and', 'any', 'anything', 'are', 'do', 'for', 'from', 'have', 'i', 'in', 'is',
+    'me', 'my', 'of', 'on', 'or', 'the', 'to', 'what', 'with',
+}
+_WORD = re.compile(r"\w+")
+# Characters of the web results in the list, show_details reads the rest
+WEB_CHARS = 300
+# Days from now at which a result counts half as close as one happening now
+CLOSE_DAYS = 7
+
+
+@dataclass
+class Hit:
+    """A result from one source, with what it is ranked on."""
+    fields: List[str]
+    listed: Listed
+    title: str
+    text: str = ''
+    when: Optional[datetime] = None
+    score: float = 0.0
+
+
+def terms(text: str) -> set:
+    return {word for word in _WORD.findall(text.lower()) if word not in STOPWORDS}
+
+
+def rank(hit: Hit, query_terms: set, now: datetime) -> float:
+    """
+    Matching words in the title count double those in the text. Closeness to now only breaks near ties.
+
+    A when without a timezone, such as from a Date header ending in -0000, is taken to be UTC.
+    """
+    score = 0.0
+    if query_terms:
+        score += 2 * len(query_terms & terms(hit.title)) / len(query_terms)
+        score += len(query_terms & terms(hit.text)) / len(query_terms)
+    if hit.when is not None:
+        when = hit.when if hit.when.tzinfo is not None else hit.when.replace(tzinfo=timezone.utc)
+        days = abs((when - now).total_seconds()) / 86400
+        score += 0.5 / (1 + days / CLOSE_DAYS)
+    return score
+
+
+async def search_email(context: RunContext, query: str, count: int, now: datetime) -> List[Hit]:
+    """The newest messages matching query, from the local mirror or the Gmail API."""
+    cursor = Cursor('messages', {'query': query})
+    messages = await take(paginate(tools.message_pages(cursor, count, tools.get_user_id(context)), cursor), count)
+    hits = []
+    for message in messages:
+        fields, listed = tools.message_row(message, now)
+        try:
+            when = parsedate_to_datetime(message['date'])
+        except (TypeError, ValueError):
+            when = None
+        hits.append(Hit(
+            [f"Email: {fields[0]}"] + fields[1:], listed, message['subject'],
+            f"{message['sender']} {message.get('snippet', '')}", when,
+        ))
+    return hits
+
+
+async def search_calendar(context: RunContext, query: str, count: int, now: datetime) -> List[Hit]:
+    """Events on the primary calendar matching query, from the local copy or Google Calendar."""
+    service, stores = await tools.open_calendars(tools.get_user_id(context))
+    cursor = Cursor('event_search', {'search_term': query, 'calendar_ids': [store.calendar_id for store in stores]})
+    events = await take(paginate(tools.event_search_pages(cursor, count, service, stores), cursor), count)
+    hits = []
+    for event in events:
+        fields, listed = tools.event_row(event, now)
+        start = event['start'].get('dateTime', event['start'].get('date'))
+        when = datetime.fromisoformat(start.replace('Z', '+00:00'))
+        hits.append(Hit(
+            [f"Event: {fields[0]}"] + fields[1:], listed, listed.title,
+            f"{event.get('location', '')} {event.get('description', '')}",
+            when if when.tzinfo is not None else when.replace(tzinfo=now.tzinfo),
+        ))
+    return hits
+
+
+async def search_the_web(context: RunContext, query: str, count: int, now: datetime) -> List[Hit]:
+    """The web results, as one hit since the search returns them as one text."""
+    text = await web_search(query)
+    if not text.strip():
+        return []
+    return [Hit([f"Web: {clip(text, WEB_CHARS)}"], Listed('web', '', f"Web results for '{query}'", {'text': text}), '', text)]
+
+
+def pick(hits: List[Hit], count: int) -> List[Hit]:
+    """
+    The best count hits, best first, with a fair share of them from each source that found something.
+
+    Otherwise a full mailbox would fill the list and the one event about the subject would be left out.
+    """
+    ranked = sorted(hits, key=lambda hit: -hit.score)
+    sources = {hit.listed.kind for hit in ranked}
+    share = -(-count // len(sources)) if sources else 0
+    taken, chosen = {}, []
+    for hit in ranked:
+        if taken.get(hit.listed.kind, 0) < share:
+            taken[hit.listed.kind] = taken.get(hit.listed.kind, 0) + 1
+            chosen.append(hit)
+    chosen += [hit for hit in ranked if hit not in chosen][:max(0, count - len(chosen))]
+    return sorted(chosen, key=lambda hit: -hit.score)[:count]
+
+
+SEARCHES = {'email': search_email, 'calendar': search_calendar, 'web': search_the_web}
+
+
+@function_tool()
+@instrumented
+async def unified_search(
+    context: RunContext,  # type: ignore
+    query: str,
+    max_results: int = 8
+) -> str:
+    """
+    Search the user's emails, calendar and the web all at once, for questions like "what do I have about the Acme contract?".
+
+    Args:
+        query: Words to search for
+        max_results: Maximum number of results to return (default: 8)
+    """
+    try:
+        now = datetime.now(ZoneInfo(TIMEZONE))
+        # Only the sources of the session's tool groups are searched, all of them outside a session
+        session = get_session_data(context)
+        groups = session.groups if session is not None and session.groups is not None else set(SEARCHES)
+        searches = {source: search for source, search in SEARCHES.items() if source in groups}
+        # Mailbox and calendar searches want every word to match, so they get only the words that matter
+        keywords = ' '.join(word for word in (word.strip('?,.!"\'') for word in query.split()) if word and word.lower() not in STOPWORDS) or query
+        tasks = {source: asyncio.ensure_future(search(context, keywords, max_results, now)) for source, search in searches.items()}
+        try:
+            _, pending = await asyncio.wait(tasks.values(), timeout=SEARCH_DEADLINE) if tasks else (set(), set())
+        finally:
+            # Cached fetches are shielded and finish anyway, for the next time this is asked
+            for task in tasks.values():
+                task.cancel()
+
+        hits, missing = [], []
+        for source, task in tasks.items():
+            if task in pending:
+                missing.append(f"{SOURCES[source]} did not answer in time.")
+            elif task.exception() is not None:
+                logging.warning(f"Unified search of {source} for '{query}' failed: {task.exception()}")
+                missing.append(f"{SOURCES[source]} could not be searched.")
+            else:
+                hits += task.result()
+
+        query_terms = terms(query)
+        for hit in hits:
+            hit.score = rank(hit, query_terms, now)
+        hits = pick(hits, max_results)
+
+        remember_listed(context, [hit.listed for hit in hits])
+        if not hits:
+            return ' '.join([f"Found nothing about '{query}'."] + missing)
+        return render_listing(f"Found about '{query}':", [hit.fields for hit in hits], budget('unified_search'), footer=' '.join(missing))
+
+    except Exception as e:
+        logging.error(f"Error in unified search: {e}")
+        return f"An error occurred while searching for '{query}': {str(e)}"
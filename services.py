@@ -0,0 +1,227 @@
+import hashlib
+import os
+import pickle
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from credential_store import get_credential_store
+from executor import get_executor
+from token_refresh import atomic_write, coordinator, file_lock
+
+# Most requests one batch call to a Google API may carry
+BATCH_SIZE = 50
+
+# Token file of each API, used when there is no credential store
+TOKEN_FILES = {
+    'gmail': 'gmail_token.pickle',
+    'calendar': 'calender_token.pickle',
+}
+
+_lock = threading.Lock()
+_login_lock = threading.Lock()
+_credentials = {}   # token file -> (mtime, creds)
+_clients = {}       # (api, version, credential identity) -> service
+_local = threading.local()
+
+
+def credential_identity(creds) -> str:
+    """Get a stable identity for a set of credentials that survives token refreshes."""
+    raw = f"{getattr(creds, 'client_id', '')}:{getattr(creds, 'refresh_token', '')}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:16]
+
+
+def _read_token(token_file: str):
+    if not os.path.exists(token_file):
+        return None
+    with open(token_file, 'rb') as token:
+        return pickle.load(token)
+
+
+def _remember(token_file: str, creds) -> None:
+    mtime = os.path.getmtime(token_file) if os.path.exists(token_file) else None
+    with _lock:
+        _credentials[token_file] = (mtime, creds)
+
+
+def _save_credentials(creds, token_file: str) -> None:
+    atomic_write(token_file, pickle.dumps(creds))
+    _remember(token_file, creds)
+
+
+def has_credentials(user_id: Optional[str], api: str) -> bool:
+    """
+    Whether get_service has credentials to use for a user, the same way it picks them.
+
+    With a credential store only the user's own stored credentials count, the shared
+    token files belong to whoever runs the worker. Without one the token file or a
+    credentials.json to sign in from does.
+    """
+    store = get_credential_store()
+    if store is not None:
+        return bool(user_id) and store.has(user_id, api)
+    return os.path.exists(TOKEN_FILES[api]) or os.path.exists('credentials.json')
+
+
+def load_credentials(token_file: str, scopes: list, name: str = "Google"):
+    """
+    Load the credentials saved in a token file, keeping them in memory between calls.
+
+    Expired tokens are refreshed through the refresh coordinator, so concurrent
+    sessions and other worker processes share a single refresh.
+
+    Returns the credentials and None, or None and an error message.
+    """
+    mtime = os.path.getmtime(token_file) if os.path.exists(token_file) else None
+    with _lock:
+        cached = _credentials.get(token_file)
+    if cached and cached[0] == mtime:
+        creds = cached[1]
+    else:
+        creds = _read_token(token_file)
+        if creds is not None:
+            _remember(token_file, creds)
+
+    if creds and not creds.valid and creds.refresh_token:
+        creds = coordinator.refresh(
+            token_file, creds,
+            read_saved=lambda: _read_token(token_file),
+            save=lambda fresh: _save_credentials(fresh, token_file)
+        )
+        _remember(token_file, creds)
+
+    if not creds or not creds.valid:
+        if not os.path.exists('credentials.json'):
+            return None, f"{name} credentials not found. Please ensure credentials.json exists."
+
+        # Only open one login page at a time
+        with _login_lock:
+            creds = _read_token(token_file)
+            if not creds or not creds.valid:
+                from google_auth_oauthlib.flow import InstalledAppFlow
+                flow = InstalledAppFlow.from_client_secrets_file('credentials.json', scopes)
+                creds = flow.run_local_server(port=0)
+                with file_lock(token_file):
+                    _save_credentials(creds, token_file)
+
+    return creds, None
+
+
+def schedule_refresh(creds, token_file: str) -> None:
+    """Refresh the token on the thread pool if it is about to expire."""
+    coordinator.refresh_soon(
+        get_executor(), token_file, creds,
+        read_saved=lambda: _read_token(token_file),
+        save=lambda fresh: _save_credentials(fresh, token_file),
+        on_done=lambda fresh: _remember(token_file, fresh)
+    )
+
+
+def _request_builder(connection: tuple, current_credentials):
+    # httplib2 is not thread safe, so each pool thread gets its own connection for each
+    # user and API. Requests must be built on the thread that executes them, since the
+    # connection is picked here. It always uses the newest credentials from current_credentials()
+    import google_auth_httplib2
+    import httplib2
+    from googleapiclient.http import HttpRequest
+
+    def build_request(http, *args, **kwargs):
+        creds = current_credentials()
+        https = getattr(_local, 'https', None)
+        if https is None:
+            https = _local.https = {}
+        authorized = https.get(connection)
+        if authorized is None:
+            authorized = https[connection] = google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http())
+        elif authorized.credentials is not creds:
+            # Reloaded or refreshed credentials reuse the thread's connection
+            authorized.credentials = creds
+        return HttpRequest(authorized, *args, **kwargs)
+    return build_request
+
+
+def get_service(api: str, version: str, token_file: str, scopes: list, name: str = "Google",
+                user_id: Optional[str] = None):
+    """
+    Get a Google API client, building it only the first time for each set of credentials.
+
+    With a credential store the credentials stored for user_id are used, and a user
+    without any gets an error rather than the shared account. Without a store the
+    shared token file is used. Discovery documents are read from the copy bundled
+    with googleapiclient so no discovery request is made at runtime.
+
+    Returns the service and None, or None and an error message.
+    """
+    store = get_credential_store()
+    if store is not None:
+        if not user_id or not store.has(user_id, api):
+            return None, f"{name} is not connected for this user. Please sign in first."
+        creds = store.get_valid(user_id, api)
+        if creds is None:
+            return None, f"{name} credentials for this user have expired. Please sign in again."
+        current_credentials = lambda: store.peek(user_id, api) or creds
+        owner = user_id
+    else:
+        creds, error = load_credentials(token_file, scopes, name)
+        if error:
+            return None, error
+        schedule_refresh(creds, token_file)
+        current_credentials = lambda: _credentials[token_file][1]
+        owner = token_file
+
+    key = (api, version, credential_identity(creds))
+    service = _clients.get(key)
+    if service is not None:
+        return service, None
+
+    try:
+        import google_auth_httplib2
+        import httplib2
+        from googleapiclient.discovery import build
+
+        with _lock:
+            service = _clients.get(key)
+            if service is None:
+                service = build(
+                    api, version,
+                    http=google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http()),
+                    requestBuilder=_request_builder((api, version, owner), current_credentials),
+                    static_discovery=True,
+                    cache_discovery=False,
+                )
+                _clients[key] = service
+        return service, None
+    except Exception as e:
+        return None, f"Failed to build {name} service: {str(e)}"
+
+
+def clear_cache() -> None:
+    """Forget every cached credential and client."""
+    with _lock:
+        _credentials.clear()
+        _clients.clear()
+
+
+def execute_batch(service, requests: List[Tuple[str, object]], batch_size: int = BATCH_SIZE) -> Dict[str, tuple]:
+    """
+    Send many API requests through the Google batch endpoint, batch_size of them per round trip.
+
+    Blocks, so call it on the thread pool, and build the requests on the same thread
+    since the batch goes out over the connection the first request was built with.
+
+    Args:
+        service: The API client the requests were made with
+        requests: (request ID, request) pairs, the IDs must be unique
+
+    Returns a dict of request ID to (response, None) or (None, exception).
+    """
+    results = {}
+
+    def on_response(request_id, response, exception):
+        results[request_id] = (None, exception) if exception is not None else (response, None)
+
+    for start in range(0, len(requests), batch_size):
+        batch = service.new_batch_http_request(callback=on_response)
+        for request_id, request in requests[start:start + batch_size]:
+            batch.add(request, request_id=request_id)
+        batch.execute()
+    return results
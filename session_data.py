@@ -0,0 +1,35 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
+
+from paging import Cursor
+
+if TYPE_CHECKING:
+    from render import Listed
+    from video_input import AdaptiveVideo
+
+
+@dataclass
+class SessionData:
+    """State for one LiveKit session, available to tools as context.userdata."""
+    user_id: str
+    # City get_weather reports on when none is named
+    home_city: Optional[str] = None
+    # Where the last message or event listing stopped, for "read me the next ten"
+    cursor: Optional[Cursor] = None
+    # Slots offered by the last find_free_slots as UTC (start, end), so one can be booked by its number
+    slots: List[Tuple[datetime, datetime]] = field(default_factory=list)
+    # Emails, events and calendars of the last listing by their number, with the IDs and details left out of it
+    listed: Dict[int, "Listed"] = field(default_factory=dict)
+    # Decides which camera frames the model gets, None unless VIDEO_INPUT is adaptive
+    video: Optional["AdaptiveVideo"] = None
+    # Tool groups the session was given, such as {"email", "web"}, None when every group is allowed
+    groups: Optional[Set[str]] = None
+
+
+def get_session_data(context) -> Optional[SessionData]:
+    """Get the session's SessionData from a tool's RunContext, or None when the tool is called outside a session."""
+    try:
+        return context.userdata
+    except (AttributeError, ValueError):
+        return None
@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The modules live next to agent.py, and the fake backends with the benchmarks
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+
+@pytest.fixture(autouse=True)
+def fresh_semaphores(monkeypatch):
+    """Each test runs its own event loop, and a service's semaphore is bound to the first loop that waits on it."""
+    import executor
+    monkeypatch.setattr(executor, '_semaphores', {})
@@ -0,0 +1,46 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('googleapiclient')
+
+from calendar_store import CALENDAR_KEY, CalendarStore
+from fakes import FakeCalendar
+from render import remember_listed
+from session_data import SessionData
+
+
+def test_stored_events_note_the_calendar_they_are_in():
+    store = CalendarStore('team@example.com')
+    store.put(FakeCalendar._event('e1', 'Standup', datetime.utcnow(), 30))
+
+    assert store.get('e1')[CALENDAR_KEY] == 'team@example.com'
+
+
+def test_listed_events_are_deleted_from_their_own_calendar():
+    tools = pytest.importorskip('tools')
+    context = SimpleNamespace(userdata=SessionData('alice'))
+    team = dict(FakeCalendar._event('e1', 'Standup', datetime.utcnow(), 30), **{CALENDAR_KEY: 'team@example.com'})
+    mine = FakeCalendar._event('e2', 'Lunch', datetime.utcnow(), 60)
+    remember_listed(context, [tools.event_row(event, datetime.now())[1] for event in (team, mine)])
+
+    assert tools.resolve_event(context, '1') == ('team@example.com', 'e1')
+    assert tools.resolve_event(context, '2') == (tools.CALENDAR_ID, 'e2')
+    assert tools.resolve_event(context, 'e3') == (tools.CALENDAR_ID, 'e3')
+    with pytest.raises(LookupError):
+        tools.resolve_event(context, '3')
+
+
+def test_deleting_from_a_calendar_not_loaded_yet_does_not_sync_it(monkeypatch):
+    tools = pytest.importorskip('tools')
+    calendar = FakeCalendar(50, latency=0)
+    monkeypatch.setattr(tools, 'get_google_calendar_service', lambda user_id=None: (calendar, None))
+    context = SimpleNamespace(userdata=SessionData('nobody-loaded-yet'))
+
+    answer = asyncio.run(tools.delete_google_calendar_event(context, 'e000007'))
+
+    assert 'deleted successfully' in answer
+    assert calendar.backend.round_trips == 1
+    assert 'e000007' not in calendar.event_ids()
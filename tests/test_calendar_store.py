@@ -0,0 +1,54 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip('googleapiclient')
+
+import calendar_store
+from calendar_store import FUTURE_DAYS, PAST_DAYS, CalendarStore
+from fakes import FakeCalendar
+
+
+@pytest.fixture(autouse=True)
+def no_stores(monkeypatch):
+    monkeypatch.setattr(calendar_store, '_stores', {})
+    monkeypatch.setattr(calendar_store, '_sync_tasks', {})
+    monkeypatch.setattr(calendar_store, '_first_syncs', {})
+
+
+def test_callers_during_the_first_sync_share_it():
+    calendar = FakeCalendar(200, latency=0.05)
+
+    async def scenario():
+        get_store = lambda: calendar_store.get_calendar_store('primary', calendar, lambda user_id: (calendar, None))
+        # The prefetch gives up first, which must not cancel the sync the tool call is waiting for
+        prefetch = asyncio.ensure_future(get_store())
+        first_call = asyncio.ensure_future(get_store())
+        await asyncio.sleep(0.01)
+        prefetch.cancel()
+        store = await first_call
+        for task in calendar_store._sync_tasks.values():
+            task.cancel()
+        return store
+
+    store = asyncio.run(scenario())
+    assert store.ready
+    assert calendar.backend.round_trips == 1
+
+
+def test_the_store_keeps_a_bounded_window():
+    calendar = FakeCalendar(50, latency=0)
+    now = datetime.utcnow().replace(microsecond=0)
+    far = FakeCalendar._event('far', 'Every week forever', now + timedelta(days=FUTURE_DAYS + 30), 30)
+    calendar.by_id['far'] = far
+    store = CalendarStore('primary')
+
+    store.full_sync(calendar)
+    store.put(far)
+
+    assert store.get('far') is None
+    utc_now = datetime.now(timezone.utc)
+    assert store.covers(utc_now, utc_now + timedelta(days=7))
+    assert not store.covers(utc_now - timedelta(days=PAST_DAYS + 1), utc_now)
+    assert not store.covers(utc_now, utc_now + timedelta(days=FUTURE_DAYS + 1))
@@ -0,0 +1,51 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('googleapiclient')
+tools = pytest.importorskip('tools')
+
+from calendar_store import CalendarStore
+from fakes import FakeCalendar
+from session_data import SessionData
+
+ZONE = 'America/New_York'
+
+
+@pytest.fixture
+def new_york(monkeypatch):
+    monkeypatch.setattr(tools, 'TIMEZONE', ZONE)
+
+
+def test_an_event_is_created_at_the_time_given_in_the_calendars_zone(new_york):
+    calendar = FakeCalendar(0, latency=0)
+    start = tools.local_datetime('2026-01-15', '09:00')
+
+    event = tools.insert_event_request(calendar, 'Standup', start, start + timedelta(minutes=30)).execute()
+
+    assert event['start'] == {'dateTime': '2026-01-15T09:00:00-05:00', 'timeZone': ZONE}
+    now = datetime.now(tools.ZoneInfo(ZONE))
+    assert '09:00 to 09:30' in tools.event_when(event, now)
+
+
+def test_a_day_view_covers_the_day_in_the_calendars_zone(new_york, monkeypatch):
+    calendar = FakeCalendar(0, latency=0)
+    for event_id, start in [('late', '2026-01-15T23:30:00-05:00'), ('next', '2026-01-16T00:30:00-05:00'),
+                            ('before', '2026-01-14T23:30:00-05:00')]:
+        end = start.replace(':30:00', ':45:00')
+        calendar.by_id[event_id] = {'id': event_id, 'summary': event_id.title(), 'start': {'dateTime': start}, 'end': {'dateTime': end}}
+    store = CalendarStore('primary')
+    store.full_sync(calendar)
+
+    async def open_calendars(user_id, calendar_ids=None, all_calendars=False):
+        return calendar, [store]
+
+    monkeypatch.setattr(tools, 'open_calendars', open_calendars)
+    context = SimpleNamespace(userdata=SessionData('alice'))
+
+    answer = asyncio.run(tools.view_google_calendar(context, date='2026-01-15'))
+
+    assert 'Late' in answer
+    assert 'Next' not in answer and 'Before' not in answer
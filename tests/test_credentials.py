@@ -0,0 +1,116 @@
+import asyncio
+import pickle
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('cryptography')
+pytest.importorskip('google.oauth2')
+
+from cryptography.fernet import Fernet
+from google.oauth2.credentials import Credentials
+
+import credential_store
+import services
+from credential_store import CredentialStore
+from executor import AUTH_TIMEOUT, run_blocking
+from fakes import FakeTokenEndpoint
+from token_refresh import RefreshCoordinator
+from tool_registry import ToolRegistry
+
+
+def credentials(token: str, expires_in: timedelta = timedelta(hours=1)) -> Credentials:
+    return Credentials(
+        token=token, refresh_token=f"{token}-refresh", client_id='client', client_secret='secret',
+        token_uri='https://oauth2.googleapis.com/token', expiry=datetime.utcnow() + expires_in,
+    )
+
+
+@pytest.fixture
+def shared_token(tmp_path, monkeypatch):
+    """The operator's own token files, as a single-user install has them."""
+    monkeypatch.chdir(tmp_path)
+    for token_file in services.TOKEN_FILES.values():
+        with open(token_file, 'wb') as f:
+            pickle.dump(credentials('operator'), f)
+    services.clear_cache()
+    yield
+    services.clear_cache()
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch, shared_token):
+    store = CredentialStore(str(tmp_path / 'credentials'), Fernet.generate_key())
+    store.save('alice', 'gmail', credentials('alice'))
+    monkeypatch.setattr(credential_store, '_store', store)
+    return store
+
+
+def test_without_a_store_the_shared_token_files_are_used(shared_token, monkeypatch):
+    monkeypatch.setattr(credential_store, '_store', None)
+    monkeypatch.setattr(credential_store, 'STORE_KEY', None)
+
+    assert services.has_credentials(None, 'gmail')
+    assert services.has_credentials('anyone', 'calendar')
+
+
+def test_user_with_stored_credentials_has_them(store):
+    assert services.has_credentials('alice', 'gmail')
+    assert not services.has_credentials('alice', 'calendar')
+
+
+def test_user_without_stored_credentials_does_not_get_the_shared_account(store):
+    assert not services.has_credentials('mallory', 'gmail')
+    assert not services.has_credentials(None, 'gmail')
+
+    for user_id in ('mallory', None):
+        service, error = services.get_service('gmail', 'v1', services.TOKEN_FILES['gmail'], [], "Gmail", user_id)
+        assert service is None
+        assert 'not connected' in error
+
+
+def test_google_tools_are_only_offered_to_users_with_stored_credentials(store):
+    registry = ToolRegistry(entry_point_group=None)
+
+    assert 'email' in registry.enabled_groups('alice', ['email', 'calendar', 'web'])
+    assert 'calendar' not in registry.enabled_groups('alice', ['email', 'calendar', 'web'])
+    assert registry.enabled_groups('mallory', ['email', 'calendar', 'web']) == {'web'}
+
+
+def test_many_sessions_of_many_users_at_once_each_get_their_own_credentials(store, monkeypatch):
+    users, sessions = [f"user-{i}" for i in range(6)], 8
+    for user_id in users:
+        store.save(user_id, 'gmail', credentials(user_id, expires_in=-timedelta(minutes=1)))
+    # Start from disk, as a new process does
+    store._cache.clear()
+    endpoint = FakeTokenEndpoint(latency=0.05)
+    monkeypatch.setattr(credential_store, 'coordinator', RefreshCoordinator(request_factory=lambda: endpoint))
+    reads, lock = Counter(), threading.Lock()
+    read = store._read
+
+    def counted_read(path):
+        with lock:
+            reads[path] += 1
+        return read(path)
+
+    monkeypatch.setattr(store, '_read', counted_read)
+
+    async def scenario():
+        return await asyncio.gather(*(
+            run_blocking('gmail', services.get_service, 'gmail', 'v1', services.TOKEN_FILES['gmail'], [], "Gmail",
+                         user_id, timeout=AUTH_TIMEOUT, upstream=False)
+            for user_id in users for _ in range(sessions)
+        ))
+
+    results = asyncio.run(scenario())
+
+    for i, (service, error) in enumerate(results):
+        assert error is None
+        assert service._http.credentials.refresh_token == f"{users[i // sessions]}-refresh"
+    assert endpoint.backend.round_trips == len(users)
+    # Each file is decrypted once to load it and once more under the refresh lock,
+    # to check that no other process refreshed it first
+    assert sorted(reads.values()) == [2] * len(users)
+    assert {store._path(user_id, 'gmail') for user_id in users} == set(reads)
@@ -0,0 +1,144 @@
+import asyncio
+import gc
+import threading
+import time
+
+import pytest
+
+import executor
+from executor import ToolTimeoutError, run_blocking
+
+# Longest the event loop may go without running while tools work, in seconds
+MAX_LOOP_LAG = 0.02
+
+
+async def watch_loop(stop: asyncio.Event, interval: float = 0.002) -> float:
+    """Tick every interval until stop is set. Returns the longest a tick came late."""
+    loop = asyncio.get_running_loop()
+    worst = 0.0
+    while not stop.is_set():
+        due = loop.time() + interval
+        await asyncio.sleep(interval)
+        worst = max(worst, loop.time() - due)
+    return worst
+
+
+def start_pool_threads() -> None:
+    """Start every pool thread first, since a worker process runs with them already started."""
+    pool = executor.get_executor()
+    for work in [pool.submit(time.sleep, 0.01) for _ in range(executor.MAX_WORKERS)]:
+        work.result()
+
+
+@pytest.fixture(autouse=True)
+def fresh_executor(monkeypatch):
+    monkeypatch.setattr(executor, '_semaphores', {})
+    yield
+    executor.shutdown(wait=True)
+
+
+def test_loop_keeps_running_while_blocking_calls_run():
+    async def scenario():
+        stop = asyncio.Event()
+        watcher = asyncio.create_task(watch_loop(stop))
+        await asyncio.gather(*(run_blocking('gmail', time.sleep, 0.1) for _ in range(12)))
+        stop.set()
+        return await watcher
+
+    start_pool_threads()
+    assert asyncio.run(scenario()) < MAX_LOOP_LAG
+
+
+def test_service_limit_caps_calls_in_flight(monkeypatch):
+    monkeypatch.setitem(executor.SERVICE_LIMITS, 'gmail', 2)
+    running, most = [0], [0]
+    lock = threading.Lock()
+
+    def work():
+        with lock:
+            running[0] += 1
+            most[0] = max(most[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+
+    async def scenario():
+        await asyncio.gather(*(run_blocking('gmail', work) for _ in range(6)))
+
+    asyncio.run(scenario())
+    assert most[0] == 2
+
+
+def test_timed_out_call_keeps_its_slot_until_its_thread_returns(monkeypatch):
+    monkeypatch.setitem(executor.SERVICE_LIMITS, 'gmail', 1)
+    hung_done = threading.Event()
+    started = []
+
+    def hang():
+        time.sleep(0.3)
+        hung_done.set()
+
+    def next_call():
+        started.append(hung_done.is_set())
+
+    async def scenario():
+        with pytest.raises(ToolTimeoutError):
+            await run_blocking('gmail', hang, timeout=0.05)
+        await run_blocking('gmail', next_call)
+
+    asyncio.run(scenario())
+    assert started == [True]
+
+
+def test_cancelled_call_that_never_started_gives_its_slot_back(monkeypatch):
+    monkeypatch.setitem(executor.SERVICE_LIMITS, 'gmail', 1)
+    ran = []
+
+    async def scenario():
+        first = asyncio.create_task(run_blocking('gmail', time.sleep, 0.1))
+        queued = asyncio.create_task(run_blocking('gmail', ran.append, 'queued'))
+        await asyncio.sleep(0.01)
+        queued.cancel()
+        await first
+        await asyncio.wait_for(run_blocking('gmail', ran.append, 'after'), 1)
+
+    asyncio.run(scenario())
+    assert ran == ['after']
+
+
+def test_tools_do_not_block_the_loop():
+    pytest.importorskip('livekit.agents')
+    pytest.importorskip('googleapiclient')
+    from fakes import FakeCalendar, FakeGmail, FakeSearch
+    from bench_tools import install_fakes, stop_sync_loops
+    import tools
+    import web_tools
+
+    # Every fake round trip sleeps, so a call made on the loop would show as lag
+    install_fakes(tools, web_tools, FakeGmail(200, 0.05), FakeCalendar(100, 0.05), FakeSearch(0.05))
+
+    async def scenario():
+        stop = asyncio.Event()
+        watcher = asyncio.create_task(watch_loop(stop))
+        results = await asyncio.gather(
+            tools.read_messages(None, query='acme'),
+            tools.search_gmail(None, search_query='budget'),
+            tools.view_google_calendar(None),
+            tools.search_google_calendar_events(None, search_term='roadmap'),
+            web_tools.search_web(None, query='acme contract news'),
+        )
+        stop.set()
+        lag = await watcher
+        await stop_sync_loops()
+        return results, lag
+
+    start_pool_threads()
+    # A garbage collection stops every thread whatever the loop is doing, so it is kept out of the measurement
+    gc.collect()
+    gc.disable()
+    try:
+        results, lag = asyncio.run(scenario())
+    finally:
+        gc.enable()
+    assert all(isinstance(result, str) for result in results)
+    assert lag < MAX_LOOP_LAG
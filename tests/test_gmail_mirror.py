@@ -0,0 +1,140 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+pytest.importorskip('googleapiclient')
+
+import gmail_mirror
+from fakes import FakeGmail
+from gmail_mirror import INITIAL_SYNC_MESSAGES, GmailMirror, get_mirror
+
+
+@pytest.fixture
+def gmail():
+    return FakeGmail(50, latency=0)
+
+
+@pytest.fixture
+def mirror(tmp_path, gmail):
+    mirror = GmailMirror(str(tmp_path / 'mirror.db'))
+    mirror.sync(gmail)
+    gmail.backend.round_trips = 0
+    return mirror
+
+
+def ids(messages) -> list:
+    return [message['id'] for message in messages]
+
+
+def test_first_sync_stores_the_newest_messages(tmp_path):
+    gmail = FakeGmail(INITIAL_SYNC_MESSAGES + 20, latency=0)
+    mirror = GmailMirror(str(tmp_path / 'mirror.db'))
+
+    assert not mirror.ready
+    assert mirror.sync(gmail) == INITIAL_SYNC_MESSAGES
+
+    assert mirror.ready and mirror.history_id == str(gmail.history_id)
+    assert ids(mirror.recent(5)) == ids(gmail.mailbox[:5])
+
+
+def test_sync_applies_new_and_deleted_messages_from_history(mirror, gmail):
+    gone = gmail.mailbox[3]['id']
+    new = gmail.receive('Zanzibar offsite plan', snippet='Flights are booked')
+    gmail.delete(gone)
+
+    assert mirror.sync(gmail) == 2
+
+    assert ids(mirror.search('zanzibar')) == [new]
+    assert mirror.recent(1)[0]['subject'] == 'Zanzibar offsite plan'
+    assert gone not in ids(mirror.recent(100))
+    assert mirror.history_id == str(gmail.history_id)
+    # One history page and one batch for the new message's headers, no full resync
+    assert gmail.backend.round_trips == 2
+
+
+def test_sync_follows_every_history_page(mirror, gmail):
+    new = [gmail.receive(f"Quokka report {i}") for i in range(2 * gmail.HISTORY_PAGE_SIZE + 1)]
+
+    mirror.sync(gmail)
+
+    assert sorted(ids(mirror.search('quokka', max_results=10))) == sorted(new)
+
+
+def test_message_added_and_deleted_between_syncs_is_not_fetched(mirror, gmail):
+    brief = gmail.receive('Short lived')
+    gmail.delete(brief)
+
+    mirror.sync(gmail)
+
+    assert mirror.search('short lived') == []
+    # Only the history page, no batch for the deleted message
+    assert gmail.backend.round_trips == 1
+
+
+def test_label_changes_are_applied(mirror, gmail):
+    trashed = gmail.mailbox[0]['id']
+    gmail.add_label(trashed, 'TRASH')
+
+    mirror.sync(gmail)
+
+    assert trashed not in ids(mirror.recent(100))
+
+
+def test_sync_with_nothing_new_makes_one_round_trip(mirror, gmail):
+    assert mirror.sync(gmail) == 0
+    assert gmail.backend.round_trips == 1
+
+
+def test_expired_history_falls_back_to_a_full_sync(mirror, gmail):
+    gone = gmail.mailbox[0]['id']
+    gmail.delete(gone)
+    gmail.expire_history()
+
+    assert mirror.sync(gmail) == len(gmail.mailbox)
+
+    assert gone not in ids(mirror.recent(100))
+    assert mirror.history_id == str(gmail.history_id)
+
+
+def test_words_only_in_the_body_are_found(mirror, gmail):
+    wanted = gmail.mailbox[7]['id']
+    assert wanted not in gmail.mailbox[7]['snippet']
+
+    assert ids(mirror.search(f"reference {wanted}")) == [wanted]
+    assert len(mirror.search('reference', max_results=100)) == len(gmail.mailbox)
+
+
+def test_a_mirror_without_bodies_is_synced_again(tmp_path, gmail):
+    path = str(tmp_path / 'mirror.db')
+    old = sqlite3.connect(path)
+    old.executescript("""
+        CREATE VIRTUAL TABLE messages_fts USING fts5 (id UNINDEXED, subject, sender, date, snippet);
+        CREATE TABLE state (key TEXT PRIMARY KEY, value TEXT);
+        INSERT INTO state VALUES ('history_id', '1');
+    """)
+    old.commit()
+    old.close()
+
+    mirror = GmailMirror(path)
+
+    assert not mirror.ready
+    mirror.sync(gmail)
+    assert ids(mirror.search(gmail.mailbox[0]['id'])) == [gmail.mailbox[0]['id']]
+
+
+def test_callers_opening_a_mirror_at_once_share_it(tmp_path, monkeypatch, gmail):
+    monkeypatch.setattr(gmail_mirror, 'MIRROR_FILE', str(tmp_path / 'mirror.db'))
+    monkeypatch.setattr(gmail_mirror, '_mirrors', {})
+    monkeypatch.setattr(gmail_mirror, '_sync_tasks', {})
+
+    async def main():
+        mirrors = await asyncio.gather(*(get_mirror(lambda user_id: (gmail, None), 'alice') for _ in range(4)))
+        for task in gmail_mirror._sync_tasks.values():
+            task.cancel()
+        return mirrors
+
+    mirrors = asyncio.run(main())
+
+    assert all(mirror is mirrors[0] for mirror in mirrors)
+    assert list(gmail_mirror._mirrors) == ['alice']
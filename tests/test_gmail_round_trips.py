@@ -0,0 +1,47 @@
+import pytest
+
+pytest.importorskip('googleapiclient')
+
+from fakes import FakeGmail
+from gmail_mirror import GMAIL_BATCH_SIZE, MESSAGE_HEADERS, fetch_message_metadata
+
+
+def list_one_by_one(service, max_results: int) -> list:
+    """How the messages were listed before: one full get per message after the list."""
+    result = service.users().messages().list(userId='me', maxResults=max_results).execute()
+    return [service.users().messages().get(userId='me', id=m['id']).execute() for m in result['messages']]
+
+
+def test_listing_ten_messages_takes_two_round_trips():
+    tools = pytest.importorskip('tools')
+    gmail = FakeGmail(200, latency=0)
+
+    found, next_page = tools.list_messages(gmail, max_results=10)
+
+    assert len(found) == 10 and next_page
+    assert gmail.backend.round_trips == 2
+    assert all(message['subject'] != 'No Subject' and message['snippet'] for message in found)
+
+
+def test_listing_downloads_a_fraction_of_the_full_messages():
+    tools = pytest.importorskip('tools')
+    batched, one_by_one = FakeGmail(200, latency=0), FakeGmail(200, latency=0)
+
+    tools.list_messages(batched, max_results=10)
+    list_one_by_one(one_by_one, 10)
+
+    assert one_by_one.backend.round_trips == 11
+    assert batched.backend.bytes * 10 < one_by_one.backend.bytes
+
+
+def test_metadata_is_fetched_in_batches_with_only_the_headers_read():
+    gmail = FakeGmail(200, latency=0)
+    message_ids = [message['id'] for message in gmail.mailbox[:120]]
+
+    messages = fetch_message_metadata(gmail, message_ids)
+
+    assert sorted(messages) == sorted(message_ids)
+    assert gmail.backend.round_trips == -(-120 // GMAIL_BATCH_SIZE)
+    for message in messages.values():
+        assert {header['name'] for header in message['payload']['headers']} <= set(MESSAGE_HEADERS)
+        assert 'body' not in message['payload']
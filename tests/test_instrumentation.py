@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+import instrumentation
+from instrumentation import ERROR_RESULT, instrumented
+
+
+@pytest.fixture(autouse=True)
+def fresh_metrics(monkeypatch):
+    monkeypatch.setattr(instrumentation, 'MODE', 'low')
+    monkeypatch.setattr(instrumentation.ERRORS, '_values', {})
+    monkeypatch.setattr(instrumentation.RESULT_BYTES, '_series', {})
+
+
+def call(answer):
+    @instrumented
+    async def fake_tool():
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    return asyncio.run(fake_tool())
+
+
+@pytest.mark.parametrize('answer', [
+    "An error occurred while searching Gmail: timed out",
+    "Google Calendar authentication failed: token revoked",
+    "Gmail API error: <HttpError 500>",
+    "Could not retrieve weather for Paris.",
+])
+def test_error_messages_are_counted(answer):
+    assert ERROR_RESULT.match(answer)
+    call(answer)
+    assert instrumentation.ERRORS._values == {'fake_tool': 1}
+
+
+@pytest.mark.parametrize('answer', [
+    "No messages found matching query: 'error'",
+    "1. Re: API error: what happened, from Bob, today 09:30",
+    "Which city would you like the weather for?",
+])
+def test_ordinary_answers_are_not_counted(answer):
+    assert not ERROR_RESULT.match(answer)
+    call(answer)
+    assert instrumentation.ERRORS._values == {}
+
+
+def test_raising_is_counted():
+    with pytest.raises(RuntimeError):
+        call(RuntimeError('boom'))
+    assert instrumentation.ERRORS._values == {'fake_tool': 1}
+
+
+def test_result_size_is_in_bytes():
+    call("Zürich: ⛅️ +12°C")
+    assert instrumentation.RESULT_BYTES._series['fake_tool'][-2] == len("Zürich: ⛅️ +12°C".encode('utf-8'))
@@ -0,0 +1,68 @@
+import asyncio
+from collections import OrderedDict
+
+import pytest
+
+pytest.importorskip('numpy')
+
+import memory
+from memory import LocalMemoryBackend, UserMemory, VectorIndex
+
+
+@pytest.fixture
+def backend(tmp_path):
+    return LocalMemoryBackend(str(tmp_path / 'memories.json'))
+
+
+def test_remembered_messages_are_recalled_and_kept_for_the_next_session(backend):
+    alice = UserMemory(backend, 'alice')
+    asyncio.run(alice.load())
+    asyncio.run(alice.remember("My sister Jane lives in Lisbon"))
+    asyncio.run(alice.remember("I am allergic to peanuts"))
+
+    assert alice.recall("when am I seeing my sister in Lisbon?", k=1) == ["My sister Jane lives in Lisbon"]
+
+    next_session = UserMemory(backend, 'alice')
+    assert asyncio.run(next_session.load()) == 2
+    assert next_session.recall("peanuts", k=1) == ["I am allergic to peanuts"]
+    assert UserMemory(backend, 'bob').recall("peanuts") == []
+
+
+def test_memories_are_read_again_only_after_reload_after(backend):
+    alice = UserMemory(backend, 'alice')
+    asyncio.run(alice.load())
+    # Another process saves a memory
+    backend.add([{'role': 'user', 'content': "I play the cello"}], 'alice')
+
+    assert asyncio.run(alice.load()) == 0
+
+    alice.loaded_at -= memory.RELOAD_AFTER + 1
+    assert asyncio.run(alice.load()) == 1
+    assert alice.recall("cello") == ["I play the cello"]
+
+
+def test_only_the_most_recently_seen_users_are_kept(backend, monkeypatch):
+    monkeypatch.setattr(memory, '_backend', backend)
+    monkeypatch.setattr(memory, '_memories', OrderedDict())
+    monkeypatch.setattr(memory, 'MAX_USERS', 2)
+
+    alice = memory.get_user_memory('alice')
+    memory.get_user_memory('bob')
+    assert memory.get_user_memory('alice') is alice
+    memory.get_user_memory('carol')
+
+    assert list(memory._memories) == ['alice', 'carol']
+    assert memory.get_user_memory('bob') is not None
+    assert list(memory._memories) == ['carol', 'bob']
+
+
+def test_the_index_grows_past_its_first_rows():
+    index = VectorIndex()
+    for i in range(40):
+        index.add(f"m{i}", f"fact number {i} about topic{i}")
+    index.add('m3', "replaced fact about gardening")
+
+    assert len(index) == 40
+    assert index.top_k("topic37", k=1)[0][1] == "fact number 37 about topic37"
+    assert index.top_k("gardening", k=1)[0][1] == "replaced fact about gardening"
+    assert index.latest(2) == ["fact number 38 about topic38", "fact number 39 about topic39"]
@@ -0,0 +1,99 @@
+import asyncio
+import threading
+import time
+from email.mime.text import MIMEText
+
+import pytest
+
+pytest.importorskip('googleapiclient')
+
+from fakes import FakeGmail
+from outbox import Outbox
+
+
+def email(subject: str) -> MIMEText:
+    message = MIMEText('Hi Bob')
+    message['to'] = 'bob@example.com'
+    message['subject'] = subject
+    return message
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'outbox.db')
+
+
+def test_flush_waits_for_this_process_emails_to_be_sent(path):
+    gmail = FakeGmail(10, latency=0.05)
+    outbox = Outbox(path)
+
+    async def scenario():
+        worker = asyncio.ensure_future(outbox.run_worker(lambda user_id: (gmail, None)))
+        await asyncio.sleep(0)
+        entry_id, _ = await asyncio.to_thread(outbox.enqueue, 'alice', email('Hello'), 'key-1', 'bob@example.com', 'Hello')
+        waiting = await outbox.flush(timeout=5)
+        worker.cancel()
+        return entry_id, waiting
+
+    entry_id, waiting = asyncio.run(scenario())
+    assert waiting == 0
+    assert outbox.get(entry_id)['status'] == 'sent'
+    assert len(gmail.sent) == 1
+
+
+def test_flush_does_not_wait_for_emails_it_cannot_send_now(path):
+    outbox, other_process = Outbox(path), Outbox(path)
+    other_process.enqueue('bob', email('Theirs'), 'key-1', 'carol@example.com', 'Theirs')
+    backing_off, _ = outbox.enqueue('alice', email('Later'), 'key-2', 'bob@example.com', 'Later')
+    outbox._update(backing_off, next_attempt=time.time() + 600)
+
+    async def scenario():
+        started = time.monotonic()
+        waiting = await outbox.flush(timeout=5)
+        return waiting, time.monotonic() - started
+
+    waiting, seconds = asyncio.run(scenario())
+    assert waiting == 0
+    assert seconds < 1
+    assert outbox.pending() == 2
+
+
+def test_flush_gives_up_at_its_timeout(path):
+    outbox = Outbox(path)
+    outbox.enqueue('alice', email('Stuck'), 'key-1', 'bob@example.com', 'Stuck')
+
+    # No worker runs, so the due email is never sent
+    assert asyncio.run(outbox.flush(timeout=0.3)) == 1
+
+
+def test_the_worker_reads_and_writes_the_outbox_off_the_loop(path):
+    gmail = FakeGmail(10, latency=0)
+    outbox = Outbox(path)
+    threads = set()
+
+    class RecordingConnection:
+        def __init__(self, db):
+            self.db = db
+
+        def execute(self, *args):
+            threads.add(threading.get_ident())
+            return self.db.execute(*args)
+
+        def commit(self):
+            threads.add(threading.get_ident())
+            return self.db.commit()
+
+    outbox._db = RecordingConnection(outbox._db)
+
+    async def scenario():
+        worker = asyncio.ensure_future(outbox.run_worker(lambda user_id: (gmail, None)))
+        await asyncio.sleep(0)
+        entry_id, _ = await asyncio.to_thread(outbox.enqueue, 'alice', email('Hello'), 'key-1', 'bob@example.com', 'Hello')
+        await outbox.flush(timeout=5)
+        worker.cancel()
+        return entry_id
+
+    entry_id = asyncio.run(scenario())
+    # The loop ran on this thread
+    assert threading.get_ident() not in threads
+    assert outbox.get(entry_id)['status'] == 'sent'
@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+
+from result_cache import ResultCache, normalize_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class Upstream:
+    """A fetch that counts its calls and answers after delay seconds."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls = 0
+
+    def fetch(self, value):
+        async def fetch():
+            self.calls += 1
+            await asyncio.sleep(self.delay)
+            return value
+        return fetch
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def test_normalize_key_ignores_case_and_whitespace():
+    assert normalize_key('  New   York ') == normalize_key('new york') == 'new york'
+    assert normalize_key('New\tYork\n') == 'new york'
+    assert normalize_key('New York') != normalize_key('Newark')
+
+
+def test_result_is_cached_until_its_ttl_runs_out(clock):
+    cache = ResultCache(ttl=60, clock=clock)
+    upstream = Upstream()
+
+    async def scenario():
+        assert await cache.get_or_fetch('paris', upstream.fetch('sunny')) == 'sunny'
+        clock.now = 59.9
+        assert await cache.get_or_fetch('paris', upstream.fetch('rain')) == 'sunny'
+        clock.now = 60
+        assert await cache.get_or_fetch('paris', upstream.fetch('rain')) == 'rain'
+
+    asyncio.run(scenario())
+    assert upstream.calls == 2
+    assert cache.stats() == {'hits': 1, 'misses': 2, 'shared': 0, 'size': 1}
+
+
+def test_least_recently_used_entry_is_dropped_first(clock):
+    cache = ResultCache(ttl=60, max_entries=2, clock=clock)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    assert len(cache) == 2
+
+
+def test_concurrent_calls_for_a_key_share_one_fetch(clock):
+    cache = ResultCache(ttl=60, clock=clock)
+    upstream = Upstream(delay=0.05)
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_or_fetch('news', upstream.fetch('headlines')) for _ in range(10)))
+
+    assert asyncio.run(scenario()) == ['headlines'] * 10
+    assert upstream.calls == 1
+    assert cache.stats() == {'hits': 0, 'misses': 1, 'shared': 9, 'size': 1}
+
+
+def test_a_cancelled_caller_does_not_cancel_the_shared_fetch(clock):
+    cache = ResultCache(ttl=60, clock=clock)
+    upstream = Upstream(delay=0.05)
+
+    async def scenario():
+        first = asyncio.ensure_future(cache.get_or_fetch('news', upstream.fetch('headlines')))
+        second = asyncio.ensure_future(cache.get_or_fetch('news', upstream.fetch('headlines')))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(scenario()) == 'headlines'
+    assert cache.get('news') == 'headlines'
+
+
+def test_failed_fetches_are_not_cached(clock):
+    cache = ResultCache(ttl=60, clock=clock)
+    calls = []
+
+    async def failing():
+        calls.append('fail')
+        raise ConnectionError('upstream down')
+
+    async def scenario():
+        with pytest.raises(ConnectionError):
+            await cache.get_or_fetch('paris', failing)
+        return await cache.get_or_fetch('paris', Upstream().fetch('sunny'))
+
+    assert asyncio.run(scenario()) == 'sunny'
+    assert calls == ['fail']
+    assert cache.stats()['misses'] == 2
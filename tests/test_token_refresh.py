@@ -0,0 +1,137 @@
+import asyncio
+import os
+import pickle
+import subprocess
+import sys
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('google.oauth2')
+
+from google.oauth2.credentials import Credentials
+
+import services
+from executor import AUTH_TIMEOUT, run_blocking
+from fakes import FakeTokenEndpoint
+from token_refresh import RefreshCoordinator
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
+
+
+def expired_credentials() -> Credentials:
+    return Credentials(
+        token='expired', refresh_token='refresh', client_id='client', client_secret='secret',
+        token_uri='https://oauth2.googleapis.com/token', scopes=SCOPES,
+        expiry=datetime.utcnow() - timedelta(minutes=1),
+    )
+
+
+@pytest.fixture
+def token_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = str(tmp_path / 'gmail_token.pickle')
+    with open(path, 'wb') as f:
+        pickle.dump(expired_credentials(), f)
+    services.clear_cache()
+    yield path
+    services.clear_cache()
+
+
+@pytest.fixture
+def endpoint(monkeypatch):
+    endpoint = FakeTokenEndpoint(latency=0.05)
+    monkeypatch.setattr(services, 'coordinator', RefreshCoordinator(request_factory=lambda: endpoint))
+    return endpoint
+
+
+def test_many_concurrent_calls_share_one_refresh(token_file, endpoint):
+    stop = threading.Event()
+    torn = []
+
+    def read_token_file():
+        # The file is replaced in one step, so a reader never sees half of it
+        while not stop.is_set():
+            try:
+                with open(token_file, 'rb') as f:
+                    pickle.load(f)
+            except Exception as e:
+                torn.append(e)
+
+    async def scenario():
+        return await asyncio.gather(*(
+            run_blocking('gmail', services.load_credentials, token_file, SCOPES, "Gmail", timeout=AUTH_TIMEOUT, upstream=False)
+            for _ in range(64)
+        ))
+
+    reader = threading.Thread(target=read_token_file)
+    reader.start()
+    try:
+        results = asyncio.run(scenario())
+    finally:
+        stop.set()
+        reader.join()
+
+    assert endpoint.backend.round_trips == 1
+    assert {creds.token for creds, error in results} == {'token-1'}
+    assert all(error is None for _, error in results)
+    assert torn == []
+    with open(token_file, 'rb') as f:
+        assert pickle.load(f).token == 'token-1'
+
+
+def test_threads_holding_their_own_stale_copy_reuse_the_saved_refresh(token_file, endpoint):
+    barrier = threading.Barrier(16)
+    tokens = []
+
+    def refresh_own_copy():
+        with open(token_file, 'rb') as f:
+            creds = pickle.load(f)
+        barrier.wait()
+        fresh = services.coordinator.refresh(
+            token_file, creds,
+            read_saved=lambda: services._read_token(token_file),
+            save=lambda fresh: services._save_credentials(fresh, token_file),
+        )
+        tokens.append(fresh.token)
+
+    threads = [threading.Thread(target=refresh_own_copy) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert endpoint.backend.round_trips == 1
+    assert tokens == ['token-1'] * 16
+
+
+WORKER = """
+import sys
+sys.path[:0] = [{root!r}, {benchmarks!r}]
+import services
+from fakes import FakeTokenEndpoint
+from token_refresh import RefreshCoordinator
+
+class CountingEndpoint(FakeTokenEndpoint):
+    def __call__(self, *args, **kwargs):
+        with open('refreshes.log', 'a') as log:
+            log.write('refresh\\n')
+        return super().__call__(*args, **kwargs)
+
+services.coordinator = RefreshCoordinator(request_factory=CountingEndpoint)
+creds, error = services.load_credentials({token_file!r}, {scopes!r})
+print(creds.token if error is None else error)
+"""
+
+
+def test_worker_processes_refresh_once_between_them(token_file):
+    script = WORKER.format(root=ROOT, benchmarks=os.path.join(ROOT, 'benchmarks'), token_file=token_file, scopes=SCOPES)
+    workers = [subprocess.Popen([sys.executable, '-c', script], stdout=subprocess.PIPE, text=True) for _ in range(6)]
+    outputs = [worker.communicate(timeout=60)[0].strip() for worker in workers]
+
+    assert all(worker.returncode == 0 for worker in workers)
+    with open('refreshes.log') as log:
+        assert log.read().count('refresh') == 1
+    assert set(outputs) == {'token-1'}
@@ -0,0 +1,89 @@
+import sys
+import textwrap
+
+import pytest
+
+pytest.importorskip('pydantic')
+
+from tool_registry import ToolRegistry
+
+MODULE = textwrap.dedent('''
+    import pathlib
+    from typing import List, Optional
+
+    from pydantic import BaseModel
+
+    pathlib.Path(MARKER).write_text('module ran')
+
+    TOOL_GROUPS = {'stock': ['add_items'], 'office': ['add_items']}
+
+
+    class Item(BaseModel):
+        """One item."""
+        name: str
+        count: int = 1
+
+
+    class Loud(BaseModel):
+        name: str
+        pathlib.Path(MARKER).write_text('class ran')
+
+
+    def function_tool(*args):
+        return lambda f: f
+
+
+    @function_tool()
+    async def add_items(context, items: List[Item], note: Optional[str] = None) -> str:
+        """Add items."""
+        return f"{len(items)} {items[0].count}"
+
+
+    @function_tool()
+    async def shout(context, loud: Loud) -> str:
+        """Shout."""
+        return loud.name
+''')
+
+
+@pytest.fixture
+def tool_dir(tmp_path, monkeypatch):
+    marker = tmp_path / 'ran'
+    directory = tmp_path / 'plugins'
+    directory.mkdir()
+    (directory / 'scanned_tools.py').write_text(f"MARKER = {str(marker)!r}\n{MODULE}")
+    monkeypatch.delitem(sys.modules, 'scanned_tools', raising=False)
+    return directory, marker
+
+
+def test_scanning_reads_signatures_without_running_the_module(tool_dir):
+    directory, marker = tool_dir
+    path_before = list(sys.path)
+
+    entries = ToolRegistry([str(directory)], entry_point_group=None).discover()
+
+    assert not marker.exists() and 'scanned_tools' not in sys.modules
+    assert sys.path == path_before
+    items = entries['add_items'].signature.parameters['items'].annotation
+    assert items.__args__[0].model_json_schema()['required'] == ['name']
+    assert entries['add_items'].signature.parameters['note'].default is None
+    # A class that runs code is left for the real import
+    assert entries['shout'].signature is None
+
+
+def test_tools_are_imported_from_their_file(tool_dir):
+    directory, marker = tool_dir
+    entry = ToolRegistry([str(directory)], entry_point_group=None).discover()['add_items']
+
+    tool = entry.load_now()
+
+    assert marker.read_text() == 'class ran'
+    assert tool.__module__ == 'scanned_tools'
+
+
+def test_tools_are_grouped_by_their_module(tool_dir):
+    directory, _ = tool_dir
+
+    groups = ToolRegistry([str(directory)], entry_point_group=None).groups()
+
+    assert groups == {'stock': ['add_items'], 'office': ['add_items'], 'plugins': ['shout']}
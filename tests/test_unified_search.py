@@ -0,0 +1,48 @@
+import asyncio
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+search_tools = pytest.importorskip('search_tools')
+
+from render import Listed
+from session_data import SessionData
+
+
+def hit(kind: str, title: str, when=None):
+    return search_tools.Hit([title], Listed(kind, title, title), title, when=when)
+
+
+def test_a_date_without_a_timezone_is_ranked_as_utc():
+    now = datetime(2026, 5, 4, 12, tzinfo=timezone.utc)
+    naive, aware = hit('message', 'Acme contract', datetime(2026, 5, 4, 12)), hit('message', 'Acme contract', now)
+
+    assert search_tools.rank(naive, {'acme'}, now) == search_tools.rank(aware, {'acme'}, now)
+
+
+def test_only_the_sessions_tool_groups_are_searched(monkeypatch):
+    searched = []
+
+    def source(kind: str):
+        async def search(context, query, count, now):
+            searched.append(kind)
+            return [hit(kind, f"{kind} about {query}")]
+        return search
+
+    monkeypatch.setattr(search_tools, 'SEARCHES', {kind: source(kind) for kind in ('email', 'calendar', 'web')})
+    context = SimpleNamespace(userdata=SessionData('alice', groups={'email', 'calendar'}))
+
+    answer = asyncio.run(search_tools.unified_search(context, 'acme'))
+
+    assert sorted(searched) == ['calendar', 'email']
+    assert 'web about' not in answer
+
+
+def test_a_failure_is_answered_rather_than_raised(monkeypatch):
+    monkeypatch.setattr(search_tools, 'pick', lambda hits, count: 1 / 0)
+    monkeypatch.setattr(search_tools, 'SEARCHES', {})
+
+    answer = asyncio.run(search_tools.unified_search(None, 'acme'))
+
+    assert answer.startswith("An error occurred while searching for 'acme'")
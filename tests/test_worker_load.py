@@ -0,0 +1,29 @@
+import os
+import subprocess
+import sys
+import time
+
+import worker_load
+
+
+def test_fresh_reports_are_counted_and_stale_ones_removed(tmp_path, monkeypatch):
+    monkeypatch.setattr(worker_load, 'LOAD_DIR', str(tmp_path))
+    monkeypatch.setattr(worker_load, 'calls_in_flight', lambda: 1)
+    (tmp_path / '101').write_text('3')
+    stale = tmp_path / '102'
+    stale.write_text('5')
+    old = time.time() - worker_load.STALE_AFTER - 1
+    os.utime(stale, (old, old))
+
+    assert worker_load.tool_calls_in_flight() == 4
+    assert sorted(os.listdir(tmp_path)) == ['101']
+
+
+def test_importing_leaves_the_environment_alone():
+    env = {k: v for k, v in os.environ.items() if k != 'LOAD_DIR'}
+    env['PYTHONPATH'] = os.path.dirname(os.path.abspath(worker_load.__file__))
+    out = subprocess.run(
+        [sys.executable, '-c', "import os, worker_load; print(os.getenv('LOAD_DIR'), os.path.basename(worker_load.LOAD_DIR))"],
+        env=env, capture_output=True, text=True, check=True).stdout.split()
+
+    assert out == ['None', f"quanta_load_{os.getpgrp()}"]
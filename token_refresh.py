@@ -0,0 +1,153 @@
+import contextlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+# Refresh access tokens this long before they expire so no tool call has to wait for it
+REFRESH_MARGIN = timedelta(minutes=5)
+
+
+@contextlib.contextmanager
+def file_lock(path: str):
+    """
+    Hold an advisory lock on path (through a separate .lock file) so only one process at a time holds it.
+
+    Uses flock on Linux and macOS and msvcrt.locking on Windows.
+    """
+    with open(f"{path}.lock", 'a+b') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+        else:
+            lock_file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.05)
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def atomic_write(path: str, data: bytes) -> None:
+    """Write data to a temporary file next to path and rename it into place, so readers never see half a file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(temp_path)
+        raise
+
+
+def needs_refresh(creds, margin: timedelta = REFRESH_MARGIN) -> bool:
+    """Whether credentials are invalid or will expire within margin."""
+    if not creds.valid:
+        return True
+    return creds.expiry is not None and creds.expiry - datetime.utcnow() < margin
+
+
+def _google_request():
+    from google.auth.transport.requests import Request
+    return Request()
+
+
+class RefreshCoordinator:
+    """
+    Makes sure each token is refreshed once, however many sessions need it at the same time.
+
+    Inside a process, callers for the same token wait for the first refresh and then
+    reuse it. Across processes, refreshes hold a file lock and first check whether
+    another process already saved a fresh token.
+
+    Args:
+        margin: Refresh tokens that expire within this long
+        request_factory: Makes the transport used for refreshing, swap it for a fake token endpoint in tests
+    """
+
+    def __init__(self, margin: timedelta = REFRESH_MARGIN, request_factory: Callable = _google_request):
+        self.margin = margin
+        self.request_factory = request_factory
+        self.refresh_count = 0
+        self._lock = threading.Lock()
+        self._locks = {}
+        self._background = set()
+
+    def _lock_for(self, path: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(path, threading.Lock())
+
+    def refresh(self, path: str, creds, read_saved: Callable[[], Optional[object]], save: Callable[[object], None]):
+        """
+        Get fresh credentials for the token stored at path.
+
+        Args:
+            path: The token file, also used as the lock name
+            creds: The credentials currently in use
+            read_saved: Returns the credentials saved at path, or None
+            save: Saves refreshed credentials to path (called while the lock is held)
+
+        Returns the fresh credentials, which may be creds refreshed in place or a newer copy from disk.
+        """
+        with self._lock_for(path):
+            # Someone in this process refreshed it while we were waiting
+            if not needs_refresh(creds, self.margin):
+                return creds
+
+            with file_lock(path):
+                saved = read_saved()
+                if saved is not None and not needs_refresh(saved, self.margin):
+                    return saved
+
+                creds.refresh(self.request_factory())
+                save(creds)
+                self.refresh_count += 1
+                logging.info(f"Refreshed Google token in {path}")
+                return creds
+
+    def refresh_soon(self, executor, path: str, creds, read_saved, save, on_done: Callable = None) -> None:
+        """Refresh on the thread pool if the token is about to expire, without waiting for it."""
+        if not creds.refresh_token or not needs_refresh(creds, self.margin):
+            return
+        with self._lock:
+            if path in self._background:
+                return
+            self._background.add(path)
+
+        def run():
+            try:
+                fresh = self.refresh(path, creds, read_saved, save)
+                if on_done:
+                    on_done(fresh)
+            except Exception as e:
+                logging.warning(f"Background refresh of {path} failed: {e}")
+            finally:
+                with self._lock:
+                    self._background.discard(path)
+
+        executor.submit(run)
+
+
+coordinator = RefreshCoordinator()
@@ -0,0 +1,443 @@
+"""
+Finds the agent's tools without importing them, and imports a tool's module the first time the tool is called.
+
+Tools are the @function_tool functions of the modules next to this one and in
+TOOL_DIRS, and of the modules installed packages name in a 'quanta.tools' entry
+point, such as
+    [project.entry-points."quanta.tools"]
+    notes = "my_package.notes_tools"
+Modules are read with ast, so finding their tools costs a parse of the file
+instead of importing it and everything it imports, and nothing in the file runs
+until a session uses its tools. A session gets stand-ins with each tool's name,
+docstring and signature, and a stand-in imports the real tool when it is first
+called. A tool whose signature cannot be read from the source, for example
+because an argument's type is a class built by code, is imported when a
+session gets it. Modules in TOOL_DIRS are imported from their file, so the
+directories are not added to sys.path.
+
+A tool belongs to the groups its module's TOOL_GROUPS dict puts it in, or else
+to the group its module names in TOOL_GROUP. Groups in GROUP_CREDENTIALS are
+only enabled for users with credentials for their API.
+
+Nothing here needs LiveKit except session_tools, so the registry can be tested on its own.
+"""
+import ast
+import asyncio
+import importlib
+import importlib.util
+import inspect
+import logging
+import os
+import sys
+import threading
+import typing
+from dataclasses import dataclass, field
+from importlib.metadata import entry_points
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from executor import run_blocking
+from services import has_credentials
+
+# Where tools are looked for
+ENTRY_POINT_GROUP = 'quanta.tools'
+TOOL_DIRS = [os.path.dirname(os.path.abspath(__file__))] + [d for d in os.getenv("TOOL_DIRS", "").split(os.pathsep) if d]
+# Import the session's tool modules in the background when it starts, instead of on their first call
+PREWARM_TOOLS = os.getenv("PREWARM_TOOLS", "1") != "0"
+# Seconds the tool modules' prefetch hooks get when a session starts, 0 to not prefetch
+PREFETCH_BUDGET = float(os.getenv("PREFETCH_BUDGET", "5"))
+
+# Group of a tool no group lists and whose module names none
+DEFAULT_GROUP = 'plugins'
+# API a user needs credentials for before a group's tools are offered to them
+GROUP_CREDENTIALS = {
+    'email': 'gmail',
+    'calendar': 'calendar',
+}
+
+
+@dataclass
+class ToolEntry:
+    """A tool that was found, and the real tool once its module is imported."""
+    name: str
+    module: str
+    groups: List[str]
+    doc: Optional[str] = None
+    signature: Optional[inspect.Signature] = None   # None when it could not be read without importing
+    path: Optional[str] = None
+    tool: Optional[Callable] = field(default=None, repr=False)
+
+    def load_now(self) -> Callable:
+        """Get the real tool, importing its module if that has not happened yet."""
+        if self.tool is None:
+            self.tool = getattr(import_tool_module(self.module, self.path), self.name)
+        return self.tool
+
+    async def load(self) -> Callable:
+        """Get the real tool, importing its module on the thread pool the first time."""
+        if self.tool is None:
+            await run_blocking('prewarm', import_tool_module, self.module, self.path, timeout=60, upstream=False)
+        return self.load_now()
+
+
+_file_import_lock = threading.Lock()
+
+
+def import_tool_module(module: str, path: Optional[str] = None):
+    """Import a tool module by name, or from path when the name does not lead to that file."""
+    if module in sys.modules:
+        return sys.modules[module]
+    if path is None:
+        return importlib.import_module(module)
+    spec = importlib.util.find_spec(module)
+    if spec is not None and spec.origin and os.path.abspath(spec.origin) == os.path.abspath(path):
+        return importlib.import_module(module)
+    with _file_import_lock:
+        if module in sys.modules:
+            return sys.modules[module]
+        spec = importlib.util.spec_from_file_location(module, path)
+        loaded = importlib.util.module_from_spec(spec)
+        sys.modules[module] = loaded
+        try:
+            spec.loader.exec_module(loaded)
+        except BaseException:
+            del sys.modules[module]
+            raise
+        return loaded
+
+
+def _is_tool(node: ast.AST) -> bool:
+    if not isinstance(node, (ast.AsyncFunctionDef, ast.FunctionDef)):
+        return False
+    for decorator in node.decorator_list:
+        target = decorator.func if isinstance(decorator, ast.Call) else decorator
+        name = target.attr if isinstance(target, ast.Attribute) else getattr(target, 'id', None)
+        if name == 'function_tool':
+            return True
+    return False
+
+
+def _literal(tree: ast.Module, name: str):
+    """Get the value of a module level NAME = <literal> assignment from a parsed module, or None."""
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(isinstance(target, ast.Name) and target.id == name for target in node.targets):
+            try:
+                return ast.literal_eval(node.value)
+            except (ValueError, TypeError, SyntaxError):
+                return None
+    return None
+
+
+def _base_namespace() -> dict:
+    """Names annotations may use without importing the tool's module."""
+    namespace = {name: getattr(typing, name) for name in typing.__all__}
+    namespace.update((t.__name__, t) for t in (str, int, float, bool, bytes, list, dict, tuple, set))
+    try:
+        from livekit.agents import RunContext
+        namespace['RunContext'] = RunContext
+    except ImportError:
+        pass
+    return namespace
+
+
+def _annotation_value(node: ast.expr, namespace: dict):
+    """
+    Work out the type an annotation names from its syntax, without running it.
+
+    Understands names in namespace, subscripts of them like Optional[str] or
+    List[NewEvent], X | Y, None and string annotations. Raises ValueError for
+    anything else.
+    """
+    if isinstance(node, ast.Constant) and node.value is None:
+        return None
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return _annotation_value(ast.parse(node.value, mode='eval').body, namespace)
+    if isinstance(node, (ast.Name, ast.Attribute)):
+        name = node.id if isinstance(node, ast.Name) else node.attr
+        if isinstance(node, ast.Attribute) and name != 'RunContext' and getattr(node.value, 'id', None) != 'typing':
+            raise ValueError(f"{ast.unparse(node)} needs the module")
+        if name in namespace:
+            return namespace[name]
+        if name == 'RunContext':
+            # Left as written when LiveKit is not installed
+            return ast.unparse(node)
+        raise ValueError(f"{name} needs the module")
+    if isinstance(node, ast.Subscript):
+        generic = _annotation_value(node.value, namespace)
+        items = node.slice.elts if isinstance(node.slice, ast.Tuple) else [node.slice]
+        if generic is typing.Literal:
+            args = tuple(ast.literal_eval(item) for item in items)
+        else:
+            args = tuple(_annotation_value(item, namespace) for item in items)
+        return generic[args if len(args) > 1 else args[0]]
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.BitOr):
+        return typing.Union[_annotation_value(node.left, namespace), _annotation_value(node.right, namespace)]
+    raise ValueError(f"{ast.unparse(node)} needs the module")
+
+
+def _model_class(node: ast.ClassDef, module: str, namespace: dict):
+    """Build a pydantic model with the fields a class declares. Raises ValueError if the class does more than declare fields."""
+    from pydantic import create_model
+
+    doc = ast.get_docstring(node)
+    fields = {}
+    for statement in node.body[1:] if doc is not None else node.body:
+        if not (isinstance(statement, ast.AnnAssign) and isinstance(statement.target, ast.Name)):
+            raise ValueError(f"{node.name} does more than declare fields")
+        default = ... if statement.value is None else ast.literal_eval(statement.value)
+        fields[statement.target.id] = (_annotation_value(statement.annotation, namespace), default)
+    if node.decorator_list or node.keywords:
+        raise ValueError(f"{node.name} is decorated or configured")
+    return create_model(node.name, __doc__=doc, __module__=module, **fields)
+
+
+def _model_classes(tree: ast.Module, module: str, path: str, namespace: dict) -> None:
+    """Rebuild the module's pydantic argument models, such as NewEvent, into namespace from their field declarations."""
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef) and any(getattr(base, 'id', getattr(base, 'attr', None)) == 'BaseModel' for base in node.bases):
+            try:
+                namespace[node.name] = _model_class(node, module, namespace)
+            except (ValueError, TypeError, SyntaxError) as e:
+                # The tools that take it are imported when a session gets them
+                logging.debug(f"Could not rebuild {node.name} from {path}: {e}")
+
+
+def _annotation(node: Optional[ast.expr], namespace: dict):
+    if node is None:
+        return inspect.Parameter.empty
+    return _annotation_value(node, namespace)
+
+
+def _signature(node: ast.AsyncFunctionDef, namespace: dict) -> inspect.Signature:
+    """Build a function's signature from its definition. Raises if an annotation or default needs the module."""
+    args = node.args
+    positional = args.posonlyargs + args.args
+    defaults = [None] * (len(positional) - len(args.defaults)) + list(args.defaults)
+    parameters = []
+    for arg, default in zip(positional, defaults):
+        parameters.append(inspect.Parameter(
+            arg.arg, inspect.Parameter.POSITIONAL_OR_KEYWORD,
+            default=inspect.Parameter.empty if default is None else ast.literal_eval(default),
+            annotation=_annotation(arg.annotation, namespace),
+        ))
+    for arg, default in zip(args.kwonlyargs, args.kw_defaults):
+        parameters.append(inspect.Parameter(
+            arg.arg, inspect.Parameter.KEYWORD_ONLY,
+            default=inspect.Parameter.empty if default is None else ast.literal_eval(default),
+            annotation=_annotation(arg.annotation, namespace),
+        ))
+    return inspect.Signature(parameters, return_annotation=_annotation(node.returns, namespace))
+
+
+def stand_in(entry: ToolEntry) -> Callable:
+    """Get a function that looks like the tool to LiveKit and imports the real tool when it is called."""
+    async def tool(*args, **kwargs):
+        return await (await entry.load())(*args, **kwargs)
+
+    tool.__name__ = tool.__qualname__ = entry.name
+    tool.__module__ = entry.module
+    tool.__doc__ = entry.doc
+    tool.__signature__ = entry.signature
+    tool.__annotations__ = {name: p.annotation for name, p in entry.signature.parameters.items()
+                            if p.annotation is not inspect.Parameter.empty}
+    if entry.signature.return_annotation is not inspect.Signature.empty:
+        tool.__annotations__['return'] = entry.signature.return_annotation
+    return tool
+
+
+def prewarm_module(module_name: str, path: Optional[str] = None) -> None:
+    """Import a tool module, then the heavy modules it lists in PREWARM_MODULES. Failures are logged, not raised."""
+    try:
+        module = import_tool_module(module_name, path)
+    except Exception as e:
+        logging.warning(f"Could not prewarm {module_name}: {e}")
+        return
+    for name in getattr(module, 'PREWARM_MODULES', []):
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            logging.warning(f"Could not prewarm {name}: {e}")
+
+
+class ToolRegistry:
+    """
+    Every tool that was found, and which of them each user gets.
+
+    Args:
+        dirs: Directories whose modules are scanned for tools
+        entry_point_group: Entry point group naming more tool modules, or None to skip entry points
+    """
+
+    def __init__(self, dirs: Iterable[str] = TOOL_DIRS, entry_point_group: Optional[str] = ENTRY_POINT_GROUP):
+        self.dirs = list(dirs)
+        self.entry_point_group = entry_point_group
+        self._entries: Optional[Dict[str, ToolEntry]] = None
+        self._stand_ins: Dict[str, Callable] = {}
+
+    def scan_module(self, module: str, path: str) -> List[ToolEntry]:
+        """Read the tools of one module from its source without importing it."""
+        with open(path, 'r', encoding='utf-8') as f:
+            source = f.read()
+        if 'function_tool' not in source:
+            return []
+        tree = ast.parse(source, path)
+        namespace = _base_namespace()
+        _model_classes(tree, module, path, namespace)
+        module_group = _literal(tree, 'TOOL_GROUP')
+        tool_groups = _literal(tree, 'TOOL_GROUPS') or {}
+
+        found = []
+        for node in tree.body:
+            if not _is_tool(node):
+                continue
+            groups = [group for group, names in tool_groups.items() if node.name in names]
+            entry = ToolEntry(node.name, module, groups or [module_group or DEFAULT_GROUP], ast.get_docstring(node), path=path)
+            try:
+                entry.signature = _signature(node, namespace)
+            except Exception as e:
+                # Its module is imported when a session gets it instead
+                logging.debug(f"Could not read the signature of {node.name} in {path}: {e}")
+            found.append(entry)
+        return found
+
+    def _modules(self) -> List[tuple]:
+        """The (module, path) of every module to scan."""
+        modules = []
+        for directory in self.dirs:
+            if not os.path.isdir(directory):
+                continue
+            for name in sorted(os.listdir(directory)):
+                if name.endswith('.py') and not name.startswith('_'):
+                    modules.append((name[:-3], os.path.join(directory, name)))
+        if self.entry_point_group:
+            for entry_point in entry_points(group=self.entry_point_group):
+                spec = importlib.util.find_spec(entry_point.module)
+                if spec is None or not spec.origin:
+                    logging.warning(f"Tool entry point {entry_point.name} names a module that cannot be found: {entry_point.module}")
+                    continue
+                modules.append((entry_point.module, spec.origin))
+        return modules
+
+    def discover(self) -> Dict[str, ToolEntry]:
+        """Find every tool, the first time only. A name found twice keeps the first tool."""
+        if self._entries is None:
+            entries = {}
+            for module, path in self._modules():
+                try:
+                    found = self.scan_module(module, path)
+                except (OSError, SyntaxError, UnicodeDecodeError) as e:
+                    logging.warning(f"Could not scan {path} for tools: {e}")
+                    continue
+                for entry in found:
+                    if entry.name in entries:
+                        logging.warning(f"Tool {entry.name} in {module} ignored, {entries[entry.name].module} has one with that name")
+                        continue
+                    entries[entry.name] = entry
+            self._entries = entries
+        return self._entries
+
+    def groups(self) -> Dict[str, List[str]]:
+        """Get the names of the tools in each group."""
+        groups = {}
+        for entry in self.discover().values():
+            for group in entry.groups:
+                groups.setdefault(group, []).append(entry.name)
+        return groups
+
+    def enabled_groups(self, user_id: Optional[str], groups: Optional[Iterable[str]] = None) -> Set[str]:
+        """
+        Get the groups a user gets, of the groups asked for, or of every group when groups is None.
+
+        A group that needs credentials is left out for users without them.
+        """
+        found = {group for entry in self.discover().values() for group in entry.groups}
+        wanted = found if groups is None else found & set(groups)
+        allowed = {}   # api -> whether the user has credentials for it
+        for group in wanted:
+            api = GROUP_CREDENTIALS.get(group)
+            if api is not None and api not in allowed:
+                allowed[api] = has_credentials(user_id, api)
+        return {group for group in wanted if allowed.get(GROUP_CREDENTIALS.get(group), True)}
+
+    def enabled(self, user_id: Optional[str], groups: Optional[Iterable[str]] = None) -> List[ToolEntry]:
+        """Get the tools a user gets, which are the tools in any of their enabled groups."""
+        enabled_groups = self.enabled_groups(user_id, groups)
+        return [entry for entry in self.discover().values() if enabled_groups.intersection(entry.groups)]
+
+    def session_tools(self, user_id: Optional[str], groups: Optional[Iterable[str]] = None) -> List[Callable]:
+        """Get LiveKit tools for a session. Tools whose modules are not imported yet are stand-ins."""
+        from livekit.agents import function_tool
+
+        tools = []
+        for entry in self.enabled(user_id, groups):
+            if entry.tool is not None or entry.signature is None:
+                tools.append(entry.load_now())
+                continue
+            if entry.name not in self._stand_ins:
+                self._stand_ins[entry.name] = function_tool()(stand_in(entry))
+            tools.append(self._stand_ins[entry.name])
+        return tools
+
+    async def prewarm(self, entries: Iterable[ToolEntry]) -> None:
+        """Import the modules of entries, and the heavy modules they list in PREWARM_MODULES, on the thread pool."""
+        for module_name, path in dict.fromkeys((entry.module, entry.path) for entry in entries):
+            try:
+                await run_blocking('prewarm', prewarm_module, module_name, path, timeout=60, upstream=False)
+            except Exception as e:
+                logging.warning(f"Could not prewarm {module_name}: {e}")
+
+    def prewarm_now(self, groups: Optional[Iterable[str]] = None) -> None:
+        """Import the modules of the tools in groups, in every group when None, right away. For a process that has no session yet."""
+        groups = None if groups is None else set(groups)
+        entries = [entry for entry in self.discover().values() if groups is None or groups.intersection(entry.groups)]
+        for module_name, path in dict.fromkeys((entry.module, entry.path) for entry in entries):
+            prewarm_module(module_name, path)
+
+    async def prefetch(self, session, groups: Optional[Iterable[str]] = None, budget: float = PREFETCH_BUDGET) -> Dict[str, str]:
+        """
+        Run the prefetch(session, groups) hook of each module with tools the session gets, all at the same time.
+
+        Hooks load what the first questions of a session usually need into the tools'
+        caches. Whatever has not finished after budget seconds is cancelled. Returns
+        how each module's prefetch went.
+        """
+        enabled_groups = self.enabled_groups(session.user_id, groups)
+        modules = {entry.module: entry.path for entry in self.enabled(session.user_id, groups)}
+        if budget <= 0 or not modules:
+            return {}
+
+        async def run(module_name: str) -> None:
+            module = await run_blocking('prewarm', import_tool_module, module_name, modules[module_name], timeout=budget, upstream=False)
+            hook = getattr(module, 'prefetch', None)
+            if hook is not None:
+                await hook(session, enabled_groups)
+
+        tasks = {module_name: asyncio.ensure_future(run(module_name)) for module_name in modules}
+        try:
+            _, pending = await asyncio.wait(tasks.values(), timeout=budget)
+        finally:
+            # Cancels whatever is left, also when the session ends first
+            for task in tasks.values():
+                task.cancel()
+
+        outcome = {}
+        for module_name, task in tasks.items():
+            if task in pending:
+                outcome[module_name] = 'cancelled'
+            elif task.exception() is not None:
+                outcome[module_name] = f"failed: {task.exception()}"
+            else:
+                outcome[module_name] = 'done'
+        logging.info(f"Prefetch for {session.user_id}: {outcome}")
+        return outcome
+
+
+
+_registry: Optional[ToolRegistry] = None
+
+
+def get_registry() -> ToolRegistry:
+    """Get the shared tool registry."""
+    global _registry
+    if _registry is None:
+        _registry = ToolRegistry()
+    return _registry
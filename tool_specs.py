@@ -0,0 +1,227 @@
+"""
+Tool declarations for the realtime model, kept as small as they can be.
+
+Every tool's name, description and argument schema is sent to the model when a
+session is set up and counts as input on every turn, so compile_tools:
+  - declares each of the session's tools once, the registry has picked them by group
+  - shortens descriptions to their first sentence, without the examples
+  - drops argument descriptions that only repeat the argument's name
+
+Compiled tools are built once for each selection and reused, so every session
+with the same selection sends byte-identical declarations in the same order. The
+start of the prompt then stays the same between sessions, which is what lets the
+model's prefix cache be used, and a session does not parse docstrings again.
+"""
+import functools
+import inspect
+import json
+import math
+import os
+import re
+import typing
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional
+
+from pydantic import BaseModel
+
+# full sends the docstrings as they are written, compact shortens them
+TOOL_SPECS = os.getenv("TOOL_SPECS", "compact").lower()
+
+_ARGS_HEADER = re.compile(r"^\s*(Args|Arguments|Parameters):\s*$")
+_ARG_LINE = re.compile(r"^\s*(\w+)\s*(?:\([^)]*\))?:\s*(.*)$")
+_DEFAULT_NOTE = re.compile(r"\s*\(default:[^)]*\)")
+_EXAMPLES = re.compile(r",?\s+for (requests|questions) like .*$")
+_TOKEN = re.compile(r"[A-Za-z]+|\d|[^\sA-Za-z\d]{1,2}")
+
+# Words an argument description can add to the argument's name without saying more
+_FILLER_WORDS = {'a', 'an', 'the', 'of', 'to', 'for', 'in', 'number', 'how', 'many', 'return', 'show'}
+_ABBREVIATIONS = {'max': 'maximum', 'min': 'minimum'}
+
+_JSON_TYPES = {str: 'string', int: 'integer', float: 'number', bool: 'boolean'}
+
+
+def parse_docstring(doc: Optional[str]) -> tuple:
+    """Split a Google style docstring into its description and a dict of argument descriptions."""
+    description, args, current = [], {}, None
+    in_args = False
+    for line in inspect.cleandoc(doc or '').splitlines():
+        if _ARGS_HEADER.match(line):
+            in_args = True
+            continue
+        if not in_args:
+            description.append(line)
+            continue
+        match = _ARG_LINE.match(line)
+        if match and line.startswith(' ' * 4) and not line.startswith(' ' * 5):
+            current = match.group(1)
+            args[current] = match.group(2).strip()
+        elif current and line.strip():
+            args[current] += ' ' + line.strip()
+    return ' '.join(' '.join(description).split()), args
+
+
+def compact_description(text: str) -> str:
+    """Keep the first sentence of a description, without default values or examples."""
+    text = _DEFAULT_NOTE.sub('', ' '.join(text.split()))
+    first = re.split(r"(?<=[.!?])\s+(?=[A-Z])", text, maxsplit=1)[0]
+    return _EXAMPLES.sub('', first.rstrip('.')).strip()
+
+
+def restates_name(name: str, description: str) -> bool:
+    """
+    Whether an argument description says nothing its name does not, like title: Title of the event
+    or max_results: Maximum number of emails to return. It may add one word, such as what is counted.
+    """
+    name_words = {_ABBREVIATIONS.get(word, word) for word in name.lower().split('_')}
+    words = [word for word in re.findall(r"[a-z]+", description.lower()) if word not in _FILLER_WORDS]
+    return bool(name_words.intersection(words)) and len([word for word in words if word not in name_words]) <= 1
+
+
+def compact_instructions(text: str) -> str:
+    """Strip the indentation, trailing spaces and repeated blank lines from instructions."""
+    lines = [line.strip() for line in text.strip().splitlines()]
+    return re.sub(r"\n{3,}", "\n\n", '\n'.join(lines))
+
+
+def json_schema(annotation) -> dict:
+    """Get the JSON schema of an argument type, for the types tools take."""
+    origin, args = typing.get_origin(annotation), typing.get_args(annotation)
+    if origin is typing.Union:
+        return json_schema(next(a for a in args if a is not type(None)))
+    if origin in (list, List):
+        return {'type': 'array', 'items': json_schema(args[0] if args else str)}
+    if inspect.isclass(annotation) and issubclass(annotation, BaseModel):
+        properties = {name: json_schema(f.annotation) for name, f in annotation.model_fields.items()}
+        required = [name for name, f in annotation.model_fields.items() if f.is_required()]
+        return {'type': 'object', 'properties': properties, 'required': required}
+    return {'type': _JSON_TYPES.get(annotation, 'string')}
+
+
+@dataclass
+class ToolSpec:
+    """What the model is told about one tool."""
+    name: str
+    description: str
+    parameters: dict = field(default_factory=dict)   # argument name -> JSON schema, with its description
+    required: List[str] = field(default_factory=list)
+
+    def declaration(self) -> dict:
+        """The function declaration, in the shape the model receives it."""
+        declaration = {'name': self.name, 'description': self.description}
+        if self.parameters:
+            declaration['parameters'] = {'type': 'object', 'properties': self.parameters}
+            if self.required:
+                declaration['parameters']['required'] = self.required
+        return declaration
+
+    def docstring(self) -> str:
+        """A docstring that LiveKit turns back into this declaration."""
+        lines = [self.description]
+        described = [(name, schema['description']) for name, schema in self.parameters.items() if schema.get('description')]
+        if described:
+            lines += ['', 'Args:'] + [f"    {name}: {description}" for name, description in described]
+        return '\n'.join(lines)
+
+
+def tool_spec(tool: Callable, compact: bool = True) -> ToolSpec:
+    """Read a tool's declaration from its signature and docstring, shortened when compact."""
+    description, arg_docs = parse_docstring(tool.__doc__)
+    if compact:
+        description = compact_description(description)
+    hints = typing.get_type_hints(tool)
+    parameters, required = {}, []
+    for name, parameter in inspect.signature(tool).parameters.items():
+        annotation = hints.get(name, str)
+        if getattr(annotation, '__name__', '') == 'RunContext':
+            continue
+        schema = json_schema(annotation)
+        doc = arg_docs.get(name, '')
+        if compact and doc:
+            doc = compact_description(doc)
+            doc = '' if restates_name(name, doc) else doc
+        if doc:
+            schema['description'] = doc
+        parameters[name] = schema
+        if parameter.default is inspect.Parameter.empty:
+            required.append(name)
+    return ToolSpec(tool.__name__, description or tool.__name__.replace('_', ' '), parameters, required)
+
+
+def with_spec(tool: Callable, spec: ToolSpec) -> Callable:
+    """Get a copy of a tool that declares itself with spec. The original tool is left as it is."""
+    @functools.wraps(tool)
+    async def wrapper(*args, **kwargs):
+        return await tool(*args, **kwargs)
+
+    from livekit.agents import function_tool
+
+    wrapper.__doc__ = spec.docstring()
+    return function_tool(name=spec.name, description=spec.description)(wrapper)
+
+
+def select_tools(tools: Iterable[Callable], names: Optional[Iterable[str]] = None) -> List[Callable]:
+    """Get the tools named in names, each once and in the order given. Every tool when names is None."""
+    tools = list(tools)
+    wanted = {tool.__name__ for tool in tools} if names is None else set(names)
+    seen = set()
+    selected = []
+    for tool in tools:
+        if tool.__name__ in wanted and tool.__name__ not in seen:
+            seen.add(tool.__name__)
+            selected.append(tool)
+    return selected
+
+
+_compiled: Dict[tuple, List[Callable]] = {}
+
+
+def compile_tools(tools: Iterable[Callable], compact: Optional[bool] = None) -> List[Callable]:
+    """Get the tools for a session, compacted unless TOOL_SPECS is full. The same selection returns the same objects."""
+    compact = TOOL_SPECS != 'full' if compact is None else compact
+    selected = select_tools(tools)
+    key = (tuple(tool.__name__ for tool in selected), compact)
+    if key not in _compiled:
+        _compiled[key] = [with_spec(tool, tool_spec(tool)) for tool in selected] if compact else selected
+    return _compiled[key]
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate how many tokens text is, offline.
+
+    Words count one token per four letters, digits one each and punctuation one per
+    pair. Close enough to compare configurations, not to bill by.
+    """
+    return sum(math.ceil(len(piece) / 4) if piece.isalpha() else 1 for piece in _TOKEN.findall(text))
+
+
+def token_counts(tools: Iterable[Callable], instructions: str, compact: bool) -> dict:
+    """Estimate the tokens of the instructions and tool declarations a session sends."""
+    if compact:
+        instructions = compact_instructions(instructions)
+    declarations = [tool_spec(tool, compact).declaration() for tool in tools]
+    tool_tokens = estimate_tokens(json.dumps(declarations, separators=(',', ':')))
+    instruction_tokens = estimate_tokens(instructions)
+    return {
+        'tools': len(declarations),
+        'instruction_tokens': instruction_tokens,
+        'tool_tokens': tool_tokens,
+        'total_tokens': instruction_tokens + tool_tokens,
+    }
+
+
+def token_report(tools: Iterable[Callable], instructions: str, selections: Optional[Dict[str, List[str]]] = None) -> Dict[str, dict]:
+    """
+    Estimate the tokens each configuration sends: every tool as written, every tool
+    compacted, then the tools named in each selection compacted, such as the
+    registry's groups.
+    """
+    tools = list(tools)
+    selections = selections or {}
+    report = {
+        'full': token_counts(tools, instructions, compact=False),
+        'compact': token_counts(tools, instructions, compact=True),
+    }
+    for label, names in selections.items():
+        report[f"compact:{label}"] = token_counts(select_tools(tools, names), instructions, compact=True)
+    return report
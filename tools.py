@@ -1,121 +1,429 @@
+import asyncio
+import itertools
 import logging
 from livekit.agents import function_tool, RunContext
-import requests
-from langchain_community.tools import DuckDuckGoSearchRun
-import os
-import smtplib
-from email.mime.multipart import MIMEMultipart  
-from email.mime.text import MIMEText
 from typing import Optional
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-import pickle
-import base64
+import hashlib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email import encoders
 import json
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from zoneinfo import ZoneInfo
+from typing import List, Dict, Any, Set, Tuple
+from pydantic import BaseModel
+from executor import run_blocking, AUTH_TIMEOUT
+from services import TOKEN_FILES, execute_batch, get_service
+from credential_store import get_credential_store
+from outbox import get_outbox
+from gmail_mirror import fetch_message_metadata, get_mirror, is_plain_text_query
+from calendar_store import CALENDAR_KEY, events_between, find_calendar_store, get_calendar_stores, merge_events, search_events
+from result_cache import get_cache
+from scheduling import TIMEZONE, free_time, parse_busy
+from paging import Cursor, PageFetcher, offset_page, paginate, take
+from render import Listed, budget, look_up, people, person, remember_listed, render_details, render_listing, resolve_listed, spoken_date_header, spoken_day, spoken_span
+from session_data import SessionData, get_session_data
+from instrumentation import instrumented
 
 # Gmail API configuration
 GMAIL_SCOPES = ['https://www.googleapis.com/auth/gmail.send', 'https://www.googleapis.com/auth/gmail.readonly']
-GMAIL_CREDENTIALS_FILE = 'gmail_token.pickle'
+GMAIL_CREDENTIALS_FILE = TOKEN_FILES['gmail']
 
 # Google Calendar API configuration
 CALENDAR_SCOPES = ['https://www.googleapis.com/auth/calendar']
-CALENDAR_CREDENTIALS_FILE = 'calender_token.pickle'
+CALENDAR_CREDENTIALS_FILE = TOKEN_FILES['calendar']
 CALENDAR_ID = 'primary'
 
-def get_gmail_service():
+# Most results asked for in one page of a listing
+GMAIL_PAGE_SIZE = 100
+CALENDAR_PAGE_SIZE = 250
+MORE_RESULTS_HINT = "There are more, call show_more_results for them."
+
+# First pages of email prefetch() loads when a session starts, for "any new email?" and "read my email"
+PREFETCH_QUERIES = ['is:unread', '']
+PREFETCH_MESSAGES = 10
+
+# Groups of tools a session can be given, read by tool_registry. A tool in both is only declared once
+TOOL_GROUPS = {
+    'email': ['send_email', 'check_email_status', 'read_messages', 'search_gmail', 'show_more_results', 'show_details'],
+    'calendar': [
+        'view_google_calendar', 'search_google_calendar_events', 'list_google_calendars', 'find_free_slots',
+        'create_google_calendar_event', 'create_google_calendar_events',
+        'delete_google_calendar_event', 'delete_google_calendar_events', 'show_more_results', 'show_details',
+    ],
+}
+
+# Heavy modules the tools import on first use, loaded early by tool_registry.prewarm()
+PREWARM_MODULES = [
+    'googleapiclient.discovery',
+    'google_auth_httplib2',
+    'google.auth.transport.requests',
+]
+
+class GoogleAuthError(Exception):
+    """Signing in to a Google service failed."""
+
+def get_user_id(context: RunContext) -> Optional[str]:
+    """
+    Get the ID of the user a tool call is for, whose credentials get_service looks up.
+
+    Returns None when there is no credential store and the shared token file is used.
+    """
+    session = get_session_data(context)
+    if session is None:
+        return None
+    return credential_user_id(session.user_id)
+
+def credential_user_id(user_id: str) -> Optional[str]:
+    """
+    Get user_id when there is a credential store, or None for the shared token file.
+
+    A user without stored credentials for an API still gets their own ID, so get_service
+    answers that they are not signed in instead of handing them the shared account.
+    """
+    return user_id if get_credential_store() else None
+
+def get_gmail_service(user_id: Optional[str] = None):
     """Get authenticated Gmail service."""
-    creds = None
-    if os.path.exists(GMAIL_CREDENTIALS_FILE):
-        with open(GMAIL_CREDENTIALS_FILE, 'rb') as token:
-            creds = pickle.load(token)
-    
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            if not os.path.exists('credentials.json'):
-                return None, "Gmail credentials not found. Please ensure credentials.json exists."
-            
-            flow = InstalledAppFlow.from_client_secrets_file('credentials.json', GMAIL_SCOPES)
-            creds = flow.run_local_server(port=0)
+    return get_service('gmail', 'v1', GMAIL_CREDENTIALS_FILE, GMAIL_SCOPES, "Gmail", user_id)
+
+def get_google_calendar_service(user_id: Optional[str] = None):
+    """Get authenticated Google Calendar service."""
+    return get_service('calendar', 'v3', CALENDAR_CREDENTIALS_FILE, CALENDAR_SCOPES, "Google Calendar", user_id)
+
+def list_messages(service, query: str = "", max_results: int = 10, page_token: Optional[str] = None) -> Tuple[List[Dict[str, str]], Optional[str]]:
+    """
+    List one page of messages from the Gmail API, fetching their headers in one batch request.
+
+    Returns one dict per message with id, subject, sender, date and snippet, and the next page token or None.
+    """
+    params = {'userId': 'me', 'maxResults': max_results}
+    if query:
+        params['q'] = query
+    if page_token:
+        params['pageToken'] = page_token
+    messages_result = service.users().messages().list(**params).execute()
     
-        with open(GMAIL_CREDENTIALS_FILE, 'wb') as token:
-            pickle.dump(creds, token)
+    message_ids = [m['id'] for m in messages_result.get('messages', [])]
+    details = fetch_message_metadata(service, message_ids)
     
-    try:
-        service = build('gmail', 'v1', credentials=creds)
-        return service, None
-    except Exception as e:
-        return None, f"Failed to build Gmail service: {str(e)}"
+    found = []
+    for message_id in message_ids:
+        headers = details.get(message_id, {}).get('payload', {}).get('headers', [])
+        found.append({
+            'id': message_id,
+            'subject': next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject'),
+            'sender': next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown Sender'),
+            'date': next((h['value'] for h in headers if h['name'] == 'Date'), 'Unknown Date'),
+            'snippet': details.get(message_id, {}).get('snippet', ''),
+        })
+    return found, messages_result.get('nextPageToken')
+
+def message_pages(cursor: Cursor, page_size: int, user_id: Optional[str] = None) -> PageFetcher:
+    """
+    Make the page fetcher for a message listing.
+
+    Plain text queries are answered from the local mirror when it is synced and has
+    matches, anything else goes to the Gmail API. The first page picks the source and
+    later pages keep it, since their page tokens only make sense to that source.
+    """
+    query = cursor.params.get('query', '')
+    page_size = min(page_size, GMAIL_PAGE_SIZE)
+    
+    async def fetch_page(page_token):
+        if cursor.source != 'api':
+            mirror = await get_mirror(get_gmail_service, user_id)
+            if cursor.source == 'mirror' or (mirror.ready and is_plain_text_query(query)):
+                offset = int(page_token or 0)
+                found = mirror.search(query, page_size, offset) if query else mirror.recent(page_size, offset)
+                if found or cursor.source == 'mirror':
+                    cursor.source = 'mirror'
+                    return offset_page(found, offset, page_size)
+        
+        cursor.source = 'api'
+        return await message_page(user_id, query, page_size, page_token)
+    
+    return fetch_page
 
-def get_google_calendar_service():
-    creds = None
+async def message_page(user_id: Optional[str], query: str, page_size: int, page_token: Optional[str] = None) -> tuple:
+    """
+    Get one page of messages from the Gmail API as (messages, next_page_token).
     
-    if os.path.exists(CALENDAR_CREDENTIALS_FILE):
-        with open(CALENDAR_CREDENTIALS_FILE, 'rb') as token:
-            creds = pickle.load(token)
+    First pages are cached for a minute, so one prefetched when the session started is answered from memory.
+    """
+    async def fetch():
+        service, error = await run_blocking('gmail', get_gmail_service, user_id, timeout=AUTH_TIMEOUT, upstream=False)
+        if error:
+            raise GoogleAuthError(error)
+        return await run_blocking('gmail', list_messages, service, query, page_size, page_token)
     
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
+    if page_token is not None:
+        return await fetch()
+    return await get_cache('messages').get_or_fetch(f"{user_id or ''}\n{page_size}\n{query}", fetch)
+
+async def selected_calendar_ids(service, user_id: Optional[str] = None) -> List[str]:
+    """Get the IDs of the calendars shown in the user's Google Calendar, with the primary one as CALENDAR_ID."""
+    calendars = await get_calendar_list(service, user_id)
+    calendar_ids = [CALENDAR_ID if c.get('primary') else c['id'] for c in calendars if c.get('selected') or c.get('primary')]
+    return calendar_ids or [CALENDAR_ID]
+
+async def get_calendar_list(service, user_id: Optional[str] = None) -> List[dict]:
+    """Get the user's calendar list, cached since it rarely changes."""
+    async def fetch_calendars():
+        calendar_list = await run_blocking('calendar', lambda: service.calendarList().list().execute())
+        return calendar_list.get('items', [])
+    
+    return await get_cache('calendars').get_or_fetch(user_id or '', fetch_calendars)
+
+async def open_calendars(user_id: Optional[str] = None, calendar_ids: Optional[List[str]] = None, all_calendars: bool = False):
+    """
+    Get the Calendar service and the local copies of the calendars to read, syncing any not loaded yet at the same time.
+    
+    Reads calendar_ids if given, else every calendar shown in the user's Google Calendar
+    when all_calendars is set, else the primary calendar. Raises GoogleAuthError if signing in failed.
+    """
+    service, error = await run_blocking('calendar', get_google_calendar_service, user_id, timeout=AUTH_TIMEOUT, upstream=False)
+    if error:
+        raise GoogleAuthError(error)
+    if calendar_ids is None:
+        calendar_ids = await selected_calendar_ids(service, user_id) if all_calendars else [CALENDAR_ID]
+    return service, await get_calendar_stores(calendar_ids, service, get_google_calendar_service, user_id)
+
+def event_pages(cursor: Cursor, page_size: int, service, stores) -> PageFetcher:
+    """
+    Make the page fetcher for the events between the cursor's start and end.
+    
+    They are read from the local calendars, or from Google Calendar when the range
+    is outside the days the local copies keep.
+    """
+    start = datetime.fromisoformat(cursor.params['start'])
+    end = datetime.fromisoformat(cursor.params['end'])
+    local = all(store.covers(start, end) for store in stores)
+    calendar_ids = [store.calendar_id for store in stores]
+    
+    async def fetch_page(page_token):
+        offset = int(page_token or 0)
+        if local:
+            return offset_page(events_between(stores, start, end, page_size, offset), offset, page_size)
+        # Merged results page by offset up to one page of each calendar, like a remote search
+        wanted = min(offset + page_size, CALENDAR_PAGE_SIZE)
+        found = (await list_calendars_remotely(service, calendar_ids, wanted, timeMin=start.isoformat(), timeMax=end.isoformat()))[offset:]
+        return offset_page(found, offset, page_size) if wanted < CALENDAR_PAGE_SIZE else (found, None)
+    
+    return fetch_page
+
+async def list_calendars_remotely(service, calendar_ids: List[str], max_results: int, **params) -> List[dict]:
+    """List events of several calendars on Google Calendar at the same time and merge them by start time."""
+    def list_events(calendar_id: str) -> dict:
+        # Built on the pool thread so the request uses that thread's connection
+        return service.events().list(
+            calendarId=calendar_id,
+            maxResults=max_results,
+            singleEvents=True,
+            orderBy='startTime',
+            **params
+        ).execute()
+    
+    results = await asyncio.gather(*(
+        run_blocking('calendar', list_events, calendar_id) for calendar_id in calendar_ids
+    ), return_exceptions=True)
+    
+    event_lists = []
+    for calendar_id, result in zip(calendar_ids, results):
+        if isinstance(result, Exception):
+            logging.warning(f"Could not read calendar {calendar_id}: {result}")
         else:
-            if not os.path.exists('credentials.json'):
-                return None, "Google Calendar credentials not found. Please ensure credentials.json exists."
-            
-            flow = InstalledAppFlow.from_client_secrets_file('credentials.json', CALENDAR_SCOPES)
-            creds = flow.run_local_server(port=0)
+            event_lists.append([dict(event, **{CALENDAR_KEY: calendar_id}) for event in result.get('items', [])])
+    return list(itertools.islice(merge_events(event_lists), max_results))
+
+def event_search_pages(cursor: Cursor, page_size: int, service, stores) -> PageFetcher:
+    """Make the page fetcher for an event search, reading the local calendars first and Google Calendar for older events."""
+    search_term = cursor.params['search_term']
+    calendar_ids = [store.calendar_id for store in stores]
+    
+    async def fetch_page(page_token):
+        if cursor.source != 'api':
+            offset = int(page_token or 0)
+            found = search_events(stores, search_term, page_size, offset)
+            if found or cursor.source == 'store':
+                cursor.source = 'store'
+                return offset_page(found, offset, page_size)
         
-        with open(CALENDAR_CREDENTIALS_FILE, 'wb') as token:
-            pickle.dump(creds, token)
+        cursor.source = 'api'
+        if len(calendar_ids) > 1:
+            # Page tokens are per calendar, so merged results page by offset up to one page of each calendar
+            offset = int(page_token or 0)
+            wanted = min(offset + page_size, CALENDAR_PAGE_SIZE)
+            found = (await list_calendars_remotely(service, calendar_ids, wanted, q=search_term))[offset:]
+            return offset_page(found, offset, page_size) if wanted < CALENDAR_PAGE_SIZE else (found, None)
+        
+        events_result = await run_blocking('calendar', lambda: service.events().list(
+            calendarId=calendar_ids[0],
+            q=search_term,
+            maxResults=min(page_size, CALENDAR_PAGE_SIZE),
+            singleEvents=True,
+            orderBy='startTime',
+            pageToken=page_token
+        ).execute())
+        events = [dict(event, **{CALENDAR_KEY: calendar_ids[0]}) for event in events_result.get('items', [])]
+        return events, events_result.get('nextPageToken')
     
-    try:
-        service = build('calendar', 'v3', credentials=creds)
-        return service, None
-    except Exception as e:
-        return None, f"Failed to build calendar service: {str(e)}"
+    return fetch_page
 
-@function_tool()
-async def get_weather(
-    context: RunContext, 
-    city: str) -> str:
+async def read_listing(context: RunContext, cursor: Cursor, fetch_page: PageFetcher, count: int) -> list:
+    """Read the next count items of a listing, fetching only the pages they are on, and remember where it stopped."""
+    items = await take(paginate(fetch_page, cursor), count)
+    session = get_session_data(context)
+    if session is not None:
+        session.cursor = cursor
+    return items
+
+def message_row(message: dict, now: datetime) -> Tuple[List[str], Listed]:
+    """A message in a listing: its subject, who it is from and when. The full sender and snippet are kept for show_details."""
+    fields = [message['subject'], f"from {person(message['sender'])}", spoken_date_header(message['date'], now)]
+    return fields, Listed('message', message['id'], message['subject'], {
+        'from': message['sender'],
+        'date': message['date'],
+        'snippet': message.get('snippet', ''),
+    })
+
+def event_when(event: dict, now: datetime) -> str:
+    """When an event is, like tomorrow 09:00 to 09:30 or all day Mon 20 Oct, in the calendar's time zone."""
+    start = event['start'].get('dateTime', event['start'].get('date'))
+    end = event['end'].get('dateTime', event['end'].get('date'))
+    if 'T' not in start:  # All-day event
+        return f"all day {spoken_day(datetime.fromisoformat(start).date(), now.date())}"
+    return spoken_span(datetime.fromisoformat(start.replace('Z', '+00:00')), datetime.fromisoformat(end.replace('Z', '+00:00')), now)
+
+def event_row(event: dict, now: datetime) -> Tuple[List[str], Listed]:
+    """An event in a listing: its title, when, where and who else is invited. Descriptions and emails are kept for show_details."""
+    title = event.get('summary') or 'Untitled event'
+    attendees = [a for a in event.get('attendees', []) if not a.get('self')]
+    fields = [
+        title,
+        event_when(event, now),
+        f"at {event['location']}" if event.get('location') else '',
+        people([a.get('displayName') or person(a['email']) for a in attendees]),
+    ]
+    return fields, Listed('event', event['id'], title, {
+        'when': fields[1],
+        'location': event.get('location', ''),
+        'attendees': ', '.join(a['email'] for a in attendees),
+        'description': event.get('description', ''),
+    }, calendar_id=event.get(CALENDAR_KEY, CALENDAR_ID))
+
+def calendar_row(calendar: dict, now: datetime) -> Tuple[List[str], Listed]:
+    """A calendar in a listing: its name and what the user may do with it."""
+    title = calendar['summary'] + (" (primary)" if calendar.get('primary') else "")
+    fields = [title, f"access: {calendar['accessRole']}" if calendar.get('accessRole') else '']
+    return fields, Listed('calendar', calendar['id'], title, {
+        'description': calendar.get('description', ''),
+        'access': calendar.get('accessRole', ''),
+    })
+
+def render_items(context: RunContext, tool: str, header: str, items: list, row, first: int = 1, more: bool = False) -> str:
+    """List items within the tool's budget, remembering them under their numbers so later tools can take a number."""
+    now = datetime.now(ZoneInfo(TIMEZONE))
+    rows = [row(item, now) for item in items]
+    remember_listed(context, [listed for _, listed in rows], first)
+    return render_listing(header, [fields for fields, _ in rows], budget(tool), first, MORE_RESULTS_HINT if more else '')
+
+def local_datetime(date: str, time: str) -> datetime:
+    """Read a date (YYYY-MM-DD) and time (HH:MM) the user gave as a time in the calendar's time zone. Raises ValueError."""
+    return datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M").replace(tzinfo=ZoneInfo(TIMEZONE))
+
+def insert_event_request(service, title: str, event_datetime: datetime, end_datetime: datetime, description: str = "", location: str = "", attendees: str = ""):
+    """Make the events.insert request for an event between two timezone-aware datetimes, inviting the comma separated attendees."""
+    # Format for Google Calendar API, in the calendar's time zone so the event keeps the time the user gave
+    tz = ZoneInfo(TIMEZONE)
+    start_time = event_datetime.astimezone(tz).isoformat()
+    end_time = end_datetime.astimezone(tz).isoformat()
+    
+    # Prepare attendees list
+    attendee_list = []
+    if attendees:
+        for email in attendees.split(','):
+            email = email.strip()
+            if email:
+                attendee_list.append({'email': email})
+    
+    # Create event body
+    event_body = {
+        'summary': title,
+        'description': description,
+        'location': location,
+        'start': {
+            'dateTime': start_time,
+            'timeZone': TIMEZONE,
+        },
+        'end': {
+            'dateTime': end_time,
+            'timeZone': TIMEZONE,
+        },
+        'attendees': attendee_list,
+        'reminders': {
+            'useDefault': False,
+            'overrides': [
+                {'method': 'email', 'minutes': 24 * 60},  # 1 day before
+                {'method': 'popup', 'minutes': 30},       # 30 minutes before
+            ],
+        },
+    }
+    
+    return service.events().insert(
+        calendarId=CALENDAR_ID,
+        body=event_body,
+        sendUpdates='all' if attendee_list else 'none'
+    )
+
+def resolve_event(context: RunContext, reference: str) -> Tuple[str, str]:
     """
-    Get the current weather for a given city.
+    Get the calendar and ID of the event a number in the last listing stands for. An ID on its own is taken to be on the primary calendar.
+    
+    Raises LookupError when reference is a number no event was listed under.
     """
-    try:
-        response = requests.get(
-            f"https://wttr.in/{city}?format=3")
-        if response.status_code == 200:
-            logging.info(f"Weather for {city}: {response.text.strip()}")
-            return response.text.strip()   
-        else:
-            logging.error(f"Failed to get weather for {city}: {response.status_code}")
-            return f"Could not retrieve weather for {city}."
-    except Exception as e:
-        logging.error(f"Error retrieving weather for {city}: {e}")
-        return f"An error occurred while retrieving weather for {city}." 
+    event_id, item = resolve_listed(context, reference, 'event')
+    return (item.calendar_id if item is not None and item.calendar_id else CALENDAR_ID), event_id
 
-@function_tool()
-async def search_web(
-    context: RunContext,
-    query: str) -> str:
-    try:
-        results = DuckDuckGoSearchRun().run(tool_input=query)
-        logging.info(f"Search results for '{query}': {results}")
-        return results
-    except Exception as e:
-        logging.error(f"Error searching the web for '{query}': {e}")
-        return f"An error occurred while searching the web for '{query}'."    
+def describe_event(store, event_id: str) -> str:
+    """Name an event by its title from the local calendar, so no extra request is needed to read it."""
+    event = store.get(event_id) if store else None
+    if event and event.get('summary'):
+        return f"'{event['summary']}'"
+    return f"with ID {event_id}"
+
+async def prefetch(session: SessionData, groups: Set[str]) -> None:
+    """
+    Sign in to Google, sync the primary calendar and fetch the first pages of email while the greeting plays.
+
+    The first "what's on today" or "any new email" is then answered from memory.
+    """
+    jobs = []
+    if 'email' in groups:
+        user_id = credential_user_id(session.user_id)
+        jobs.append(get_mirror(get_gmail_service, user_id))
+        jobs += [message_page(user_id, query, PREFETCH_MESSAGES) for query in PREFETCH_QUERIES]
+    if 'calendar' in groups:
+        jobs.append(open_calendars(credential_user_id(session.user_id)))
+    
+    for result in await asyncio.gather(*jobs, return_exceptions=True):
+        if isinstance(result, Exception):
+            logging.warning(f"Prefetch for {session.user_id} failed: {result}")
+
+class NewEvent(BaseModel):
+    """One event for create_google_calendar_events."""
+    title: str
+    date: str
+    time: str
+    duration_minutes: int = 60
+    description: str = ""
+    location: str = ""
+    attendees: str = ""
 
 @function_tool()
+@instrumented
 async def send_email(
     context: RunContext,
     to_email: str,
@@ -124,11 +432,17 @@ async def send_email(
     cc_email: Optional[str] = None,
     bcc_email: Optional[str] = None
 ) -> str:
+    """
+    Send an email from the user's Gmail account.
+
+    Args:
+        to_email: Recipient's email address
+        subject: Subject line
+        message: Plain text body
+        cc_email: Email address to copy in
+        bcc_email: Email address to blind copy in
+    """
     try:
-        service, error = get_gmail_service()
-        if error:
-            return f"Gmail API authentication failed: {error}"
-        
         # Create email message
         msg = MIMEMultipart()
         msg['to'] = to_email
@@ -145,67 +459,96 @@ async def send_email(
         # Add message body
         msg.attach(MIMEText(message, 'plain'))
         
-        # Convert to string and encode
-        raw_message = base64.urlsafe_b64encode(msg.as_bytes()).decode('utf-8')
+        # The same email asked for twice in a row is only sent once
+        idempotency_key = hashlib.sha256(json.dumps(
+            [to_email, cc_email, bcc_email, subject, message]).encode('utf-8')).hexdigest()
+        
+        # Queue it, the outbox worker sends it in the background and retries if Gmail is unavailable
+        outbox = get_outbox(get_gmail_service)
+        outbox_id, duplicate = await run_blocking(
+            'outbox', outbox.enqueue, get_user_id(context), msg, idempotency_key, to_email, subject, upstream=False)
+        
+        if duplicate:
+            logging.info(f"Email to {to_email} already in the outbox as {outbox_id}")
+            return f"This email to {to_email} was already queued (Outbox ID: {outbox_id}), it will not be sent twice."
+        
+        logging.info(f"Email to {to_email} queued in the outbox as {outbox_id}")
         
-        # Prepare recipients list
-        recipients = [to_email]
+        response = "Email queued and will be sent in the background\n"
+        response += f"To: {to_email}\n"
+        response += f"Subject: {subject}\n"
         if cc_email:
-            recipients.append(cc_email)
+            response += f"CC: {cc_email}\n"
         if bcc_email:
-            recipients.append(bcc_email)
+            response += f"BCC: {bcc_email}\n"
+        response += f"Outbox ID: {outbox_id} (use check_email_status to confirm delivery)"
         
-        # Send email via Gmail API
-        try:
-            message_body = {'raw': raw_message}
-            sent_message = service.users().messages().send(userId='me', body=message_body).execute()
-            
-            logging.info(f"Email sent successfully via Gmail API to {to_email}")
-            
-            response = f"Email sent successfully via Gmail API\n"
-            response += f"To: {to_email}\n"
-            response += f"Subject: {subject}\n"
-            if cc_email:
-                response += f"CC: {cc_email}\n"
-            if bcc_email:
-                response += f"BCC: {bcc_email}\n"
-            response += f"Message ID: {sent_message['id']}"
-            
-            return response
-            
-        except HttpError as e:
-            logging.error(f"Gmail API error sending email: {e}")
-            return f"Failed to send email via Gmail API: {str(e)}"
+        return response
             
     except Exception as e:
-        logging.error(f"Error sending email via Gmail API: {e}")
-        return f"An error occurred while sending email via Gmail API: {str(e)}"
+        logging.error(f"Error queueing email: {e}")
+        return f"An error occurred while sending the email: {str(e)}"
+
+@function_tool()
+@instrumented
+async def check_email_status(
+    context: RunContext,  # type: ignore
+    outbox_id: str = ""
+) -> str:
+    """
+    Check whether emails queued by send_email have been delivered.
+    
+    Args:
+        outbox_id: Outbox ID send_email returned, or leave empty for the most recent emails
+    """
+    try:
+        outbox = get_outbox(get_gmail_service)
+        user_id = get_user_id(context)
+        if outbox_id:
+            entry = await run_blocking('outbox', outbox.get, outbox_id, upstream=False)
+            entries = [entry] if entry and entry['user_id'] == (user_id or '') else []
+            if not entries:
+                return f"No email with Outbox ID {outbox_id} found."
+        else:
+            entries = await run_blocking('outbox', outbox.recent, user_id, upstream=False)
+            if not entries:
+                return "No emails have been sent yet."
+        
+        lines = ["Email delivery status:\n"]
+        for entry in entries:
+            lines.append(f"\n• {entry['subject']} to {entry['recipient']} (Outbox ID: {entry['id']})\n")
+            if entry['status'] == 'sent':
+                lines.append(f"  Sent, Gmail Message ID: {entry['gmail_id']}\n")
+            elif entry['status'] == 'failed':
+                lines.append(f"  Failed after {entry['attempts']} attempt(s): {entry['last_error']}\n")
+            elif entry['status'] == 'queued' and entry['attempts']:
+                lines.append(f"  Waiting to retry after {entry['attempts']} attempt(s), last error: {entry['last_error']}\n")
+            else:
+                lines.append("  Sending\n")
+        
+        return ''.join(lines)
+        
+    except Exception as e:
+        logging.error(f"Error checking email status: {e}")
+        return f"An error occurred while checking email status: {str(e)}"
 
 @function_tool()
+@instrumented
 async def read_messages(
     context: RunContext,
     query: str = "",
     max_results: int = 10
 ) -> str:
+    """
+    Read the newest emails in the user's inbox.
+
+    Args:
+        query: Gmail search operators to filter by, such as is:unread
+        max_results: Maximum number of emails to return (default: 10)
+    """
     try:
-        service, error = get_gmail_service()
-        if error:
-            return f"Gmail API authentication failed: {error}"
-        
-        # Get messages
-        if query:
-            messages_result = service.users().messages().list(
-                userId='me', 
-                q=query, 
-                maxResults=max_results
-            ).execute()
-        else:
-            messages_result = service.users().messages().list(
-                userId='me', 
-                maxResults=max_results
-            ).execute()
-        
-        messages = messages_result.get('messages', [])
+        cursor = Cursor('messages', {'query': query})
+        messages = await read_listing(context, cursor, message_pages(cursor, max_results, get_user_id(context)), max_results)
         
         if not messages:
             if query:
@@ -213,27 +556,11 @@ async def read_messages(
             else:
                 return "No messages found in inbox"
         
-        result = f"📧 Gmail Messages"
-        if query:
-            result += f" matching '{query}'"
-        result += f" (showing {len(messages)}):\n"
-        
-        for i, message in enumerate(messages, 1):
-            msg = service.users().messages().get(userId='me', id=message['id']).execute()
-            
-            # Extract headers
-            headers = msg['payload']['headers']
-            subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
-            sender = next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown Sender')
-            date = next((h['value'] for h in headers if h['name'] == 'Date'), 'Unknown Date')
-            
-            result += f"\n{i}. {subject}\n"
-            result += f"   From: {sender}\n"
-            result += f"   Date: {date}\n"
-            result += f"   Message ID: {message['id']}\n"
-        
-        return result
+        header = f"{len(messages)} emails" + (f" matching '{query}'" if query else "") + ":"
+        return render_items(context, 'read_messages', header, messages, message_row, more=not cursor.done)
         
+    except GoogleAuthError as e:
+        return f"Gmail API authentication failed: {e}"
     except HttpError as e:
         logging.error(f"Gmail API error reading messages: {e}")
         return f"Gmail API error: {str(e)}"
@@ -242,46 +569,31 @@ async def read_messages(
         return f"An error occurred while reading Gmail messages: {str(e)}"
 
 @function_tool()
+@instrumented
 async def search_gmail(
     context: RunContext,
     search_query: str,
     max_results: int = 10
 ) -> str:
+    """
+    Search the user's emails by sender, subject or words in them.
+
+    Args:
+        search_query: Words or Gmail search operators, such as from:bob
+        max_results: Maximum number of emails to return (default: 10)
+    """
     try:
-        service, error = get_gmail_service()
-        if error:
-            return f"Gmail API authentication failed: {error}"
-        
-        # Search Gmail
-        messages_result = service.users().messages().list(
-            userId='me', 
-            q=search_query, 
-            maxResults=max_results
-        ).execute()
-        
-        messages = messages_result.get('messages', [])
+        cursor = Cursor('messages', {'query': search_query})
+        messages = await read_listing(context, cursor, message_pages(cursor, max_results, get_user_id(context)), max_results)
         
         if not messages:
             return f"No messages found matching search query: '{search_query}'"
         
-        result = f"🔍 Gmail Search Results for '{search_query}' (showing {len(messages)}):\n"
-        
-        for i, message in enumerate(messages, 1):
-
-            msg = service.users().messages().get(userId='me', id=message['id']).execute()
-            
-            headers = msg['payload']['headers']
-            subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
-            sender = next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown Sender')
-            date = next((h['value'] for h in headers if h['name'] == 'Date'), 'Unknown Date')
-            
-            result += f"\n{i}. {subject}\n"
-            result += f"   From: {sender}\n"
-            result += f"   Date: {date}\n"
-            result += f"   Message ID: {message['id']}\n"
-        
-        return result
+        header = f"{len(messages)} emails matching '{search_query}':"
+        return render_items(context, 'search_gmail', header, messages, message_row, more=not cursor.done)
         
+    except GoogleAuthError as e:
+        return f"Gmail API authentication failed: {e}"
     except HttpError as e:
         logging.error(f"Gmail API error searching: {e}")
         return f"Gmail API error: {str(e)}"
@@ -290,79 +602,64 @@ async def search_gmail(
         return f"An error occurred while searching Gmail: {str(e)}"
 
 @function_tool()
+@instrumented
 async def create_google_calendar_event(
     context: RunContext,
     title: str,
-    date: str,
-    time: str,
+    date: str = "",
+    time: str = "",
     duration_minutes: int = 60,
     description: str = "",
     location: str = "",
-    attendees: str = ""
+    attendees: str = "",
+    slot: int = 0
 ) -> str:
+    """
+    Create an event in Google Calendar at a date (YYYY-MM-DD) and time (HH:MM), or in a slot find_free_slots suggested.
+    
+    Args:
+        title: Title of the event
+        date: Day of the event, not needed when booking a slot
+        time: Start time of the event, not needed when booking a slot
+        duration_minutes: Length of the event (default: 60), not needed when booking a slot
+        description: Notes for the event
+        location: Where the event is
+        attendees: Comma separated emails to invite
+        slot: Number of a slot from the last find_free_slots answer to book
+    """
     try:
-        service, error = get_google_calendar_service()
+        # Take the time from a suggested slot, so booking it needs no second look at the calendar
+        if slot:
+            session = get_session_data(context)
+            slots = session.slots if session else []
+            if not 1 <= slot <= len(slots):
+                return f"There is no free slot number {slot}. Use find_free_slots to get suggestions first."
+            slot_start, slot_end = slots[slot - 1]
+            local_start = slot_start.astimezone(ZoneInfo(TIMEZONE))
+            date, time = local_start.strftime('%Y-%m-%d'), f"{local_start.strftime('%H:%M')} {TIMEZONE}"
+            duration_minutes = int((slot_end - slot_start).total_seconds() // 60)
+            event_datetime = local_start
+        else:
+            # Parse date and time
+            event_datetime = local_datetime(date, time)
+        end_datetime = event_datetime + timedelta(minutes=duration_minutes)
+        
+        user_id = get_user_id(context)
+        service, error = await run_blocking('calendar', get_google_calendar_service, user_id, timeout=AUTH_TIMEOUT, upstream=False)
         if error:
             return f"Google Calendar authentication failed: {error}"
         
-        # Parse date and time
-        event_datetime = datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M")
-        end_datetime = event_datetime + timedelta(minutes=duration_minutes)
+        event = await run_blocking('calendar', lambda: insert_event_request(service, title, event_datetime, end_datetime, description, location, attendees).execute())
         
-        # Format for Google Calendar API
-        start_time = event_datetime.isoformat() + 'Z'
-        end_time = end_datetime.isoformat() + 'Z'
-        
-        # Prepare attendees list
-        attendee_list = []
-        if attendees:
-            for email in attendees.split(','):
-                email = email.strip()
-                if email:
-                    attendee_list.append({'email': email})
-        
-        # Create event body
-        event_body = {
-            'summary': title,
-            'description': description,
-            'location': location,
-            'start': {
-                'dateTime': start_time,
-                'timeZone': 'UTC',
-            },
-            'end': {
-                'dateTime': end_time,
-                'timeZone': 'UTC',
-            },
-            'attendees': attendee_list,
-            'reminders': {
-                'useDefault': False,
-                'overrides': [
-                    {'method': 'email', 'minutes': 24 * 60},  # 1 day before
-                    {'method': 'popup', 'minutes': 30},       # 30 minutes before
-                ],
-            },
-        }
-        
-        event = service.events().insert(
-            calendarId=CALENDAR_ID,
-            body=event_body,
-            sendUpdates='all' if attendee_list else 'none'
-        ).execute()
+        # Keep the local copy of the calendar current
+        store = find_calendar_store(CALENDAR_ID, user_id)
+        if store:
+            store.put(event)
         
         logging.info(f"Google Calendar event created: {title} on {date} at {time}")
         
-        # Format response
-        response = f"Event '{title}' created successfully in Google Calendar!\n"
-        response += f" Date: {date}\n"
-        response += f" Time: {time} ({duration_minutes} minutes)\n"
-        if location:
-            response += f" Location: {location}\n"
-        if attendees:
-            response += f" Attendees: {attendees}\n"
-        response += f" Event ID: {event['id']}"
-        
-        return response
+        # Listed as number 1, so "move it" or "delete it" can name it by number
+        return render_items(context, 'create_google_calendar_event', "Created in Google Calendar:", [event], event_row)
         
     except ValueError as e:
         return f"Invalid date/time format. Please use YYYY-MM-DD for date and HH:MM for time. Error: {str(e)}"
@@ -374,46 +671,117 @@ async def create_google_calendar_event(
         return f"An error occurred while creating the Google Calendar event: {str(e)}"
 
 @function_tool()
+@instrumented
+async def find_free_slots(
+    context: RunContext,  # type: ignore
+    date: str = "",
+    duration_minutes: int = 30,
+    days: int = 1,
+    attendees: str = "",
+    all_calendars: bool = False,
+    max_results: int = 5
+) -> str:
+    """
+    Find free time for a meeting in working hours, for questions like "when am I free on Thursday?".
+    
+    Args:
+        date: First day to look at (YYYY-MM-DD), today if empty
+        duration_minutes: Length of the meeting (default: 30)
+        days: How many days to look at from date, weekends are skipped when more than one (default: 1)
+        attendees: Comma separated emails of people who also need to be free
+        all_calendars: Check all selected calendars, not just the primary
+        max_results: How many slots to suggest (default: 5)
+    """
+    try:
+        tz = ZoneInfo(TIMEZONE)
+        first_day = datetime.strptime(date, "%Y-%m-%d").date() if date else datetime.now(tz).date()
+        
+        user_id = get_user_id(context)
+        service, error = await run_blocking('calendar', get_google_calendar_service, user_id, timeout=AUTH_TIMEOUT, upstream=False)
+        if error:
+            return f"Google Calendar authentication failed: {error}"
+        
+        # One freebusy query covers the user's calendars and every attendee
+        calendar_ids = await selected_calendar_ids(service, user_id) if all_calendars else [CALENDAR_ID]
+        attendee_list = [email.strip() for email in attendees.split(',') if email.strip()]
+        range_start = datetime.combine(first_day, datetime.min.time(), tzinfo=tz)
+        freebusy = await run_blocking('calendar', lambda: service.freebusy().query(body={
+            'timeMin': range_start.isoformat(),
+            'timeMax': (range_start + timedelta(days=days)).isoformat(),
+            'timeZone': TIMEZONE,
+            'items': [{'id': calendar_id} for calendar_id in calendar_ids + attendee_list],
+        }).execute())
+        
+        busy, errors = parse_busy(freebusy.get('calendars', {}))
+        free, slots = free_time(busy, first_day, days, timedelta(minutes=duration_minutes), max_results)
+        
+        session = get_session_data(context)
+        if session is not None:
+            session.slots = slots
+        
+        if not slots:
+            return f"No free {duration_minutes} minute slots in working hours from {first_day.isoformat()} for {days} day(s)."
+        
+        lines = [f"Free {duration_minutes} minute slots ({TIMEZONE}):\n"]
+        for i, (start, end) in enumerate(slots, 1):
+            lines.append(f"\n{i}. {start.astimezone(tz).strftime('%a %Y-%m-%d %H:%M')} - {end.astimezone(tz).strftime('%H:%M')}")
+        lines.append("\n\nAll free time: " + ', '.join(
+            f"{start.astimezone(tz).strftime('%a %H:%M')}-{end.astimezone(tz).strftime('%H:%M')}" for start, end in free))
+        for calendar_id, reason in errors.items():
+            lines.append(f"\nCould not check the calendar of {calendar_id}: {reason}")
+        lines.append("\nTo book one, call create_google_calendar_event with its slot number.")
+        
+        return ''.join(lines)
+        
+    except ValueError as e:
+        return f"Invalid date format. Please use YYYY-MM-DD format. Error: {str(e)}"
+    except HttpError as e:
+        logging.error(f"Google Calendar API error: {e}")
+        return f"Google Calendar API error: {str(e)}"
+    except Exception as e:
+        logging.error(f"Error finding free slots: {e}")
+        return f"An error occurred while finding free slots: {str(e)}"
+
+@function_tool()
+@instrumented
 async def view_google_calendar(
     context: RunContext,
     date: str = None,
     days_ahead: int = 7,
-    max_results: int = 10
+    max_results: int = 10,
+    all_calendars: bool = False
 ) -> str:
+    """
+    View events in Google Calendar for a date (YYYY-MM-DD) or the coming days.
+    
+    Args:
+        date: Day to show, or leave empty for the next days_ahead days
+        days_ahead: How many days ahead to show when no date is given (default: 7)
+        max_results: Maximum number of events to return (default: 10)
+        all_calendars: Show all selected calendars, not just the primary
+    """
     try:
-        service, error = get_google_calendar_service()
-        if error:
-            return f"Google Calendar authentication failed: {error}"
-        
-        # Calculate time range
-        now = datetime.utcnow()
+        # Calculate time range, with days starting at midnight in the calendar's time zone
+        now = datetime.now(ZoneInfo(TIMEZONE))
         if date:
             # View events for specific date
-            target_date = datetime.strptime(date, "%Y-%m-%d")
-            start_time = target_date.replace(hour=0, minute=0, second=0, microsecond=0)
-            end_time = target_date.replace(hour=23, minute=59, second=59, microsecond=999999)
+            start_time = local_datetime(date, "00:00")
+            end_time = start_time + timedelta(days=1)
             result_title = f"Events for {date}"
         else:
             # View upcoming events
             start_time = now
             end_time = now + timedelta(days=days_ahead)
-            result_title = f"Upcoming events (next {days_ahead} days)"
-        
-        # Format for API
-        start_time_str = start_time.isoformat() + 'Z'
-        end_time_str = end_time.isoformat() + 'Z'
-        
-        # Get events from Google Calendar
-        events_result = service.events().list(
-            calendarId=CALENDAR_ID,
-            timeMin=start_time_str,
-            timeMax=end_time_str,
-            maxResults=max_results,
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute()
+            result_title = f"Events in the next {days_ahead} days"
         
-        events = events_result.get('items', [])
+        # Get events from the local copies of the calendars
+        service, stores = await open_calendars(get_user_id(context), all_calendars=all_calendars)
+        cursor = Cursor('events', {
+            'start': start_time.isoformat(),
+            'end': end_time.isoformat(),
+            'calendar_ids': [store.calendar_id for store in stores],
+        })
+        events = await read_listing(context, cursor, event_pages(cursor, max_results, service, stores), max_results)
         
         if not events:
             if date:
@@ -421,37 +789,10 @@ async def view_google_calendar(
             else:
                 return f"No upcoming events in the next {days_ahead} days."
         
-        # Format results
-        result = f"{result_title}:\n"
-        
-        for event in events:
-            start = event['start'].get('dateTime', event['start'].get('date'))
-            end = event['end'].get('dateTime', event['end'].get('date'))
-            
-            # Parse datetime
-            if 'T' in start:  # Has time
-                start_dt = datetime.fromisoformat(start.replace('Z', '+00:00'))
-                end_dt = datetime.fromisoformat(end.replace('Z', '+00:00'))
-                time_str = f"{start_dt.strftime('%H:%M')} - {end_dt.strftime('%H:%M')}"
-            else:  # All-day event
-                start_dt = datetime.fromisoformat(start)
-                time_str = "All day"
-            
-            result += f"\n• {event['summary']}\n"
-            result += f"  📅 {start_dt.strftime('%Y-%m-%d')}\n"
-            result += f"  🕐 {time_str}\n"
-            
-            if event.get('location'):
-                result += f"  📍 {event['location']}\n"
-            if event.get('description'):
-                result += f"  📝 {event['description']}\n"
-            if event.get('attendees'):
-                attendee_emails = [a['email'] for a in event['attendees']]
-                result += f"  👥 Attendees: {', '.join(attendee_emails)}\n"
-            result += f"  🔗 Event ID: {event['id']}\n"
-        
-        return result
+        return render_items(context, 'view_google_calendar', f"{result_title}:", events, event_row, more=not cursor.done)
         
+    except GoogleAuthError as e:
+        return f"Google Calendar authentication failed: {e}"
     except ValueError as e:
         return f"Invalid date format. Please use YYYY-MM-DD format. Error: {str(e)}"
     except HttpError as e:
@@ -462,41 +803,49 @@ async def view_google_calendar(
         return f"An error occurred while viewing Google Calendar: {str(e)}"
 
 @function_tool()
+@instrumented
 async def delete_google_calendar_event(
     context: RunContext,  # type: ignore
     event_id: str
 ) -> str:
     """
-    Delete an event from Google Calendar by ID.
+    Delete an event from Google Calendar by its number in the last list of events.
     
     Args:
-        event_id: ID of the event to delete
+        event_id: The event's number in the last list, or its ID
     """
     try:
-        service, error = get_google_calendar_service()
+        calendar_id, event_id = resolve_event(context, event_id)
+    except LookupError as e:
+        return f"{e}, list the events again to get their numbers."
+    
+    try:
+        user_id = get_user_id(context)
+        service, error = await run_blocking('calendar', get_google_calendar_service, user_id, timeout=AUTH_TIMEOUT, upstream=False)
         if error:
             return f"Google Calendar authentication failed: {error}"
         
-        # Get event details before deletion
-        try:
-            event = service.events().get(calendarId=CALENDAR_ID, eventId=event_id).execute()
-            event_title = event.get('summary', 'Unknown Event')
-        except HttpError:
-            event_title = 'Unknown Event'
-        
-        # Delete the event
-        service.events().delete(
-            calendarId=CALENDAR_ID,
+        # The title comes from the local copy of the calendar if it is loaded, which is never synced just for this
+        store = find_calendar_store(calendar_id, user_id)
+        event_title = describe_event(store, event_id)
+        
+        # Delete the event from the calendar it was listed from
+        await run_blocking('calendar', lambda: service.events().delete(
+            calendarId=calendar_id,
             eventId=event_id,
             sendUpdates='all'
-        ).execute()
+        ).execute())
+        
+        # Keep the local copy of the calendar current
+        if store:
+            store.remove(event_id)
         
         logging.info(f"Google Calendar event deleted: {event_title}")
-        return f"Event '{event_title}' deleted successfully from Google Calendar."
+        return f"Event {event_title} deleted successfully from Google Calendar."
         
     except HttpError as e:
         if e.resp.status == 404:
-            return f"Event with ID {event_id} not found in Google Calendar."
+            return "That event was not found in Google Calendar, it may have been deleted already."
         logging.error(f"Google Calendar API error: {e}")
         return f"Google Calendar API error: {str(e)}"
     except Exception as e:
@@ -504,10 +853,154 @@ async def delete_google_calendar_event(
         return f"An error occurred while deleting the Google Calendar event: {str(e)}"
 
 @function_tool()
+@instrumented
+async def create_google_calendar_events(
+    context: RunContext,  # type: ignore
+    events: List[NewEvent]
+) -> str:
+    """
+    Create several events in Google Calendar in one go, for requests like "add these five standups".
+    
+    Args:
+        events: The events, dates as YYYY-MM-DD, times as HH:MM and attendees as comma separated emails
+    """
+    try:
+        user_id = get_user_id(context)
+        service, error = await run_blocking('calendar', get_google_calendar_service, user_id, timeout=AUTH_TIMEOUT, upstream=False)
+        if error:
+            return f"Google Calendar authentication failed: {error}"
+        
+        # Events that cannot be parsed are reported without being sent
+        outcomes, to_create = {}, []
+        for i, new_event in enumerate(events, 1):
+            try:
+                event_datetime = local_datetime(new_event.date, new_event.time)
+            except ValueError:
+                outcomes[str(i)] = f"invalid date/time '{new_event.date} {new_event.time}', use YYYY-MM-DD and HH:MM"
+                continue
+            end_datetime = event_datetime + timedelta(minutes=new_event.duration_minutes)
+            to_create.append((str(i), new_event, event_datetime, end_datetime))
+        
+        def create_all() -> dict:
+            # Built on the pool thread so the batch uses that thread's connection
+            return execute_batch(service, [
+                (request_id, insert_event_request(
+                    service, new_event.title, event_datetime, end_datetime,
+                    new_event.description, new_event.location, new_event.attendees
+                ))
+                for request_id, new_event, event_datetime, end_datetime in to_create
+            ])
+        
+        results = await run_blocking('calendar', create_all) if to_create else {}
+        
+        store = find_calendar_store(CALENDAR_ID, user_id)
+        created = {}
+        for request_id, (event, exception) in results.items():
+            if exception is not None:
+                outcomes[request_id] = f"failed: {exception}"
+                continue
+            created[request_id] = event
+            # Keep the local copy of the calendar current
+            if store:
+                store.put(event)
+        
+        logging.info(f"Google Calendar batch create: {len(created)} of {len(events)} events created")
+        
+        # The created events keep their numbers, so they can be deleted by number
+        now = datetime.now(ZoneInfo(TIMEZONE))
+        rows, listed = [], []
+        for i, new_event in enumerate(events, 1):
+            if str(i) in created:
+                fields, item = event_row(created[str(i)], now)
+                rows.append([f"{new_event.title}: created"] + fields[1:])
+                listed.append(item)
+            else:
+                rows.append([f"{new_event.title}: {outcomes.get(str(i), 'no response')}", f"{new_event.date} {new_event.time}"])
+                listed.append(None)
+        remember_listed(context, listed)
+        header = f"Created {len(created)} of {len(events)} events in Google Calendar:"
+        return render_listing(header, rows, budget('create_google_calendar_events'))
+        
+    except HttpError as e:
+        logging.error(f"Google Calendar API error: {e}")
+        return f"Google Calendar API error: {str(e)}"
+    except Exception as e:
+        logging.error(f"Error creating Google Calendar events: {e}")
+        return f"An error occurred while creating the Google Calendar events: {str(e)}"
+
+@function_tool()
+@instrumented
+async def delete_google_calendar_events(
+    context: RunContext,  # type: ignore
+    event_ids: List[str]
+) -> str:
+    """
+    Delete several events from Google Calendar in one go, for requests like "clear my Friday".
+    
+    Args:
+        event_ids: The events' numbers in the last list of events, or their IDs
+    """
+    # Numbers that were not listed are reported, the rest are still deleted
+    # Each event is deleted from the calendar it was listed from
+    calendars, unknown = {}, []
+    for reference in event_ids:
+        try:
+            calendar_id, event_id = resolve_event(context, reference)
+            calendars.setdefault(event_id, calendar_id)
+        except LookupError as e:
+            unknown.append(f"\n{e}")
+    event_ids = list(calendars)
+    if not event_ids:
+        return "Deleted no events, list the events again to get their numbers:" + ''.join(unknown)
+    
+    try:
+        user_id = get_user_id(context)
+        service, error = await run_blocking('calendar', get_google_calendar_service, user_id, timeout=AUTH_TIMEOUT, upstream=False)
+        if error:
+            return f"Google Calendar authentication failed: {error}"
+        
+        # Titles come from the local copies of the calendars that are loaded, so the whole batch is one round trip
+        stores = {calendar_id: find_calendar_store(calendar_id, user_id) for calendar_id in set(calendars.values())}
+        titles = {event_id: describe_event(stores[calendars[event_id]], event_id) for event_id in event_ids}
+        results = await run_blocking('calendar', lambda: execute_batch(service, [
+            (event_id, service.events().delete(calendarId=calendars[event_id], eventId=event_id, sendUpdates='all'))
+            for event_id in event_ids
+        ]))
+        
+        deleted = 0
+        lines = []
+        for i, event_id in enumerate(event_ids, 1):
+            if event_id not in results:
+                lines.append(f"\n{i}. Event {titles[event_id]}: no response")
+                continue
+            _, exception = results[event_id]
+            if exception is None:
+                deleted += 1
+                if stores[calendars[event_id]]:
+                    stores[calendars[event_id]].remove(event_id)
+                lines.append(f"\n{i}. Event {titles[event_id]}: deleted")
+            elif isinstance(exception, HttpError) and exception.resp.status in (404, 410):
+                lines.append(f"\n{i}. Event {titles[event_id]}: not found")
+            else:
+                lines.append(f"\n{i}. Event {titles[event_id]}: failed: {exception}")
+        
+        logging.info(f"Google Calendar batch delete: {deleted} of {len(event_ids)} events deleted")
+        return f"Deleted {deleted} of {len(event_ids) + len(unknown)} events from Google Calendar:\n" + ''.join(lines + unknown)
+        
+    except HttpError as e:
+        logging.error(f"Google Calendar API error: {e}")
+        return f"Google Calendar API error: {str(e)}"
+    except Exception as e:
+        logging.error(f"Error deleting Google Calendar events: {e}")
+        return f"An error occurred while deleting the Google Calendar events: {str(e)}"
+
+@function_tool()
+@instrumented
 async def search_google_calendar_events(
     context: RunContext,  # type: ignore
     search_term: str,
-    max_results: int = 10
+    max_results: int = 10,
+    all_calendars: bool = False
 ) -> str:
     """
     Search for events in Google Calendar by title, description, or location.
@@ -515,50 +1008,26 @@ async def search_google_calendar_events(
     Args:
         search_term: Text to search for in events
         max_results: Maximum number of events to return (default: 10)
+        all_calendars: Search all selected calendars, not just the primary
     """
     try:
-        service, error = get_google_calendar_service()
-        if error:
-            return f"Google Calendar authentication failed: {error}"
-        
-        # Search in Google Calendar
-        events_result = service.events().list(
-            calendarId=CALENDAR_ID,
-            q=search_term,
-            maxResults=max_results,
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute()
+        service, stores = await open_calendars(get_user_id(context), all_calendars=all_calendars)
         
-        events = events_result.get('items', [])
+        # Search the local copies of the calendars first, then Google Calendar for older events
+        cursor = Cursor('event_search', {
+            'search_term': search_term,
+            'calendar_ids': [store.calendar_id for store in stores],
+        })
+        events = await read_listing(context, cursor, event_search_pages(cursor, max_results, service, stores), max_results)
         
         if not events:
             return f"No events found matching '{search_term}' in Google Calendar."
         
-        result = f"Events matching '{search_term}' in Google Calendar:\n"
-        
-        for event in events:
-            start = event['start'].get('dateTime', event['start'].get('date'))
-            
-            # Parse datetime
-            if 'T' in start:  # Has time
-                start_dt = datetime.fromisoformat(start.replace('Z', '+00:00'))
-                time_str = start_dt.strftime('%Y-%m-%d %H:%M')
-            else:  # All-day event
-                start_dt = datetime.fromisoformat(start)
-                time_str = start_dt.strftime('%Y-%m-%d') + " (All day)"
-            
-            result += f"\n• {event['summary']}\n"
-            result += f"  📅 {time_str}\n"
-            
-            if event.get('location'):
-                result += f"  📍 {event['location']}\n"
-            if event.get('description'):
-                result += f"  📝 {event['description']}\n"
-            result += f"  🔗 Event ID: {event['id']}\n"
-        
-        return result
+        header = f"Events matching '{search_term}':"
+        return render_items(context, 'search_google_calendar_events', header, events, event_row, more=not cursor.done)
         
+    except GoogleAuthError as e:
+        return f"Google Calendar authentication failed: {e}"
     except HttpError as e:
         logging.error(f"Google Calendar API error: {e}")
         return f"Google Calendar API error: {str(e)}"
@@ -567,6 +1036,7 @@ async def search_google_calendar_events(
         return f"An error occurred while searching Google Calendar events: {str(e)}"
 
 @function_tool()
+@instrumented
 async def list_google_calendars(
     context: RunContext  # type: ignore
 ) -> str:
@@ -574,29 +1044,18 @@ async def list_google_calendars(
     List all available Google Calendars for the authenticated user.
     """
     try:
-        service, error = get_google_calendar_service()
+        user_id = get_user_id(context)
+        service, error = await run_blocking('calendar', get_google_calendar_service, user_id, timeout=AUTH_TIMEOUT, upstream=False)
         if error:
             return f"Google Calendar authentication failed: {error}"
         
         # Get calendar list
-        calendar_list = service.calendarList().list().execute()
-        calendars = calendar_list.get('items', [])
+        calendars = await get_calendar_list(service, user_id)
         
         if not calendars:
             return "No calendars found."
         
-        result = "Available Google Calendars:\n"
-        
-        for calendar in calendars:
-            primary = " (Primary)" if calendar.get('primary', False) else ""
-            result += f"\n• {calendar['summary']}{primary}\n"
-            result += f"  📧 {calendar['id']}\n"
-            if calendar.get('description'):
-                result += f"  📝 {calendar['description']}\n"
-            if calendar.get('accessRole'):
-                result += f"  🔐 Access: {calendar['accessRole']}\n"
-        
-        return result
+        return render_items(context, 'list_google_calendars', "Your calendars:", calendars, calendar_row)
         
     except HttpError as e:
         logging.error(f"Google Calendar API error: {e}")
@@ -604,3 +1063,69 @@ async def list_google_calendars(
     except Exception as e:
         logging.error(f"Error listing Google Calendars: {e}")
         return f"An error occurred while listing Google Calendars: {str(e)}"
+
+@function_tool()
+@instrumented
+async def show_more_results(
+    context: RunContext,  # type: ignore
+    max_results: int = 10
+) -> str:
+    """
+    Continue the last email or calendar listing from where it stopped, for requests like "read me the next ten".
+    
+    Args:
+        max_results: How many more results to return (default: 10)
+    """
+    session = get_session_data(context)
+    cursor = session.cursor if session else None
+    if cursor is None:
+        return "There is no earlier list of emails or events to continue."
+    if cursor.done:
+        return "There are no more results."
+    
+    try:
+        if cursor.kind == 'messages':
+            fetch_page = message_pages(cursor, max_results, get_user_id(context))
+            row = message_row
+        else:
+            service, stores = await open_calendars(get_user_id(context), cursor.params['calendar_ids'])
+            if cursor.kind == 'events':
+                fetch_page = event_pages(cursor, max_results, service, stores)
+            else:
+                fetch_page = event_search_pages(cursor, max_results, service, stores)
+            row = event_row
+        
+        first = cursor.position + 1
+        items = await read_listing(context, cursor, fetch_page, max_results)
+        if not items:
+            return "There are no more results."
+        
+        # The numbers carry on from the earlier results, which can still be used
+        header = f"Results {first} to {first + len(items) - 1}:"
+        return render_items(context, 'show_more_results', header, items, row, first, more=not cursor.done)
+        
+    except GoogleAuthError as e:
+        return f"Google authentication failed: {e}"
+    except HttpError as e:
+        logging.error(f"Google API error continuing a listing: {e}")
+        return f"Google API error: {str(e)}"
+    except Exception as e:
+        logging.error(f"Error continuing a listing: {e}")
+        return f"An error occurred while getting more results: {str(e)}"
+
+@function_tool()
+@instrumented
+async def show_details(
+    context: RunContext,  # type: ignore
+    number: int
+) -> str:
+    """
+    Read everything about an email, event or calendar in the last list, such as its description or who is invited.
+    
+    Args:
+        number: The item's number in the last list
+    """
+    item = look_up(context, number)
+    if item is None:
+        return f"There is no number {number} in the last list."
+    return render_details(item, budget('show_details'))
@@ -0,0 +1,204 @@
+"""
+Camera video for the realtime model, sent only while the conversation needs it.
+
+Every frame the model is sent costs a JPEG encode here and input tokens on every
+later turn, and most sessions are voice only. AdaptiveVideo is the session's video
+sampler, it decides which frames go to the model:
+  - none while idle, or IDLE_FPS when that is set
+  - ACTIVE_FPS for BOOST_SECONDS after the user says something about the camera
+    ("look at this", "what am I holding")
+  - never a frame that looks the same as the last one sent
+While idle it also asks for the lowest simulcast layer of the user's camera, so
+there are fewer and smaller frames to decode, and for the full layer when active.
+The frames that are sent are scaled down to MAX_SIZE before they are encoded.
+
+Nothing here needs LiveKit until a session uses it, so it can be tested on its own.
+"""
+import logging
+import os
+import re
+import time
+from typing import Callable, Dict, Optional
+
+# adaptive sends frames only when they are needed, on sends them all the time, off turns the camera off
+VIDEO_INPUT = os.getenv("VIDEO_INPUT", "adaptive").lower()
+# Frames a second sent while nothing visual was mentioned, 0 to send none
+IDLE_FPS = float(os.getenv("VIDEO_IDLE_FPS", "0"))
+# Frames a second sent after something visual was mentioned, and for how long
+ACTIVE_FPS = float(os.getenv("VIDEO_ACTIVE_FPS", "1"))
+BOOST_SECONDS = float(os.getenv("VIDEO_BOOST_SECONDS", "20"))
+# Longest side of the frames the model gets. Up to 768 pixels a frame is a single image tile
+MAX_SIZE = int(os.getenv("VIDEO_MAX_SIZE", "768"))
+JPEG_QUALITY = int(os.getenv("VIDEO_JPEG_QUALITY", "75"))
+# Mean brightness difference, out of 255, under which a frame counts as the same as the last one sent
+SAME_FRAME_THRESHOLD = float(os.getenv("VIDEO_SAME_FRAME_THRESHOLD", "6"))
+
+# Things people say when they want the assistant to see something through their camera.
+# Only phrases about the camera, since "show me my calendar" or "see you then" are not
+VISUAL_CUES = re.compile(
+    r"\b(look(ing)? at (this|that|these|those|me)|can you see (this|that|these|those|me)|"
+    r"what am i (holding|wearing|pointing at|showing you)|i('m| am) (holding|showing you)|"
+    r"(on|through|in) (the|my) camera|in front of me|in my hands?|(this|that) (label|sign|object))\b",
+    re.IGNORECASE,
+)
+
+# Points sampled across and down a frame to compare it with the last one sent
+GRID = 16
+# Bytes per pixel of each frame format and which of them to sample. YUV formats start with their brightness plane
+_SAMPLE_LAYOUT = {
+    'I420': (1, 0), 'I420A': (1, 0), 'I422': (1, 0), 'I444': (1, 0), 'NV12': (1, 0), 'I010': (2, 1),
+    'RGBA': (4, 1), 'BGRA': (4, 1), 'ARGB': (4, 2), 'ABGR': (4, 2), 'RGB24': (3, 1),
+}
+_layouts: Dict[int, Optional[tuple]] = {}
+
+
+def _layout(frame_type: int) -> Optional[tuple]:
+    if frame_type not in _layouts:
+        from livekit import rtc
+        _layouts[frame_type] = _SAMPLE_LAYOUT.get(rtc.VideoBufferType.Name(frame_type))
+    return _layouts[frame_type]
+
+
+def fingerprint(data, width: int, height: int, layout: tuple) -> bytes:
+    """Sample a GRID x GRID grid of a frame's pixels, enough to tell whether the picture changed."""
+    pixel_bytes, offset = layout
+    data = memoryview(data).cast('B')
+    step = max(1, width // GRID) * pixel_bytes
+    samples = bytearray()
+    for row in range(GRID):
+        y = (2 * row + 1) * height // (2 * GRID)
+        start = (y * width + step // pixel_bytes // 2) * pixel_bytes + offset
+        samples += data[start:start + width * pixel_bytes:step][:GRID].tobytes()
+    return bytes(samples)
+
+
+def difference(a: bytes, b: bytes) -> float:
+    """Mean absolute difference of two fingerprints, from 0 for the same picture to 255."""
+    if len(a) != len(b) or not a:
+        return 255.0
+    return sum(abs(x - y) for x, y in zip(a, b)) / len(a)
+
+
+class AdaptiveVideo:
+    """A session's video sampler, called with every camera frame. Returns whether to send it to the model."""
+
+    def __init__(self, idle_fps: float = IDLE_FPS, active_fps: float = ACTIVE_FPS, boost_seconds: float = BOOST_SECONDS,
+                 threshold: float = SAME_FRAME_THRESHOLD, clock: Callable[[], float] = time.monotonic):
+        self.idle_fps = idle_fps
+        self.active_fps = active_fps
+        self.boost_seconds = boost_seconds
+        self.threshold = threshold
+        self.clock = clock
+        self.active_until = 0.0
+        self.publications = []   # the camera tracks whose simulcast layer follows the state
+        self._was_active = None
+        self._checked_at = None
+        self._sent_fingerprint = None
+        self._send_next = False
+        # What happened to the frames, for report()
+        self.started = clock()
+        self.received = 0
+        self.sent = 0
+        self.same = 0
+
+    @property
+    def active(self) -> bool:
+        return self.clock() < self.active_until
+
+    def boost(self, seconds: Optional[float] = None, reason: str = '') -> None:
+        """Send frames at ACTIVE_FPS for the next seconds, starting with the next frame."""
+        if not self.active:
+            self._send_next = True
+            logging.debug(f"Video on for {reason or 'a request'}")
+        self.active_until = max(self.active_until, self.clock() + (self.boost_seconds if seconds is None else seconds))
+        self._follow_state()
+
+    def notice(self, text: str) -> bool:
+        """Turn video on if text, something the user said, asks the assistant to look through the camera."""
+        if text and VISUAL_CUES.search(text):
+            self.boost(reason=f'"{text[:60]}"')
+            return True
+        return False
+
+    def __call__(self, frame, session=None) -> bool:
+        self.received += 1
+        self._follow_state()
+        fps = self.active_fps if self._was_active else self.idle_fps
+        if fps <= 0:
+            return False
+        now = self.clock()
+        if not self._send_next and self._checked_at is not None and now - self._checked_at < 1 / fps:
+            return False
+        self._checked_at = now
+
+        layout = _layout(frame.type)
+        current = fingerprint(frame.data, frame.width, frame.height, layout) if layout else None
+        if (not self._send_next and current is not None and self._sent_fingerprint is not None
+                and difference(current, self._sent_fingerprint) < self.threshold):
+            self.same += 1
+            return False
+        self._sent_fingerprint = current
+        self._send_next = False
+        self.sent += 1
+        return True
+
+    # Simulcast layers
+
+    def watch(self, room) -> None:
+        """Follow the video tracks subscribed to in room, asking for their lowest layer while idle."""
+        for participant in room.remote_participants.values():
+            for publication in participant.track_publications.values():
+                if publication.track is not None:
+                    self._add_publication(publication)
+        room.on("track_subscribed", lambda track, publication, participant: self._add_publication(publication))
+
+    def _add_publication(self, publication) -> None:
+        from livekit import rtc
+        if publication.kind != rtc.TrackKind.KIND_VIDEO or publication in self.publications:
+            return
+        self.publications.append(publication)
+        self._set_quality(publication, self.active)
+
+    def _follow_state(self) -> None:
+        active = self.active
+        if active == self._was_active:
+            return
+        self._was_active = active
+        for publication in self.publications:
+            self._set_quality(publication, active)
+
+    @staticmethod
+    def _set_quality(publication, active: bool) -> None:
+        from livekit import rtc
+        try:
+            publication.set_video_quality(rtc.VideoQuality.VIDEO_QUALITY_HIGH if active else rtc.VideoQuality.VIDEO_QUALITY_LOW)
+        except (AttributeError, ValueError):
+            # Older LiveKit, or a track published without simulcast, only has the one layer
+            pass
+
+    def report(self) -> dict:
+        """Frames received and sent to the model, in total and per minute of the session."""
+        minutes = max((self.clock() - self.started) / 60, 1 / 60)
+        return {
+            'minutes': round(minutes, 2),
+            'received': self.received,
+            'sent': self.sent,
+            'same_skipped': self.same,
+            'sent_per_minute': round(self.sent / minutes, 2),
+        }
+
+
+def make_video_sampler() -> Optional[AdaptiveVideo]:
+    """The sampler for a new session, or None when VIDEO_INPUT is on or off and LiveKit's own sampling is used."""
+    return AdaptiveVideo() if VIDEO_INPUT == 'adaptive' else None
+
+
+def encode_options():
+    """How frames are scaled and encoded before they are sent to the realtime model."""
+    from livekit.agents.utils import images
+    return images.EncodeOptions(
+        format="JPEG",
+        quality=JPEG_QUALITY,
+        resize_options=images.ResizeOptions(width=MAX_SIZE, height=MAX_SIZE, strategy="scale_aspect_fit"),
+    )
+
@@ -0,0 +1,98 @@
+import logging
+import os
+from typing import Set
+
+import httpx
+from livekit.agents import function_tool, RunContext
+
+import http_client
+from executor import run_blocking
+from instrumentation import instrumented
+from result_cache import get_cache, normalize_key
+from session_data import SessionData, get_session_data
+
+# Weather service, can be pointed at a local stub for benchmarking
+WEATHER_URL = os.getenv("WEATHER_URL", "https://wttr.in")
+
+TOOL_GROUP = 'web'
+
+# Heavy modules the tools import on first use, loaded early by tool_registry.prewarm()
+PREWARM_MODULES = [
+    'langchain_community.tools',
+]
+
+_search_tool = None
+
+async def current_weather(city: str) -> str:
+    """Get a one line weather report for city, cached for a few minutes."""
+    async def fetch_weather():
+        response = await http_client.get(f"{WEATHER_URL}/{city}", params={'format': '3'})
+        response.raise_for_status()
+        return response.text.strip()
+    
+    return await get_cache('weather').get_or_fetch(normalize_key(city), fetch_weather)
+
+async def prefetch(session: SessionData, groups: Set[str]) -> None:
+    """Fetch the weather for the user's home city while the greeting plays."""
+    if 'web' in groups and session.home_city:
+        await current_weather(session.home_city)
+
+@function_tool()
+@instrumented
+async def get_weather(
+    context: RunContext, 
+    city: str = "") -> str:
+    """
+    Get the current weather for a given city.
+
+    Args:
+        city: City to get the weather for, the user's home city if empty
+    """
+    if not city:
+        session = get_session_data(context)
+        city = session.home_city if session else None
+        if not city:
+            return "Which city would you like the weather for?"
+    
+    try:
+        weather = await current_weather(city)
+        logging.info(f"Weather for {city}: {weather}")
+        return weather
+    except httpx.HTTPStatusError as e:
+        logging.error(f"Failed to get weather for {city}: {e.response.status_code}")
+        return f"Could not retrieve weather for {city}."
+    except Exception as e:
+        logging.error(f"Error retrieving weather for {city}: {e}")
+        return f"An error occurred while retrieving weather for {city}." 
+
+def get_search_tool():
+    """Get the shared DuckDuckGo search tool, importing and creating it the first time."""
+    global _search_tool
+    if _search_tool is None:
+        from langchain_community.tools import DuckDuckGoSearchRun
+        _search_tool = DuckDuckGoSearchRun()
+    return _search_tool
+
+async def web_search(query: str) -> str:
+    """Get the web search results for query as text, cached for a few minutes."""
+    async def fetch_results():
+        # The first call imports and creates the search tool, so that happens on the thread too
+        return await run_blocking('search', lambda: get_search_tool().run(tool_input=query))
+    
+    return await get_cache('search').get_or_fetch(normalize_key(query), fetch_results)
+
+@function_tool()
+@instrumented
+async def search_web(
+    context: RunContext,
+    query: str) -> str:
+    """
+    Search the web for current information.
+    """
+    try:
+        results = await web_search(query)
+        logging.info(f"Search for '{query}' returned {len(results)} characters")
+        return results
+    except Exception as e:
+        logging.error(f"Error searching the web for '{query}': {e}")
+        return f"An error occurred while searching the web for '{query}'."
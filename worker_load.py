@@ -0,0 +1,133 @@
+"""
+How busy a worker is, so LiveKit stops sending it rooms before it runs out of room to serve them.
+
+LiveKit asks the worker for its load every few seconds and only assigns new jobs
+while it is under LOAD_THRESHOLD. compute_load reports the highest of:
+  - the jobs running, where MAX_JOBS jobs reach the threshold
+  - the CPU use of the host
+  - the tool calls in flight across the worker's job processes, out of MAX_TOOL_CALLS
+
+Each job runs in its own process, so a job reports its tool calls in flight by
+writing them to a file named after its process in LOAD_DIR, and compute_load adds
+up the files that are fresh and removes the stale ones. Job processes stay in the
+process group of the worker that started them, so LOAD_DIR is named after that
+group and every worker started on its own has its own. Set LOAD_DIR to separate
+workers that share a process group.
+"""
+import asyncio
+import contextlib
+import os
+import tempfile
+import time
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from instrumentation import calls_in_flight
+
+# Jobs one worker process runs at once. Find the right number for a host with benchmarks/load_test.py
+MAX_JOBS = int(os.getenv("MAX_JOBS", str(os.cpu_count() or 1)))
+# Load at which LiveKit stops sending the worker new jobs
+LOAD_THRESHOLD = float(os.getenv("LOAD_THRESHOLD", "0.75"))
+# Tool calls in flight across all jobs at which the worker counts as fully loaded
+MAX_TOOL_CALLS = int(os.getenv("MAX_TOOL_CALLS", str(MAX_JOBS * 4)))
+# Processes started ahead of jobs so a new room does not wait for one to prewarm, LiveKit's default if not set
+NUM_IDLE_PROCESSES = os.getenv("NUM_IDLE_PROCESSES")
+# Seconds a new process gets to prewarm, which imports the default groups' tool modules and the libraries they use
+PREWARM_TIMEOUT = float(os.getenv("PREWARM_TIMEOUT", "30"))
+
+LOAD_DIR = os.getenv("LOAD_DIR") or os.path.join(
+    tempfile.gettempdir(), f"quanta_load_{os.getpgrp() if hasattr(os, 'getpgrp') else os.getpid()}")
+REPORT_INTERVAL = 1.0
+# A report older than this is from a job process that died without removing it
+STALE_AFTER = 10.0
+
+
+def worker_options() -> dict:
+    """Keyword arguments for agents.WorkerOptions that size the worker from the settings above."""
+    options = {'load_fnc': compute_load, 'load_threshold': LOAD_THRESHOLD, 'initialize_process_timeout': PREWARM_TIMEOUT}
+    if NUM_IDLE_PROCESSES:
+        options['num_idle_processes'] = int(NUM_IDLE_PROCESSES)
+    return options
+
+
+def _report_path() -> str:
+    return os.path.join(LOAD_DIR, str(os.getpid()))
+
+
+def write_report() -> None:
+    """Write this process's tool calls in flight where the worker reads them."""
+    os.makedirs(LOAD_DIR, exist_ok=True)
+    with open(_report_path(), 'w', encoding='utf-8') as f:
+        f.write(str(calls_in_flight()))
+
+
+def clear_report() -> None:
+    """Remove this process's report, when its job ends."""
+    with contextlib.suppress(OSError):
+        os.remove(_report_path())
+
+
+async def report_tool_calls(interval: float = REPORT_INTERVAL) -> None:
+    """Keep this job's report fresh until the job ends."""
+    while True:
+        try:
+            write_report()
+        except OSError:
+            pass
+        await asyncio.sleep(interval)
+
+
+def tool_calls_in_flight() -> int:
+    """
+    Tool calls in flight in this process and in the job processes that reported in the last STALE_AFTER seconds.
+
+    Older reports are from job processes that died without removing theirs, and are removed.
+    """
+    total = calls_in_flight()
+    try:
+        names = os.listdir(LOAD_DIR)
+    except OSError:
+        return total
+    now = time.time()
+    for name in names:
+        if not name.isdigit() or int(name) == os.getpid():
+            continue
+        path = os.path.join(LOAD_DIR, name)
+        try:
+            if now - os.path.getmtime(path) > STALE_AFTER:
+                os.remove(path)
+                continue
+            with open(path, encoding='utf-8') as f:
+                total += int(f.read())
+        except (OSError, ValueError):
+            continue
+    return total
+
+
+def cpu_load() -> float:
+    """CPU use of the host from 0 to 1, since the last time it was asked."""
+    if psutil is not None:
+        return psutil.cpu_percent(interval=None) / 100
+    if hasattr(os, 'getloadavg'):
+        return min(1.0, os.getloadavg()[0] / (os.cpu_count() or 1))
+    return 0.0
+
+
+def load(active_jobs: int) -> float:
+    """
+    The load from 0 to 1 of a worker running active_jobs jobs.
+
+    The jobs are scaled so that MAX_JOBS of them reach LOAD_THRESHOLD, which makes
+    MAX_JOBS the most a worker takes.
+    """
+    jobs = active_jobs / MAX_JOBS * LOAD_THRESHOLD
+    tool_calls = tool_calls_in_flight() / MAX_TOOL_CALLS
+    return min(1.0, max(jobs, cpu_load(), tool_calls))
+
+
+def compute_load(worker) -> float:
+    """The worker's load, for WorkerOptions.load_fnc."""
+    return load(len(worker.active_jobs))